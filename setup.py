@@ -21,6 +21,7 @@ setup(
     license="MIT",
     long_description=LONG_DESCRIPTION,
     keywords="virtualenv virtualenvwrapper workon installation deployment",
+    python_requires='>=3.7',
     install_requires=['virtualenv'],
     packages=['vex'],
     package_data={'vex': ['shell_configs/*', 'functional_tests/not_python']},
@@ -40,10 +41,14 @@ setup(
         "Operating System :: POSIX",
         "Operating System :: POSIX :: Linux",
         "Operating System :: Microsoft :: Windows",
-        "Programming Language :: Python :: 3.4",
-        "Programming Language :: Python :: 3.3",
-        "Programming Language :: Python :: 3.2",
-        "Programming Language :: Python :: 2.7",
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
+        "Programming Language :: Python :: 3.12",
         "Programming Language :: Python :: Implementation :: PyPy",
     ]
 )
@@ -0,0 +1,157 @@
+"""Start commands in virtualenvs from asyncio code.
+
+An AsyncVex finds virtualenvs and makes their environments as vex.api.Vex
+does, but starts commands with asyncio.create_subprocess_exec, so one
+event loop can supervise any number of them without a thread each::
+
+    avex = AsyncVex(limit=100)
+    returncode = await avex.run("foo", ["python", "job.py"],
+                                on_stdout=print)
+
+Finding a virtualenv and its executables reads the disk the first time,
+briefly blocking the loop; after that it is answered from memory.
+"""
+import asyncio
+import inspect
+from vex import exceptions
+from vex.api import Vex
+from vex.limits import DEFAULT_KILL_AFTER
+
+# Longest line given to an output callback; longer ones come in pieces.
+DEFAULT_LINE_LIMIT = 1024 * 1024
+
+
+async def _pump(stream, callback):
+    """Give callback each line read from stream, until it ends.
+    """
+    while True:
+        try:
+            line = await stream.readuntil(b"\n")
+        except asyncio.IncompleteReadError as error:
+            if error.partial:
+                await _call(callback, error.partial)
+            return
+        except asyncio.LimitOverrunError as error:
+            line = await stream.read(error.consumed)
+        await _call(callback, line)
+
+
+async def _call(callback, line):
+    result = callback(line)
+    if inspect.isawaitable(result):
+        await result
+
+
+async def stop(process, kill_after=DEFAULT_KILL_AFTER):
+    """Terminate process, kill it if it is still running kill_after
+    seconds later, and return its exit status once it has gone.
+    """
+    if process.returncode is None:
+        try:
+            process.terminate()
+        except ProcessLookupError:
+            pass
+        try:
+            await asyncio.wait_for(process.wait(), kill_after)
+        except asyncio.TimeoutError:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+    return process.returncode
+
+
+class AsyncVex(object):
+    """Run commands in virtualenvs from an asyncio event loop.
+
+    :param vex: the vex.api.Vex to find virtualenvs with; by default,
+        a new one reading ~/.vexrc.
+    :param limit: how many commands run may have running at once;
+        the rest wait their turn. None means no limit.
+    :param line_limit: longest line given to an output callback.
+    """
+    def __init__(self, vex=None, limit=None, line_limit=DEFAULT_LINE_LIMIT):
+        self.vex = vex if vex is not None else Vex()
+        self.limit = limit
+        self.line_limit = line_limit
+        # Made on first use, so it belongs to the loop that uses it.
+        self._semaphore = None
+
+    async def spawn(self, name, command, cwd=None, env=None, stdin=None,
+                    stdout=None, stderr=None, limits=None):
+        """Start command in virtualenv name, without waiting for it.
+
+        Arguments are as for vex.api.Vex.spawn, except that limits'
+        timeout is not enforced; run does that.
+
+        :returns:
+            an asyncio.subprocess.Process.
+        """
+        ve_path, full_env, exe = self.vex.prepare(name, command, cwd, env)
+        if limits is not None:
+            limits.check(from_parent=True)
+        # Limits are applied from here, as vex.api.Vex.spawn does.
+        process = await asyncio.create_subprocess_exec(
+            *command, executable=exe, env=full_env, cwd=cwd, stdin=stdin,
+            stdout=stdout, stderr=stderr, limit=self.line_limit)
+        if limits is not None and limits.restricts():
+            try:
+                limits.apply_to(process.pid)
+            except OSError as error:
+                process.kill()
+                await process.wait()
+                raise exceptions.BadConfig(
+                    "can't apply limits to {0!r}: {1}".format(
+                        command[0], limits.explain_failure(error)))
+        self.vex.started(ve_path)
+        return process
+
+    async def run(self, name, command, cwd=None, env=None, stdin=None,
+                  on_stdout=None, on_stderr=None, limits=None):
+        """Run command in virtualenv name, and return its exit status.
+
+        on_stdout and on_stderr, if given, are called with each line of
+        output as bytes, and may be coroutine functions; output without
+        one goes where this process's does. A command still running
+        after limits.timeout seconds is stopped, and its (negative) exit
+        status returned. If run is cancelled, the command is stopped
+        before the cancellation goes on.
+        """
+        if self.limit is None:
+            return await self._run(
+                name, command, cwd, env, stdin, on_stdout, on_stderr, limits)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        async with self._semaphore:
+            return await self._run(
+                name, command, cwd, env, stdin, on_stdout, on_stderr, limits)
+
+    async def _run(self, name, command, cwd, env, stdin,
+                   on_stdout, on_stderr, limits):
+        pipe = asyncio.subprocess.PIPE
+        process = await self.spawn(
+            name, command, cwd=cwd, env=env, stdin=stdin,
+            stdout=pipe if on_stdout else None,
+            stderr=pipe if on_stderr else None, limits=limits)
+        timeout = limits.timeout if limits is not None else None
+        kill_after = (limits.kill_after if limits is not None
+                      else DEFAULT_KILL_AFTER)
+        readers = [
+            asyncio.ensure_future(_pump(stream, callback))
+            for stream, callback in ((process.stdout, on_stdout),
+                                     (process.stderr, on_stderr))
+            if callback]
+        try:
+            try:
+                await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                await stop(process, kill_after)
+            await asyncio.gather(*readers)
+        except BaseException:
+            for reader in readers:
+                reader.cancel()
+            # Shielded, so cancelling again can't leave the command running.
+            await asyncio.shield(stop(process, kill_after))
+            raise
+        return process.returncode
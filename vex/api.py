@@ -0,0 +1,296 @@
+"""Use vex from Python: find virtualenvs and start commands in them.
+
+A Vex reads the config and indexes the virtualenvs once, then serves
+any number of calls, from any number of threads, without starting a
+vex process for each command::
+
+    vex = Vex()
+    process = vex.spawn("foo", ["python", "job.py"])
+    returncode = process.wait()
+    print(process.rusage.ru_maxrss)
+
+Project .vexrc files above the working directory are not read, since a
+long-running process has no one working directory to look above.
+"""
+import os
+import time
+import signal
+import threading
+import subprocess
+from vex import config
+from vex import exceptions
+from vex.cache import open_cache
+from vex.index import VirtualenvIndex, get_virtualenv_path, name_for_path
+from vex.lastused import record_use
+from vex.run import get_environ, returncode_from_status, Watchdog
+from vex.which import ExecutableCache
+
+# Longest pause between checks while waiting for a process with a timeout.
+_MAX_POLL_INTERVAL = 0.05
+
+
+class Process(object):
+    """A command started by Vex.spawn.
+
+    pid, args and ve_path say what was started, and stdin, stdout and
+    stderr are pipes to it if they were asked for, as with Popen.
+    Once it has finished, returncode is its exit status (negative for
+    a signal), elapsed how many seconds it ran, and rusage what it
+    used, as from os.wait4, or None where that isn't available.
+    """
+    def __init__(self, popen, ve_path, started, watchdog=None):
+        self.popen = popen
+        self.pid = popen.pid
+        self.args = popen.args
+        self.ve_path = ve_path
+        self.stdin = popen.stdin
+        self.stdout = popen.stdout
+        self.stderr = popen.stderr
+        self.started = started
+        self.returncode = None
+        self.elapsed = None
+        self.rusage = None
+        self._watchdog = watchdog
+        self._lock = threading.Lock()
+
+    def _reap(self, block):
+        """Collect the exit status if the process has finished.
+
+        :returns:
+            True if it has.
+        """
+        if hasattr(os, "wait4"):
+            pid, status, rusage = os.wait4(
+                self.pid, 0 if block else os.WNOHANG)
+            if pid == 0:
+                return False
+            self.rusage = rusage
+            self.returncode = returncode_from_status(status)
+            # Tell the Popen object, so it won't try to reap it again.
+            self.popen.returncode = self.returncode
+        else:
+            self.returncode = (
+                self.popen.wait() if block else self.popen.poll())
+            if self.returncode is None:
+                return False
+        self.elapsed = time.time() - self.started
+        if self._watchdog is not None:
+            self._watchdog.stop()
+        return True
+
+    def poll(self):
+        """Return the exit status if the process has finished, else None.
+        """
+        if self.returncode is None and self._lock.acquire(False):
+            try:
+                if self.returncode is None:
+                    self._reap(block=False)
+            finally:
+                self._lock.release()
+        return self.returncode
+
+    def wait(self, timeout=None):
+        """Wait for the process to finish, and return its exit status.
+
+        Raises subprocess.TimeoutExpired if it is still running after
+        timeout seconds.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        if not self._lock.acquire(True, -1 if timeout is None else timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        try:
+            interval = 0.001
+            while self.returncode is None:
+                if deadline is None:
+                    self._reap(block=True)
+                    break
+                if self._reap(block=False):
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(self.args, timeout)
+                time.sleep(min(interval, remaining))
+                interval = min(interval * 2, _MAX_POLL_INTERVAL)
+        finally:
+            self._lock.release()
+        return self.returncode
+
+    def send_signal(self, signum):
+        """Signal the process, unless it has already been reaped.
+        """
+        if self.returncode is None:
+            os.kill(self.pid, signum)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(getattr(signal, "SIGKILL", signal.SIGTERM))
+
+
+class Vex(object):
+    """Find virtualenvs and run commands in them, as the vex command does.
+
+    :param config_path: the vexrc to read, by default ~/.vexrc.
+    :param environ: the environment to start commands' environments
+        from, by default os.environ as it is now.
+
+    The vexrc, the index of virtualenvs and where executables were found
+    are read once and kept; call reload to see changes to the vexrc.
+    All methods may be called from any thread.
+    """
+    def __init__(self, config_path=None, environ=None):
+        self.config_path = config_path
+        self.base_environ = dict(os.environ if environ is None else environ)
+        self._lock = threading.RLock()
+        self._vexrc = None
+        self._index = None
+        self._executables = None
+
+    def reload(self):
+        """Forget what has been read, so it is read again when needed.
+        """
+        with self._lock:
+            self._vexrc = None
+            self._index = None
+            self._executables = None
+
+    @property
+    def vexrc(self):
+        with self._lock:
+            if self._vexrc is None:
+                path = self.config_path
+                if path and not os.path.exists(path):
+                    raise exceptions.InvalidVexrc(
+                        "nonexistent config: {0!r}".format(path))
+                self._vexrc = config.Vexrc.from_file(
+                    path or os.path.expanduser("~/.vexrc"), self.base_environ)
+            return self._vexrc
+
+    @property
+    def ve_bases(self):
+        return self.vexrc.get_ve_bases(self.base_environ)
+
+    def _cache(self, name):
+        return open_cache(self.vexrc.get_cache_dir(self.base_environ), name)
+
+    @property
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = VirtualenvIndex(
+                    self.ve_bases, self._cache("index"))
+            return self._index
+
+    def resolve(self, name, inexact=False):
+        """Return the path of the virtualenv called name.
+
+        An absolute path to a directory is returned as it is. With
+        inexact, name may also be an unambiguous prefix or abbreviation.
+        Raises InvalidVirtualenv (or another InvalidArgument) if there
+        is no such virtualenv.
+        """
+        if os.path.isabs(name):
+            if not os.path.isdir(name):
+                raise exceptions.InvalidVirtualenv(
+                    "no virtualenv found at {0!r}.".format(name))
+            return name
+        with self._lock:
+            return get_virtualenv_path(
+                self.ve_bases, name, self.index, inexact=inexact)
+
+    def _environ_for(self, ve_path, overrides=None):
+        """Make the environment to run a command in ve_path with.
+
+        overrides are set on top of the vexrc's settings.
+        """
+        with self._lock:
+            ve_bases = self.ve_bases
+            defaults = self.vexrc.get_env(name_for_path(ve_bases, ve_path))
+        env = get_environ(self.base_environ, defaults, ve_path)
+        if overrides:
+            env.update(overrides)
+        return env
+
+    def environ(self, name, overrides=None):
+        """Make the environment to run a command in virtualenv name with.
+        """
+        return self._environ_for(self.resolve(name), overrides)
+
+    def _find(self, command, env):
+        with self._lock:
+            if self._executables is None:
+                self._executables = ExecutableCache(
+                    self._cache("executables"))
+            return self._executables.find(command, env.get("PATH"))
+
+    def prepare(self, name, command, cwd=None, env=None):
+        """Work out everything needed to start command in virtualenv name.
+
+        Raises InvalidCommand if command isn't found on the virtualenv's
+        PATH, or InvalidCwd if cwd isn't a directory.
+
+        :returns:
+            (virtualenv path, environment, executable), where executable
+            is None if command[0] is already a path.
+        """
+        ve_path = self.resolve(name)
+        full_env = self._environ_for(ve_path, env)
+        exe = None
+        if not os.path.dirname(command[0]):
+            exe = self._find(command[0], full_env)
+            if not exe:
+                raise exceptions.InvalidCommand(
+                    "command not found: {0!r}".format(command[0]))
+        if cwd and not os.path.isdir(cwd):
+            raise exceptions.InvalidCwd(
+                "can't use invalid path {0!r} as cwd".format(cwd))
+        return ve_path, full_env, exe
+
+    def started(self, ve_path):
+        """Call once a command is started in ve_path: records the use for
+        --last-used, and saves where its executable was found.
+        """
+        with self._lock:
+            ve_bases = self.ve_bases
+            if self._executables is not None:
+                self._executables.save()
+        record_use(ve_bases, ve_path)
+
+    def spawn(self, name, command, cwd=None, env=None, stdin=None,
+              stdout=None, stderr=None, limits=None):
+        """Start command in virtualenv name, without waiting for it.
+
+        env holds extra environment variables. stdin, stdout and stderr
+        are as for subprocess.Popen. limits is an optional
+        vex.limits.Limits, applied to the command as soon as it has
+        started; its timeout is enforced from a timer thread.
+
+        :returns:
+            a Process.
+        """
+        ve_path, full_env, exe = self.prepare(name, command, cwd, env)
+        if limits is not None:
+            limits.check(from_parent=True)
+        started = time.time()
+        # No preexec_fn, which isn't safe with other threads running;
+        # limits are applied from here once the command has started.
+        popen = subprocess.Popen(
+            list(command), executable=exe, env=full_env, cwd=cwd,
+            stdin=stdin, stdout=stdout, stderr=stderr)
+        if limits is not None and limits.restricts():
+            try:
+                limits.apply_to(popen.pid)
+            except OSError as error:
+                # Leaving the with kills it, then closes pipes and reaps it.
+                with popen:
+                    popen.kill()
+                raise exceptions.BadConfig(
+                    "can't apply limits to {0!r}: {1}".format(
+                        command[0], limits.explain_failure(error)))
+        watchdog = None
+        if limits is not None and limits.timeout is not None:
+            watchdog = Watchdog(popen, limits.timeout, limits.kill_after)
+            watchdog.start()
+        self.started(ve_path)
+        return Process(popen, ve_path, started, watchdog)
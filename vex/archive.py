@@ -0,0 +1,233 @@
+"""Export virtualenvs as tar archives, and import them somewhere else.
+
+Both directions stream, handling one file at a time, so memory use
+doesn't grow with the size of the virtualenv and an archive can be
+piped through ssh or kept in an artifact cache.
+"""
+import os
+import sys
+import time
+import shutil
+import tarfile
+import tempfile
+from vex import exceptions
+from vex.cache import get_umask
+from vex.relocate import check_destination, retarget_link, rewrite_paths
+from vex.store import PACKAGES_RECORD
+
+# Global pax header recording where the virtualenv was exported from.
+PATH_HEADER = "VEX.path"
+
+# Where extraction filters exist, use the one that still allows the
+# absolute symlinks a virtualenv has to its base interpreter.
+if hasattr(tarfile, "tar_filter"):
+    _EXTRACT_ARGS = {"filter": "tar"}
+else:
+    _EXTRACT_ARGS = {}
+
+
+def _binary(stream):
+    return getattr(stream, "buffer", stream)
+
+
+def _walk_members(ve_path):
+    """Yield (path, name in the archive) for everything in ve_path,
+    parents before their contents.
+    """
+    for directory, dirs, files in os.walk(ve_path):
+        dirs.sort()
+        relative = os.path.relpath(directory, ve_path)
+        for name in dirs + sorted(files):
+            if relative == os.curdir:
+                if name == PACKAGES_RECORD:
+                    # Its files are in the archive, not in a store.
+                    continue
+                arcname = name
+            else:
+                arcname = os.path.join(relative, name)
+            yield os.path.join(directory, name), arcname
+
+
+def export_virtualenv(ve_path, fileobj, compression=None):
+    """Write the virtualenv at ve_path to fileobj as a tar archive.
+
+    Files hardlinked together in the virtualenv are stored once.
+
+    :returns:
+        the number of members written.
+    """
+    ve_path = os.path.abspath(ve_path)
+    count = 0
+    with tarfile.open(
+            fileobj=fileobj, mode="w|" + (compression or ""),
+            format=tarfile.PAX_FORMAT,
+            pax_headers={PATH_HEADER: ve_path}) as tar:
+        for path, arcname in _walk_members(ve_path):
+            info = tar.gettarinfo(path, arcname)
+            if info.isreg():
+                with open(path, "rb") as inp:
+                    tar.addfile(info, inp)
+            else:
+                tar.addfile(info)
+            # tarfile remembers every member; don't let that grow.
+            tar.members = []
+            count += 1
+    return count
+
+
+def _check_member(member):
+    """Refuse members which could write outside the destination.
+    """
+    names = [member.name]
+    if member.islnk():
+        names.append(member.linkname)
+    for name in names:
+        parts = name.replace("\\", "/").split("/")
+        if name.startswith(("/", "\\")) or os.pardir in parts:
+            raise exceptions.InvalidArchive(
+                "unsafe path in archive: {0!r}".format(name))
+    if member.ischr() or member.isblk():
+        raise exceptions.InvalidArchive(
+            "device file in archive: {0!r}".format(member.name))
+
+
+def _check_symlink(member):
+    """Refuse symlinks which lead out of the destination.
+
+    A virtualenv's links to its base interpreter are absolute, so
+    absolute targets are only refused if they are directories, which
+    later members could be written into.
+    """
+    target = member.linkname
+    if os.path.isabs(target):
+        if os.path.isdir(target):
+            raise exceptions.InvalidArchive(
+                "symlink to a directory outside the archive: {0!r}".format(
+                    member.name))
+        return
+    joined = os.path.normpath(
+        os.path.join(os.path.dirname(member.name), target))
+    if joined == os.pardir or joined.startswith(os.pardir + os.sep):
+        raise exceptions.InvalidArchive(
+            "symlink out of the archive: {0!r}".format(member.name))
+
+
+def _check_parents(name, root, checked):
+    """Refuse a member name which leads through a symlink already
+    unpacked under root, whether at its own path or one of its parents.
+
+    checked is a set of directories already known not to be symlinks.
+    """
+    parts = name.replace("\\", "/").split("/")
+    path = root
+    for part in parts:
+        if not part or part == os.curdir:
+            continue
+        path = os.path.join(path, part)
+        if path in checked:
+            continue
+        if os.path.islink(path):
+            raise exceptions.InvalidArchive(
+                "path through a symlink in archive: {0!r}".format(name))
+        if os.path.isdir(path):
+            checked.add(path)
+
+
+def import_virtualenv(fileobj, destination, jobs=None):
+    """Make a virtualenv at destination from an archive read from fileobj.
+
+    It is unpacked beside destination under a hidden name, has its
+    paths rewritten, and is only then renamed into place.
+
+    :returns:
+        (number of members, number of files rewritten).
+    """
+    destination = os.path.abspath(destination)
+    check_destination(destination)
+    temp = tempfile.mkdtemp(
+        dir=os.path.dirname(destination), prefix=".vex-import-")
+    try:
+        count = 0
+        old = None
+        checked = set()
+        try:
+            with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+                while True:
+                    member = tar.next()
+                    if member is None:
+                        break
+                    old = tar.pax_headers.get(PATH_HEADER)
+                    _check_member(member)
+                    _check_parents(member.name, temp, checked)
+                    if member.islnk():
+                        _check_parents(member.linkname, temp, checked)
+                    if member.issym():
+                        if old:
+                            member.linkname = retarget_link(
+                                member.linkname, old, destination)
+                        _check_symlink(member)
+                    tar.extract(member, temp, **_EXTRACT_ARGS)
+                    tar.members = []
+                    count += 1
+        except tarfile.TarError as error:
+            raise exceptions.InvalidArchive(
+                "could not read archive: {0}".format(error))
+        rewritten = 0
+        if old:
+            rewritten = rewrite_paths(temp, old, jobs, location=destination)
+        # mkdtemp made it private; give it the mode mkdir would have.
+        os.chmod(temp, 0o777 & ~get_umask())
+        os.rename(temp, destination)
+    except BaseException:
+        shutil.rmtree(temp, ignore_errors=True)
+        raise
+    return count, rewritten
+
+
+def handle_export(ve_path, output=None, compression=None):
+    """Export the virtualenv at ve_path to output, or stdout.
+    """
+    started = time.time()
+    if output is None:
+        if sys.stdout.isatty():
+            raise exceptions.InvalidArgument(
+                "not writing an archive to a terminal; "
+                "use --output or redirect stdout")
+        count = export_virtualenv(ve_path, _binary(sys.stdout), compression)
+        sys.stdout.flush()
+    else:
+        # Written under another name first, so output is never partial.
+        temp_path = output + ".vex-tmp"
+        try:
+            with open(temp_path, "wb") as out:
+                count = export_virtualenv(ve_path, out, compression)
+            os.replace(temp_path, output)
+        except BaseException:
+            if os.path.lexists(temp_path):
+                os.unlink(temp_path)
+            raise
+    sys.stderr.write("exported {0!r}, {1} entries, in {2:.2f}s\n".format(
+        ve_path, count, time.time() - started))
+    return 0
+
+
+def handle_import(archive, destination, jobs=None):
+    """Import the archive at path archive, or stdin if it is "-".
+    """
+    started = time.time()
+    if archive == "-":
+        count, rewritten = import_virtualenv(
+            _binary(sys.stdin), destination, jobs)
+    else:
+        try:
+            inp = open(archive, "rb")
+        except (IOError, OSError):
+            raise exceptions.InvalidArchive(
+                "can't read archive {0!r}".format(archive))
+        with inp:
+            count, rewritten = import_virtualenv(inp, destination, jobs)
+    sys.stderr.write(
+        "imported {0!r}, {1} entries, rewrote {2} files, "
+        "in {3:.2f}s\n".format(
+            destination, count, rewritten, time.time() - started))
+    return 0
@@ -0,0 +1,209 @@
+"""Run many commands in one virtualenv, for the price of one vex.
+
+The virtualenv is found, the vexrc read and the environment made once;
+each command read after that only costs starting it.
+"""
+import sys
+import json
+import time
+import shlex
+import threading
+import subprocess
+from concurrent.futures import (
+    Future, ThreadPoolExecutor, wait, FIRST_COMPLETED)
+from vex import exceptions
+from vex.run import SignalForwarder, run, wants_own_group
+
+# How much to read at a time, so commands start before input ends.
+_CHUNK = 64 * 1024
+
+# Exit status reported for a command that couldn't be started.
+NOT_FOUND = 127
+
+
+def read_records(fileobj, null=False):
+    """Yield each newline- or, if null is true, NUL-separated record in
+    fileobj, a binary file, as soon as it has been read.
+    """
+    separator = b"\0" if null else b"\n"
+    read = getattr(fileobj, "read1", fileobj.read)
+    pending = b""
+    while True:
+        chunk = read(_CHUNK)
+        if not chunk:
+            break
+        records = (pending + chunk).split(separator)
+        pending = records.pop()
+        for record in records:
+            yield record
+    if pending:
+        yield pending
+
+
+def parse_command(record):
+    """Split a record into arguments as a shell would, but without
+    expanding anything. Comments (#) are dropped.
+
+    :returns:
+        a list of strings, empty for a blank record.
+    """
+    text = record.decode("utf-8", "surrogateescape")
+    try:
+        return shlex.split(text, comments=True)
+    except ValueError as error:
+        raise exceptions.InvalidCommand(
+            "can't parse command {0!r}: {1}".format(text, error))
+
+
+class _LockedExecutables(object):
+    """Let threads share an ExecutableCache, one lookup at a time.
+    """
+    def __init__(self, executables):
+        self.executables = executables
+        self.lock = threading.Lock()
+
+    def find(self, name, path=None):
+        with self.lock:
+            return self.executables.find(name, path)
+
+    def save(self):
+        with self.lock:
+            self.executables.save()
+
+
+def _run_one(command, env, cwd, stdin, executables, limits, make_report,
+             forwarder):
+    report = make_report(command) if make_report else None
+    started = time.time()
+    # run may add to the environment, so each command gets a copy.
+    returncode = run(
+        command, env=dict(env), cwd=cwd, executables=executables,
+        report=report, limits=limits, stdin=stdin, forwarder=forwarder)
+    return returncode, time.time() - started
+
+
+def _write_result(number, command, returncode, elapsed, as_json):
+    if as_json:
+        line = json.dumps({
+            "number": number, "command": command,
+            "returncode": returncode, "elapsed": round(elapsed, 6),
+        }, sort_keys=True)
+    else:
+        line = "{0}\t{1}\t{2:.3f}s\t{3}".format(
+            number, "not found" if returncode is None else returncode,
+            elapsed, " ".join(shlex.quote(arg) for arg in command))
+    sys.stderr.write(line + "\n")
+
+
+def handle_batch(source, env, cwd, executables=None, limits=None, jobs=None,
+                 null=False, keep_going=False, as_json=False,
+                 make_report=None):
+    """Run each command read from source with the environment env.
+
+    source is a file of commands, one per line (or NUL-separated, if
+    null is true), or "-" to read them from stdin; commands then get
+    /dev/null as their stdin, so they can't eat the ones after them.
+    Up to jobs commands run at once, by default one. Unless keep_going,
+    no more are started after one fails. Each command's number, exit
+    status and duration are written to stderr as it finishes.
+
+    make_report, if given, is called with each command to make the
+    report function for vex.run.run.
+
+    Signals vex gets are passed on to every command running, each in
+    its own process group unless stdin is a terminal, and no more
+    commands are started after one.
+
+    :returns:
+        0 if all succeeded, else the exit status of the first failure
+        (1 if that was a signal), or 128 plus the number of the first
+        signal vex got.
+    """
+    if source == "-":
+        fileobj = getattr(sys.stdin, "buffer", sys.stdin)
+        stdin = subprocess.DEVNULL
+    else:
+        try:
+            fileobj = open(source, "rb")
+        except (IOError, OSError) as error:
+            raise exceptions.InvalidCommand(
+                "can't read --batch file {0!r}: {1}".format(
+                    source, error.strerror))
+        stdin = None
+    jobs = jobs or 1
+    # One at a time, commands run in this thread.
+    serial = jobs == 1
+    if executables is not None and jobs > 1:
+        executables = _LockedExecutables(executables)
+    status = 0
+    counts = {"run": 0, "failed": 0}
+    running = {}
+
+    def start(args):
+        if serial:
+            future = Future()
+            future.set_result(_run_one(*args))
+            return future
+        return executor.submit(_run_one, *args)
+
+    def finish(future):
+        number, command = running.pop(future)
+        returncode, elapsed = future.result()
+        counts["run"] += 1
+        _write_result(number, command, returncode, elapsed, as_json)
+        if returncode == 0:
+            return 0
+        counts["failed"] += 1
+        if returncode is None:
+            return NOT_FOUND
+        return returncode if returncode > 0 else 1
+
+    # One forwarder for the whole batch, so signals reach every
+    # command running in any thread.
+    forwarder = SignalForwarder(wants_own_group())
+    forwarder.install()
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        number = 0
+        for record in read_records(fileobj, null):
+            if forwarder.received:
+                break
+            if status and not keep_going:
+                break
+            try:
+                command = parse_command(record)
+            except exceptions.InvalidCommand as error:
+                sys.stderr.write("Error: " + error.message + "\n")
+                counts["failed"] += 1
+                status = status or 1
+                continue
+            if not command:
+                continue
+            number += 1
+            future = start((command, env, cwd, stdin, executables, limits,
+                            make_report, forwarder))
+            running[future] = (number, command)
+            while len(running) >= jobs:
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    failure = finish(future)
+                    status = status or failure
+        # After a failure, those already running are left to finish.
+        for future in list(running):
+            failure = finish(future)
+            status = status or failure
+    finally:
+        # Commands still running were passed any signal, so this
+        # shouldn't wait for long.
+        executor.shutdown()
+        # Not starting any more commands was the answer to a signal
+        # that came between them; vex goes on to exit and clean up.
+        forwarder.pending = []
+        forwarder.restore()
+        if source != "-":
+            fileobj.close()
+    if forwarder.received:
+        status = 128 + forwarder.received[0]
+    sys.stderr.write("{0} commands run, {1} failed\n".format(
+        counts["run"], counts["failed"]))
+    return status
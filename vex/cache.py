@@ -0,0 +1,124 @@
+"""Small on-disk caches for things that are expensive to rediscover.
+
+Caches are plain JSON files under the directory given by
+Vexrc.get_cache_dir. They are only hints: a missing, unreadable or
+corrupt cache file just means starting over with an empty one.
+"""
+import os
+import json
+import tempfile
+
+
+def get_umask():
+    """Return the process's umask, without changing it if possible.
+
+    Setting it to read it back would affect files other threads are
+    creating at the time, so Linux's /proc is asked first.
+    """
+    try:
+        with open("/proc/self/status", "r") as inp:
+            for line in inp:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (IOError, OSError, ValueError):
+        pass
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+class JSONCache(object):
+    """A dict persisted as a JSON file.
+
+    If path is None, the cache lives only in memory.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.dirty = False
+
+    def load(self):
+        """Read cached data from disk, if it hasn't been read yet.
+        """
+        if self.data is not None:
+            return self.data
+        # Only set data once it is complete, so other threads never
+        # see an empty dict while the file is being read.
+        data = {}
+        if self.path:
+            try:
+                with open(self.path, "r") as inp:
+                    data = json.load(inp)
+            except (IOError, OSError, ValueError):
+                pass
+            if not isinstance(data, dict):
+                data = {}
+        self.data = data
+        return self.data
+
+    def get(self, key, default=None):
+        return self.load().get(key, default)
+
+    def __contains__(self, key):
+        return key in self.load()
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __setitem__(self, key, value):
+        data = self.load()
+        if data.get(key) != value:
+            data[key] = value
+            self.dirty = True
+
+    def __delitem__(self, key):
+        data = self.load()
+        if key in data:
+            del data[key]
+            self.dirty = True
+
+    def prune(self, prefix):
+        """Drop entries keyed by prefix and a path that no longer exists.
+
+        That costs a stat per entry, so it is only done when something
+        changed, and the cache is about to be written anyway.
+        """
+        if not self.dirty:
+            return
+        stale = [
+            key for key in self.load()
+            if key.startswith(prefix) and
+            not os.path.lexists(key[len(prefix):])]
+        for key in stale:
+            del self[key]
+
+    def save(self):
+        """Write the cache back to disk if anything changed.
+
+        The file is replaced atomically so concurrent readers see either
+        the old or the new contents. Failure to write is not an error.
+        """
+        if not self.dirty or not self.path:
+            return
+        parent = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            fd, temp_path = tempfile.mkstemp(dir=parent, prefix=".tmp-")
+            with os.fdopen(fd, "w") as out:
+                json.dump(self.data, out, separators=(",", ":"))
+            # mkstemp makes it private; a shared cache has to stay
+            # readable by everyone who could read the directory.
+            os.chmod(temp_path, 0o666 & ~get_umask())
+            os.replace(temp_path, self.path)
+        except (IOError, OSError):
+            return
+        self.dirty = False
+
+
+def open_cache(cache_dir, name):
+    """Get the named cache under cache_dir, or an in-memory one.
+    """
+    if not cache_dir:
+        return JSONCache(None)
+    return JSONCache(os.path.join(cache_dir, name + ".json"))
@@ -0,0 +1,177 @@
+"""Find virtualenvs broken by changes outside them, without running them.
+
+The usual cause is an upgrade or removal of the python a virtualenv was
+made from, which leaves bin/python dangling, pyvenv.cfg's home pointing
+nowhere and scripts' shebangs naming interpreters that are gone.
+"""
+import os
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+from vex.layout import get_ve_bin, read_pyvenv_cfg
+from vex.remove import obviously_not_a_virtualenv
+from vex.walk import default_jobs
+
+# Enough of a script to find its interpreter, even in pip's long form.
+_HEAD_SIZE = 512
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def read_shebang(path):
+    """Return the interpreter named by a script's shebang, or None.
+
+    Understands the two-line form pip writes when the interpreter's
+    path is too long for a shebang::
+
+        #!/bin/sh
+        '''exec' /long/path/bin/python "$0" "$@"
+    """
+    try:
+        with open(path, "rb") as inp:
+            head = inp.read(_HEAD_SIZE)
+    except (IOError, OSError):
+        return None
+    if not head.startswith(b"#!"):
+        return None
+    lines = head[2:].decode("utf-8", "replace").splitlines()
+    words = lines[0].split() if lines else []
+    if not words:
+        return None
+    if words[0] == "/bin/sh" and len(lines) > 1:
+        second = lines[1].split()
+        if len(second) > 1 and second[0] == "'''exec'":
+            return second[1]
+    return words[0]
+
+
+def check_virtualenv(ve_path):
+    """Look for things wrong with the virtualenv at ve_path.
+
+    :returns:
+        (problems, depends): a list of descriptions of problems found,
+        and a dict of the paths the verdict depends on to their mtimes
+        (None for missing paths), for deciding when to check again.
+    """
+    problems = []
+    bin_path = get_ve_bin(ve_path)
+    cfg_path = os.path.join(ve_path, "pyvenv.cfg")
+    depends = {}
+    for path in (ve_path, bin_path, cfg_path):
+        depends[path] = _mtime(path)
+
+    if obviously_not_a_virtualenv(ve_path):
+        problems.append("does not look like a virtualenv")
+        return problems, depends
+
+    settings = read_pyvenv_cfg(ve_path)
+    if settings is not None:
+        home = settings.get("home")
+        if not home:
+            problems.append("pyvenv.cfg has no home")
+        else:
+            depends[home] = _mtime(home)
+            if not os.path.isdir(home):
+                problems.append(
+                    "pyvenv.cfg home {0!r} does not exist".format(home))
+
+    try:
+        entries = list(os.scandir(bin_path))
+    except OSError:
+        problems.append("can't list {0!r}".format(bin_path))
+        return problems, depends
+    interpreters = set()
+    for entry in sorted(entries, key=lambda entry: entry.name):
+        if entry.is_symlink():
+            target = os.path.realpath(entry.path)
+            parent = os.path.dirname(target)
+            depends[parent] = _mtime(parent)
+            if not os.path.exists(target):
+                problems.append("{0} is a dangling symlink to {1!r}".format(
+                    entry.name, os.readlink(entry.path)))
+            continue
+        if not entry.is_file():
+            continue
+        interpreter = read_shebang(entry.path)
+        if not interpreter or not os.path.isabs(interpreter):
+            continue
+        if interpreter not in interpreters:
+            interpreters.add(interpreter)
+            parent = os.path.dirname(interpreter)
+            depends[parent] = _mtime(parent)
+            if not os.path.exists(interpreter):
+                problems.append("{0} runs missing interpreter {1!r}".format(
+                    entry.name, interpreter))
+    return problems, depends
+
+
+def is_current(entry):
+    """Tell whether a cached verdict still applies.
+
+    It does if nothing it depends on has changed: replacing, adding or
+    removing files in those directories updates their mtimes.
+    """
+    if not entry or len(entry) != 2:
+        return False
+    _, depends = entry
+    return all(_mtime(path) == mtime for path, mtime in depends.items())
+
+
+def check_all(paths, cache, jobs=None):
+    """Check the virtualenvs at paths concurrently.
+
+    Verdicts are kept in cache, keyed by path.
+
+    :returns:
+        a dict mapping each path to a list of its problems.
+    """
+    def check(path):
+        entry = cache.get("check:" + path)
+        if is_current(entry):
+            return entry
+        return list(check_virtualenv(path))
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+        for path, entry in zip(paths, executor.map(check, paths)):
+            cache["check:" + path] = entry
+            results[path] = entry[0]
+    cache.prune("check:")
+    cache.save()
+    return results
+
+
+def format_result(name, path, problems, as_json=False):
+    """Format one virtualenv's result as a line of output.
+    """
+    if as_json:
+        return json.dumps({
+            "name": name, "path": path,
+            "ok": not problems, "problems": problems,
+        }, sort_keys=True)
+    if not problems:
+        return "ok\t{0}".format(name)
+    return "broken\t{0}\t{1}".format(name, "; ".join(problems))
+
+
+def handle_check(index, cache, prefix="", jobs=None, as_json=False):
+    """Check the virtualenvs in index whose names begin with prefix.
+
+    Prints one line per virtualenv, in name order. Returns 1 if any
+    are broken.
+    """
+    names = index.names(prefix)
+    paths = [index.lookup(name) for name in names]
+    results = check_all(paths, cache, jobs)
+    broken = 0
+    for name, path in zip(names, paths):
+        problems = results[path]
+        if problems:
+            broken += 1
+        sys.stdout.write(format_result(name, path, problems, as_json) + "\n")
+    return 1 if broken else 0
@@ -1,25 +1,22 @@
 """Config file processing (.vexrc).
 """
 import os
-import sys
 import re
 import shlex
+import fnmatch
 import platform
 from collections import OrderedDict
 
 _IDENTIFIER_PATTERN = "[a-zA-Z][_a-zA-Z0-9]*"
 _SQUOTE_RE = re.compile(r"'([^']*)'\Z")  # NO squotes inside
 _DQUOTE_RE = re.compile(r'"([^"]*)"\Z')  # NO dquotes inside
+# A heading may be scoped with a glob, e.g. "env:myservice:" or "env:web-*:".
 _HEADING_RE = re.compile(
-    r"^(" + _IDENTIFIER_PATTERN + r"):[ \t\n\r]*\Z")
+    r"^(" + _IDENTIFIER_PATTERN + r"(?::[^:\s]+)?):[ \t\n\r]*\Z")
 _VAR_RE = re.compile(
     r"[ \t]*(" + _IDENTIFIER_PATTERN + r") *= *(.*)[ \t\n\r]*$")
 
 
-if sys.version_info < (3, 3):
-    FileNotFoundError = IOError
-
-
 class InvalidConfigError(Exception):
     """Raised when there is an error during a .vexrc file parse.
     """
@@ -46,6 +43,9 @@ class Vexrc(object):
         self.headings = OrderedDict()
         self.headings[self.default_heading] = OrderedDict()
         self.headings["env"] = OrderedDict()
+        self.sources = []
+        self.origins = {}
+        self._env_cache = {}
 
     def __getitem__(self, key):
         return self.headings.get(key)
@@ -73,23 +73,62 @@ class Vexrc(object):
             if heading not in self.headings:
                 self.headings[heading] = OrderedDict()
             self.headings[heading][key] = value
+            self.origins[(heading, key)] = path
         parsing.close()
+        self.sources.append(path)
+        self._env_cache.clear()
         return None
 
-    def get_ve_base(self, environ):
-        """Find a directory to look for virtualenvs in.
+    def get_env(self, ve_name):
+        """Get env settings for the named virtualenv.
+
+        Starts from the global env heading, then applies each
+        "env:PATTERN" heading whose glob matches ve_name in file order,
+        and finally any heading naming ve_name exactly.
+        The merged result is cached per name, so callers can apply it
+        with a single dict update.
+        """
+        env = self._env_cache.get(ve_name)
+        if env is not None:
+            return env
+        env = OrderedDict(self.headings["env"])
+        exact = None
+        for heading, values in self.headings.items():
+            if not heading.startswith("env:"):
+                continue
+            pattern = heading[len("env:"):]
+            if pattern == ve_name:
+                exact = values
+            elif ve_name and fnmatch.fnmatchcase(ve_name, pattern):
+                env.update(values)
+        if exact is not None:
+            env.update(exact)
+        self._env_cache[ve_name] = env
+        return env
+
+    def get_ve_bases(self, environ):
+        """Find the directories to look for virtualenvs in, in order.
+
+        Either source may list several directories separated by
+        os.pathsep, as in PATH; earlier ones take precedence.
         """
-        # set ve_base to a path we can look for virtualenvs:
+        # set ve_bases to paths we can look for virtualenvs:
         # 1. .vexrc
         # 2. WORKON_HOME (as defined for virtualenvwrapper's benefit)
         # 3. $HOME/.virtualenvs
         # (unless we got --path, then we don't need it)
         ve_base_value = self.headings[self.default_heading].get("virtualenvs")
         if ve_base_value:
-            ve_base = os.path.expanduser(ve_base_value)
+            ve_bases = [
+                os.path.expanduser(value)
+                for value in ve_base_value.split(os.pathsep) if value
+            ]
         else:
-            ve_base = environ.get("WORKON_HOME", "")
-        if not ve_base:
+            ve_bases = [
+                value for value in
+                environ.get("WORKON_HOME", "").split(os.pathsep) if value
+            ]
+        if not ve_bases:
             # On Cygwin os.name == "posix" and we want $HOME.
             if platform.system() == "Windows" and os.name == "nt":
                 _win_drive = environ.get("HOMEDRIVE")
@@ -101,9 +140,64 @@ class Vexrc(object):
             if not home:
                 home = os.path.expanduser("~")
             if not home:
+                return []
+            ve_bases = [os.path.join(home, ".virtualenvs")]
+        return ve_bases
+
+    def get_ve_base(self, environ):
+        """Find the directory to make new virtualenvs in.
+
+        This is the first of the directories from get_ve_bases.
+        """
+        ve_bases = self.get_ve_bases(environ)
+        return ve_bases[0] if ve_bases else ""
+
+    def get_trusted_dirs(self):
+        """Find the directories whose project .vexrc files may be read.
+
+        They are listed by trust= in the user's config, separated by
+        os.pathsep as in PATH; there are none unless it is set.
+        """
+        value = self.headings[self.default_heading].get("trust")
+        if not value:
+            return []
+        return [
+            os.path.realpath(os.path.expanduser(path))
+            for path in value.split(os.pathsep) if path]
+
+    def get_cache_dir(self, environ):
+        """Find a directory to keep vex's caches in.
+
+        Returns "" if there is nowhere sensible, meaning don't cache.
+        """
+        cache_value = self.headings[self.default_heading].get("cache")
+        if cache_value:
+            return os.path.expanduser(cache_value)
+        # A relative directory would put caches under wherever vex
+        # happens to be run from, so it is as good as none.
+        base = environ.get("XDG_CACHE_HOME", "")
+        if not os.path.isabs(base):
+            home = environ.get("HOME", "")
+            if not os.path.isabs(home):
                 return ""
-            ve_base = os.path.join(home, ".virtualenvs")
-        return ve_base or ""
+            base = os.path.join(home, ".cache")
+        return os.path.join(base, "vex")
+
+    def dump(self):
+        """Render the effective config, noting where each value came from.
+        """
+        lines = ["# read: {0}".format(source) for source in self.sources]
+        for heading, values in self.headings.items():
+            if not values:
+                continue
+            lines.append("{0}:".format(heading))
+            for key, value in values.items():
+                origin = self.origins.get((heading, key))
+                line = "    {0}={1}".format(key, value)
+                if origin:
+                    line += "  # {0}".format(origin)
+                lines.append(line)
+        return "\n".join(lines) + "\n"
 
     def get_shell(self, environ):
         """Find a command to run.
@@ -121,6 +215,101 @@ class Vexrc(object):
         return runtime if runtime else None
 
 
+def find_project_vexrcs(start, cache, filename=".vexrc"):
+    """Find config files in start and the directories above it.
+
+    :returns:
+        a list of paths, outermost first, so that reading them in order
+        lets nearer files override farther ones.
+
+    Whether a directory has a config file is cached by directory
+    identity (device and inode) along with its mtime, which changes
+    whenever a file is added to or removed from it.
+    So a warm walk costs one stat per directory, with no lookups
+    of nonexistent files.
+    """
+    found = []
+    directory = os.path.abspath(start)
+    while True:
+        try:
+            stat = os.stat(directory)
+        except OSError:
+            stat = None
+        if stat is not None:
+            key = "{0}:{1}".format(stat.st_dev, stat.st_ino)
+            entry = cache.get(key)
+            if entry and entry[0] == stat.st_mtime:
+                present = entry[1]
+            else:
+                present = os.path.isfile(os.path.join(directory, filename))
+                cache[key] = [stat.st_mtime, present]
+            if present:
+                found.append(os.path.join(directory, filename))
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    found.reverse()
+    return found
+
+
+def is_trusted(path, trusted_dirs):
+    """Check whether path is in one of trusted_dirs or below it.
+    """
+    path = os.path.realpath(path)
+    for directory in trusted_dirs:
+        relative = os.path.relpath(path, directory)
+        if relative != os.pardir and \
+                not relative.startswith(os.pardir + os.sep):
+            return True
+    return False
+
+
+def owned_by_user(path):
+    """Check whether path belongs to the current user.
+
+    Where that can't be determined (e.g. Windows), this returns True.
+    """
+    if not hasattr(os, "getuid"):
+        return True
+    try:
+        return os.stat(path).st_uid == os.getuid()
+    except OSError:
+        return False
+
+
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgtp]?)i?b?\s*\Z", re.I)
+_DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*\Z", re.I)
+_SIZE_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30,
+               "t": 1 << 40, "p": 1 << 50}
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400,
+                   "w": 604800}
+
+
+def parse_size(text):
+    """Parse a size like "512M" or "2G" (binary units) into bytes.
+
+    Returns None if text isn't a size.
+    """
+    match = _SIZE_RE.match(text or "")
+    if not match:
+        return None
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS[unit.lower()])
+
+
+def parse_duration(text):
+    """Parse a duration like "90", "30s", "15m" or "7d" into seconds.
+
+    Returns None if text isn't a duration.
+    """
+    match = _DURATION_RE.match(text or "")
+    if not match:
+        return None
+    number, unit = match.groups()
+    return float(number) * _DURATION_UNITS[unit.lower()]
+
+
 def extract_heading(line):
     """Return heading in given line or None if it's not a heading.
     """
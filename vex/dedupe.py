@@ -0,0 +1,238 @@
+"""Replace identical files in different virtualenvs by links to one copy.
+
+Virtualenvs made from the same requirements contain many identical
+files. Linking them together saves disk, and page cache too, since
+a shared library or module mapped by processes in several virtualenvs
+is then only in memory once.
+"""
+import os
+import sys
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from vex import exceptions
+from vex.index import is_virtualenv
+from vex.links import replace_with_link
+from vex.usage import format_size, forget_usage
+from vex.walk import default_jobs, walk_files
+
+_CHUNK_SIZE = 1 << 20
+
+FileInfo = namedtuple(
+    "FileInfo", "path dev ino size mtime mode uid gid nlink")
+
+
+def _stat(entry):
+    try:
+        stat = entry.stat(follow_symlinks=False)
+    except OSError:
+        return None
+    return FileInfo(
+        entry.path, stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime,
+        stat.st_mode, stat.st_uid, stat.st_gid, stat.st_nlink)
+
+
+def collect_files(roots, jobs=None):
+    """Stat every regular, non-empty file under roots.
+
+    Symlinks are neither followed nor collected, so nothing found here
+    is outside roots.
+    """
+    entries = [
+        entry for entry in walk_files(roots, jobs)
+        if entry.is_file(follow_symlinks=False)]
+    with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+        infos = executor.map(_stat, entries)
+        return [info for info in infos if info and info.size]
+
+
+def group_candidates(infos):
+    """Group files which could be identical and linked together.
+
+    Only files on the same device with the same size, permissions and
+    owner can be; since most sizes are unique, this leaves few files
+    which need to be read.
+    """
+    groups = {}
+    for info in infos:
+        key = (info.dev, info.size, info.mode, info.uid, info.gid)
+        groups.setdefault(key, []).append(info)
+    return [
+        group for group in groups.values()
+        if len(set(info.ino for info in group)) > 1]
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as inp:
+        for chunk in iter(lambda: inp.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_inodes(infos, cache, jobs=None):
+    """Get the content hash of each distinct inode among infos.
+
+    Hashes are kept in cache by device and inode, and reused while the
+    inode's size and mtime are the same.
+
+    :returns:
+        a dict mapping (dev, ino) to a hex digest.
+    """
+    hashes = {}
+    to_hash = {}
+    for info in infos:
+        inode = (info.dev, info.ino)
+        if inode in hashes or inode in to_hash:
+            continue
+        entry = cache.get("hash:{0}:{1}".format(*inode))
+        if entry and entry[0] == info.mtime and entry[1] == info.size:
+            hashes[inode] = entry[2]
+        else:
+            to_hash[inode] = info
+
+    def work(info):
+        try:
+            return hash_file(info.path)
+        except (IOError, OSError):
+            return None
+
+    inodes = list(to_hash)
+    with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+        digests = executor.map(work, [to_hash[inode] for inode in inodes])
+        for inode, digest in zip(inodes, digests):
+            if digest is None:
+                continue
+            info = to_hash[inode]
+            cache["hash:{0}:{1}".format(*inode)] = [
+                info.mtime, info.size, digest]
+            hashes[inode] = digest
+    return hashes
+
+
+def forget_unseen(cache, infos):
+    """Drop cached hashes of inodes that none of infos are links to.
+    """
+    keep = set("hash:{0}:{1}".format(info.dev, info.ino) for info in infos)
+    data = cache.load()
+    for key in [key for key in data if key.startswith("hash:")]:
+        if key not in keep:
+            del cache[key]
+
+
+def plan_links(groups, hashes):
+    """Decide which files to replace with links to which.
+
+    Of each set of identical files, the inode with the most links
+    already is kept (the first by path, if that is a tie), so running
+    again after a partial run carries on rather than starting over.
+
+    :returns:
+        (links, saved): a list of (info, keeper) pairs, and the bytes
+        freed once the links are made.
+    """
+    links = []
+    saved = 0
+    for group in groups:
+        by_digest = {}
+        for info in group:
+            digest = hashes.get((info.dev, info.ino))
+            if digest is not None:
+                by_digest.setdefault(digest, []).append(info)
+        for same in by_digest.values():
+            by_inode = {}
+            for info in sorted(same, key=lambda info: info.path):
+                by_inode.setdefault(info.ino, []).append(info)
+            if len(by_inode) < 2:
+                continue
+            keeper_ino = max(
+                by_inode, key=lambda ino: by_inode[ino][0].nlink)
+            keeper = by_inode.pop(keeper_ino)[0]
+            for infos in by_inode.values():
+                links.extend((info, keeper) for info in infos)
+                # Space comes back only when the last link goes.
+                if infos[0].nlink == len(infos):
+                    saved += infos[0].size
+    return links, saved
+
+
+def _inside(path, roots):
+    for root in roots:
+        relative = os.path.relpath(path, root)
+        if not relative.startswith(os.pardir) and relative != os.curdir:
+            return True
+    return False
+
+
+def _unchanged(info):
+    try:
+        stat = os.lstat(info.path)
+    except OSError:
+        return False
+    return (stat.st_ino, stat.st_size, stat.st_mtime) == (
+        info.ino, info.size, info.mtime)
+
+
+def apply_links(links, roots, use_reflink=False):
+    """Make the planned links.
+
+    Files which changed since they were hashed are left alone.
+
+    :returns:
+        (done, touched): the number of files replaced, and the set of
+        directories holding files which gained links.
+    """
+    done = 0
+    touched = set()
+    for info, keeper in links:
+        if not (_inside(info.path, roots) and _inside(keeper.path, roots)):
+            raise exceptions.InvalidArgument(
+                "refusing to link {0!r} outside virtualenvs".format(
+                    info.path))
+        if not (_unchanged(info) and _unchanged(keeper)):
+            continue
+        try:
+            replace_with_link(info.path, keeper.path, use_reflink)
+        except OSError as error:
+            if use_reflink and done == 0:
+                raise exceptions.InvalidArgument(
+                    "can't make reflinks here: {0}".format(error))
+            sys.stderr.write("can't link {0!r}: {1}\n".format(
+                info.path, error))
+            continue
+        done += 1
+        touched.add(os.path.dirname(keeper.path))
+    return done, touched
+
+
+def handle_dedupe(index, cache, prefix="", jobs=None, dry_run=False,
+                  use_reflink=False, usage_cache=None):
+    """Link together identical files in virtualenvs matching prefix.
+
+    With dry_run, only prints what would be linked. Directories whose
+    files gain links are dropped from usage_cache, since their mtimes
+    don't show the change.
+    """
+    roots = [index.lookup(name) for name in index.names(prefix)]
+    roots = [root for root in roots if is_virtualenv(root)]
+    infos = collect_files(roots, jobs)
+    groups = group_candidates(infos)
+    hashes = hash_inodes(
+        [info for group in groups for info in group], cache, jobs)
+    if not prefix:
+        forget_unseen(cache, infos)
+    cache.save()
+    links, saved = plan_links(groups, hashes)
+    if dry_run:
+        for info, keeper in links:
+            sys.stdout.write("{0} -> {1}\n".format(info.path, keeper.path))
+        sys.stderr.write("would link {0} files, saving {1}\n".format(
+            len(links), format_size(saved)))
+        return 0
+    done, touched = apply_links(links, roots, use_reflink)
+    if usage_cache is not None:
+        forget_usage(usage_cache, touched)
+        usage_cache.save()
+    sys.stderr.write("linked {0} files, saving {1}\n".format(
+        done, format_size(saved)))
+    return 0
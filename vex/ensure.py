@@ -0,0 +1,227 @@
+"""Virtualenvs identified by what is in them, built once and then reused.
+
+A virtualenv for a requirements file and interpreter is kept under the
+virtualenvs directory, named by a hash of the interpreter's version, the
+options it is made with and the contents of the file and its includes.
+The first vex to need it builds it; everyone else finds it already
+there, or waits for it to be finished.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import subprocess
+from vex import exceptions
+from vex.layout import get_ve_python
+from vex.lock import FileLock
+from vex.make import handle_make
+from vex.run import get_environ, run
+from vex.store import PackageStore, STORE_DIR, get_store
+from vex.store import read_packages_record, release_packages
+from vex.wheelhouse import handle_install
+
+# Written last, so a virtualenv with it is completely built.
+MARKER = "vex-ensure.json"
+
+_VERSION_SCRIPT = (
+    "import sys, platform; "
+    "print(sys.version); print(platform.machine())"
+)
+
+
+def interpreter_version(python, cache):
+    """Describe the version and build of the interpreter at python.
+
+    Asking it means starting it, so the answer is cached by the
+    interpreter's real path and checked against its size and mtime.
+    """
+    real = os.path.realpath(python)
+    try:
+        stat = os.stat(real)
+    except OSError:
+        raise exceptions.InvalidVirtualenv(
+            "python not found: {0!r}".format(python))
+    key = "python:" + real
+    entry = cache.get(key)
+    if entry and entry[0] == stat.st_mtime and entry[1] == stat.st_size:
+        return entry[2]
+    try:
+        output = subprocess.check_output([real, "-c", _VERSION_SCRIPT])
+    except (OSError, subprocess.CalledProcessError):
+        raise exceptions.InvalidVirtualenv(
+            "could not run python {0!r}".format(python))
+    version = output.decode("utf-8", "replace").strip()
+    cache[key] = [stat.st_mtime, stat.st_size, version]
+    cache.save()
+    return version
+
+
+# Options in a requirements file that name another file to read.
+_INCLUDE_OPTIONS = (b"-r", b"--requirement", b"-c", b"--constraint")
+
+
+def _included_files(requirements):
+    """Yield the file names that requirements includes with -r or -c.
+    """
+    for line in requirements.splitlines():
+        words = line.split(b"#", 1)[0].split()
+        if not words:
+            continue
+        first = words[0]
+        if first in _INCLUDE_OPTIONS:
+            name = words[1] if len(words) > 1 else None
+        elif first.startswith((b"--requirement=", b"--constraint=")):
+            name = first.split(b"=", 1)[1]
+        elif first.startswith((b"-r", b"-c")) and \
+                not first.startswith(b"--"):
+            name = first[2:].lstrip(b"=")
+        else:
+            continue
+        # pip can also fetch these from URLs; there's nothing to read.
+        if name and b"://" not in name:
+            yield name
+
+
+def read_requirements(path, seen=None):
+    """Read a requirements file and those it includes, as one string.
+
+    Included files are found relative to the file naming them, as pip
+    does, and their contents follow the including file's.
+    """
+    if seen is None:
+        seen = set()
+    real = os.path.realpath(path)
+    if real in seen:
+        return b""
+    seen.add(real)
+    try:
+        with open(path, "rb") as inp:
+            requirements = inp.read()
+    except (IOError, OSError):
+        raise exceptions.InvalidArgument(
+            "can't read requirements file {0!r}".format(path))
+    parts = [requirements]
+    for name in _included_files(requirements):
+        name = os.fsdecode(name)
+        included = os.path.join(os.path.dirname(path), name)
+        parts.append(b"\0" + read_requirements(included, seen))
+    return b"".join(parts)
+
+
+def requirements_hash(version, requirements, site_packages=False,
+                      always_copy=False, wheelhouse=None):
+    """Hash what determines the contents of an ensured virtualenv.
+    """
+    digest = hashlib.sha256()
+    digest.update(version.encode("utf-8") + b"\0")
+    digest.update(b"site-packages\0" if site_packages else b"\0")
+    digest.update(b"always-copy\0" if always_copy else b"\0")
+    if wheelhouse:
+        digest.update(os.fsencode(os.path.abspath(wheelhouse)))
+    digest.update(b"\0")
+    digest.update(requirements)
+    return digest.hexdigest()[:32]
+
+
+def is_complete(ve_path):
+    return os.path.exists(os.path.join(ve_path, MARKER))
+
+
+def _write_marker(ve_path, requirements_path, version):
+    path = os.path.join(ve_path, MARKER)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as out:
+        json.dump({
+            "requirements": os.path.abspath(requirements_path),
+            "python": version,
+            "created": time.time(),
+        }, out, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def discard(ve_path):
+    """Remove an unfinished virtualenv and its store references.
+    """
+    if not os.path.lexists(ve_path):
+        return
+    record = read_packages_record(ve_path)
+    shutil.rmtree(ve_path)
+    release_packages(record, ve_path)
+
+
+def build(environ, options, ve_path, requirements_path, version,
+          store=None):
+    """Make a virtualenv at ve_path and install requirements in it.
+
+    Anything left at ve_path by an earlier build that didn't finish
+    is removed first. With a wheelhouse, packages are linked from store
+    if one is given.
+    """
+    discard(ve_path)
+    try:
+        handle_make(environ, options, ve_path)
+        if options.wheelhouse:
+            handle_install(
+                environ, ve_path, options.wheelhouse, requirements_path,
+                options.jobs, store)
+        else:
+            command = [
+                get_ve_python(ve_path), "-m", "pip", "install",
+                "--disable-pip-version-check", "-r", requirements_path]
+            env = get_environ(environ, {}, ve_path)
+            if run(command, env=env, cwd=None) != 0:
+                raise exceptions.VirtualenvNotMade(
+                    "could not install requirements from {0!r}".format(
+                        requirements_path))
+        _write_marker(ve_path, requirements_path, version)
+    except BaseException:
+        discard(ve_path)
+        raise
+
+
+def handle_ensure(environ, options, ve_base, python, cache):
+    """Find or build the virtualenv for options.ensure and python.
+
+    The usual case, when it exists already, costs reading the
+    requirements files and a couple of stats. Otherwise one vex builds
+    it, holding a lock, while any others wait on that lock.
+
+    :returns:
+        the path of the virtualenv.
+    """
+    requirements_path = options.ensure
+    requirements = read_requirements(requirements_path)
+    if not ve_base:
+        raise exceptions.NoVirtualenvsDirectory(
+            "could not figure out a virtualenvs directory. "
+            "make sure $HOME is set, or $WORKON_HOME,"
+            " or set virtualenvs=something in your .vexrc")
+    version = interpreter_version(python, cache)
+    key = requirements_hash(
+        version, requirements, options.site_packages,
+        getattr(options, "always_copy", False),
+        getattr(options, "wheelhouse", None))
+    ve_path = os.path.join(get_store(ve_base, "envs"), key)
+    if is_complete(ve_path):
+        return ve_path
+    lock = FileLock(os.path.join(get_store(ve_base, "locks"), key))
+    if not lock.acquire(blocking=False):
+        sys.stderr.write(
+            "waiting for another vex to build {0!r}\n".format(ve_path))
+        lock.acquire()
+    try:
+        # It may have been finished while we waited.
+        if not is_complete(ve_path):
+            sys.stderr.write("building {0!r} for {1!r}\n".format(
+                ve_path, requirements_path))
+            options.python = python
+            store = None
+            if getattr(options, "share_packages", False):
+                store = PackageStore(os.path.join(ve_base, STORE_DIR))
+            build(environ, options, ve_path, requirements_path, version,
+                  store)
+    finally:
+        lock.release()
+    return ve_path
@@ -1,6 +1,3 @@
-import sys
-
-
 class InvalidArgument(Exception):
     """Raised by anything under main() to propagate errors to user.
     """
@@ -47,6 +44,14 @@ class InvalidVirtualenv(InvalidArgument):
     pass
 
 
+class AmbiguousVirtualenv(InvalidVirtualenv):
+    """A virtualenv name matched more than one virtualenv.
+    """
+    def __init__(self, message, candidates):
+        self.candidates = candidates
+        InvalidVirtualenv.__init__(self, message)
+
+
 class InvalidCommand(InvalidArgument):
     """No runnable command was found.
     """
@@ -83,7 +88,10 @@ class VirtualenvNotRemoved(InvalidArgument):
     pass
 
 
-if sys.version_info > (3, 3):
-    CommandNotFoundError = FileNotFoundError
-else:
-    CommandNotFoundError = OSError
+class InvalidArchive(InvalidArgument):
+    """an archive to import was unreadable or unsafe to unpack.
+    """
+    pass
+
+
+CommandNotFoundError = FileNotFoundError
@@ -0,0 +1,212 @@
+"""Remove the least recently used virtualenvs to keep within a quota.
+
+When each virtualenv was last used comes from the records kept by
+vex.lastused, and sizes from the cached disk usage accounting, so
+deciding what to remove doesn't walk every virtualenv again.
+"""
+import os
+import sys
+import time
+import fnmatch
+from vex import exceptions
+from vex.config import parse_size, parse_duration
+from vex.ensure import is_complete
+from vex.index import is_virtualenv, name_for_path
+from vex.lastused import compact, find_base, forget, format_time
+from vex.lock import FileLock
+from vex.remove import handle_remove
+from vex.store import get_store
+from vex.usage import format_size, forget_usage, measure
+
+# Virtualenvs used more recently than this are never removed, by default.
+DEFAULT_MIN_AGE = 3600.0
+
+
+class Policy(object):
+    """What to remove. Unset (None) means no limit of that kind.
+
+    :param max_total_size: bytes all virtualenvs together may use.
+    :param max_age: seconds since last use after which one is removed.
+    :param min_age: seconds since last use before one may be removed.
+    :param protect: globs of virtualenv names never to remove.
+    """
+    def __init__(self, max_total_size=None, max_age=None,
+                 min_age=DEFAULT_MIN_AGE, protect=()):
+        self.max_total_size = max_total_size
+        self.max_age = max_age
+        self.min_age = min_age
+        self.protect = list(protect)
+
+    def is_protected(self, name):
+        return any(fnmatch.fnmatchcase(name, glob) for glob in self.protect)
+
+
+def _get_setting(options, settings, name, parse, description):
+    """Get a setting from options or, failing that, vexrc's gc heading.
+    """
+    value = getattr(options, name, None)
+    if value is None:
+        value = settings.get(name)
+    if value is None or value == "":
+        return None
+    parsed = parse(value)
+    if parsed is None:
+        raise exceptions.BadConfig(
+            "invalid {0}: {1!r}".format(description, value))
+    return parsed
+
+
+def get_policy(options, vexrc):
+    """Make a Policy from command-line options over the vexrc gc heading.
+    """
+    settings = vexrc["gc"] or {}
+    policy = Policy(
+        max_total_size=_get_setting(
+            options, settings, "max_total_size", parse_size, "size limit"),
+        max_age=_get_setting(
+            options, settings, "max_age", parse_duration, "maximum age"),
+        protect=settings.get("protect", "").replace(",", " ").split(),
+    )
+    min_age = _get_setting(
+        options, settings, "min_age", parse_duration, "minimum age")
+    if min_age is not None:
+        policy.min_age = min_age
+    if policy.max_total_size is None and policy.max_age is None:
+        raise exceptions.BadConfig(
+            "--gc needs max_total_size or max_age, in the gc heading of "
+            "your .vexrc or as --max-total-size or --max-age")
+    return policy
+
+
+def _ensured(ve_base):
+    """List (name, path) for the virtualenvs --ensure built in ve_base.
+
+    Those still being built are left out.
+    """
+    envs = get_store(ve_base, "envs")
+    try:
+        keys = sorted(os.listdir(envs))
+    except OSError:
+        return []
+    found = []
+    for key in keys:
+        path = os.path.abspath(os.path.join(envs, key))
+        if is_complete(path):
+            found.append((name_for_path([ve_base], path), path))
+    return found
+
+
+def find_virtualenvs(ve_base, index):
+    """List (last used, name, path) for the virtualenvs in ve_base,
+    including those --ensure built, least recently used first.
+
+    One never run by vex counts as last used when its directory was
+    last changed, which is usually when it was made.
+    """
+    records = compact(ve_base)
+    candidates = [
+        (name, os.path.abspath(index.lookup(name)))
+        for name in index.names()]
+    found = []
+    for name, path in candidates + _ensured(ve_base):
+        if find_base([ve_base], path) is None or not is_virtualenv(path):
+            continue
+        last = records.get(name, [0, 0])[0]
+        try:
+            last = max(last, os.stat(path).st_mtime)
+        except OSError:
+            continue
+        found.append((last, name, path))
+    found.sort()
+    return found
+
+
+def plan_removal(found, usages, total, policy, now):
+    """Choose virtualenvs to remove, least recently used first.
+
+    :returns:
+        a list of (name, path, reason).
+    """
+    chosen = []
+    remaining = total
+    for last, name, path in found:
+        age = now - last
+        if policy.is_protected(name) or age < policy.min_age:
+            continue
+        if policy.max_age is not None and age > policy.max_age:
+            reason = "unused since {0}".format(format_time(last))
+        elif policy.max_total_size is not None and \
+                remaining > policy.max_total_size:
+            reason = "over quota, unused since {0}".format(format_time(last))
+        else:
+            continue
+        chosen.append((name, path, reason))
+        remaining -= usages[path].actual
+    return chosen
+
+
+def _remove(ve_base, path):
+    """Remove the virtualenv at path, unless --ensure is rebuilding it.
+    """
+    envs = get_store(ve_base, "envs")
+    if os.path.dirname(path) != os.path.abspath(envs):
+        handle_remove(path, quiet=True)
+        return
+    lock = FileLock(os.path.join(
+        get_store(ve_base, "locks"), os.path.basename(path)))
+    if not lock.acquire(blocking=False):
+        raise exceptions.VirtualenvNotRemoved("another vex is building it")
+    try:
+        handle_remove(path, quiet=True)
+    finally:
+        lock.release()
+
+
+def handle_gc(ve_base, index, cache, policy, jobs=None, dry_run=False):
+    """Remove virtualenvs in ve_base as policy says.
+
+    Removal is by handle_remove, so its safety checks apply to each.
+    Files shared with virtualenvs that are kept free nothing, so the
+    sizes are measured again after removing, and more are removed if
+    that wasn't enough.
+    """
+    if not ve_base or not os.path.isdir(ve_base):
+        raise exceptions.NoVirtualenvsDirectory(
+            "no virtualenvs directory at {0!r}".format(ve_base))
+    status = 0
+    tried = set()
+    count = freed = 0
+    while True:
+        found = find_virtualenvs(ve_base, index)
+        usages, total, _ = measure(
+            [path for _, _, path in found], cache, jobs)
+        cache.save()
+        # Any that handle_remove refused aren't tried again.
+        found = [item for item in found if item[2] not in tried]
+        chosen = plan_removal(
+            found, usages, total.actual, policy, time.time())
+        if not chosen:
+            break
+        for name, path, reason in chosen:
+            size = usages[path].actual
+            sys.stdout.write("{0}\t{1}\t{2}\n".format(
+                format_size(size), name, reason))
+            tried.add(path)
+            if not dry_run:
+                try:
+                    _remove(ve_base, path)
+                except exceptions.VirtualenvNotRemoved as error:
+                    sys.stderr.write("can't remove {0!r}: {1}\n".format(
+                        name, error.message))
+                    status = 1
+                    continue
+                forget_usage(cache, [path])
+                forget(ve_base, [name])
+            count += 1
+            freed += size
+        if dry_run:
+            break
+    sys.stderr.write("{0} {1} virtualenvs, freeing {2}; {3} used\n".format(
+        "would remove" if dry_run else "removed", count,
+        format_size(freed), format_size(total.actual)))
+    return status
@@ -0,0 +1,310 @@
+"""Index of named virtualenvs across one or more virtualenvs directories.
+
+Virtualenvs may be grouped in namespaces, i.e. plain directories under
+a virtualenvs directory, so "team/service/py311" names the virtualenv
+py311 in the group team/service.
+"""
+import os
+import difflib
+from bisect import bisect_left
+from vex import exceptions
+from vex.remove import obviously_not_a_virtualenv
+
+# Separates the parts of namespaced names, whatever os.sep is.
+NAME_SEP = "/"
+
+# Deeper groups are ignored, which also stops symlink loops.
+MAX_DEPTH = 8
+
+# Cache entry for a directory which turned out to be a virtualenv.
+_IS_VIRTUALENV = "virtualenv"
+
+
+def _visible(name):
+    # Names starting with "-" can't be given on the command line, and
+    # dot-directories are where vex and other tools keep their own data.
+    return not name.startswith("-") and not name.startswith(".")
+
+
+def is_virtualenv(path):
+    """Guess whether path is a virtualenv, by looking for its markers.
+    """
+    return not obviously_not_a_virtualenv(path)
+
+
+def fuzzy_score(pattern, name):
+    """Score how well pattern matches name as a subsequence.
+
+    :returns:
+        a sortable key where lower is better, or None for no match.
+        Matches whose characters are close together come first,
+        then matches starting earlier, then shorter names.
+    """
+    position = -1
+    first = None
+    for char in pattern:
+        position = name.find(char, position + 1)
+        if position < 0:
+            return None
+        if first is None:
+            first = position
+    if first is None:
+        return None
+    gaps = position - first + 1 - len(pattern)
+    return (gaps, first, len(name), name)
+
+
+def name_for_path(roots, path):
+    """Return the name path would be known by under the given roots.
+
+    Falls back to the basename for paths outside all of them.
+    """
+    path = os.path.abspath(path)
+    for root in roots:
+        if not root:
+            continue
+        relative = os.path.relpath(path, os.path.abspath(root))
+        if relative != os.curdir and not relative.startswith(os.pardir):
+            return relative.replace(os.sep, NAME_SEP)
+    return os.path.basename(path)
+
+
+def _subdirectories(path):
+    """Return names of visible subdirectories of path.
+    """
+    names = []
+    for entry in os.scandir(path):
+        if _visible(entry.name) and entry.is_dir():
+            names.append(entry.name)
+    return names
+
+
+class VirtualenvIndex(object):
+    """Merged view of the virtualenvs under an ordered list of roots.
+
+    Like PATH, an earlier root shadows a later one: if two roots contain
+    a virtualenv with the same name, the name resolves to the first.
+
+    What each group directory contains is kept in the given cache,
+    validated by the directory's mtime. So an unchanged tree costs one
+    stat per group to consult, and virtualenvs themselves are never
+    looked inside.
+    """
+    def __init__(self, roots, cache):
+        self.roots = [root for root in roots if root]
+        self.cache = cache
+        self.paths = None
+        self.sorted_names = None
+        self.shadowed = None
+
+    def _scan_group(self, directory):
+        """Return (virtualenvs, groups) directly under directory.
+
+        Returns None if directory is itself a virtualenv
+        and None, None if it is unreadable.
+        """
+        try:
+            stat = os.stat(directory)
+        except OSError:
+            return None, None
+        key = "dir:" + directory
+        entry = self.cache.get(key)
+        if entry and entry[0] == stat.st_mtime:
+            if entry[1] == _IS_VIRTUALENV:
+                return None
+            return entry[1], entry[2]
+        # A group we listed before may have become a virtualenv since.
+        if entry and is_virtualenv(directory):
+            self.cache[key] = [stat.st_mtime, _IS_VIRTUALENV]
+            return None
+        virtualenvs = []
+        groups = []
+        try:
+            names = sorted(_subdirectories(directory))
+        except OSError:
+            return None, None
+        for name in names:
+            if is_virtualenv(os.path.join(directory, name)):
+                virtualenvs.append(name)
+            else:
+                groups.append(name)
+        self.cache[key] = [stat.st_mtime, virtualenvs, groups]
+        return virtualenvs, groups
+
+    def _scan(self, directory, prefix, found, depth=0):
+        """Add (name, path) for virtualenvs under directory to found.
+        """
+        scanned = self._scan_group(directory)
+        if scanned is None:
+            found.append((prefix.rstrip(NAME_SEP), directory))
+            return
+        virtualenvs, groups = scanned
+        before = len(found)
+        for name in virtualenvs or ():
+            found.append((prefix + name, os.path.join(directory, name)))
+        if depth < MAX_DEPTH:
+            for name in groups or ():
+                self._scan(
+                    os.path.join(directory, name), prefix + name + NAME_SEP,
+                    found, depth + 1)
+        # A directory with no virtualenvs anywhere below it is listed
+        # itself, as any directory under ve_base was before namespaces.
+        if depth and len(found) == before:
+            found.append((prefix.rstrip(NAME_SEP), directory))
+
+    def load(self):
+        """Build the merged mapping of names to paths, if not done yet.
+        """
+        if self.paths is not None:
+            return self.paths
+        self.paths = {}
+        self.shadowed = {}
+        for root in self.roots:
+            found = []
+            self._scan(root, "", found)
+            for name, path in found:
+                if not name:
+                    # The root itself is a virtualenv, not a directory
+                    # of them.
+                    continue
+                if name in self.paths:
+                    self.shadowed.setdefault(name, []).append(path)
+                else:
+                    self.paths[name] = path
+        self.sorted_names = sorted(self.paths)
+        # Directories that went away would otherwise stay forever.
+        self.cache.prune("dir:")
+        self.cache.save()
+        return self.paths
+
+    def lookup(self, name):
+        """Return the path of the named virtualenv, or None.
+        """
+        return self.load().get(name.strip(NAME_SEP))
+
+    def names(self, prefix=""):
+        """Return sorted names of virtualenvs beginning with prefix.
+
+        With a prefix like "team/", this lists a whole namespace.
+        """
+        self.load()
+        names = self.sorted_names
+        start = bisect_left(names, prefix)
+        end = start
+        while end < len(names) and names[end].startswith(prefix):
+            end += 1
+        return names[start:end]
+
+    def candidates(self, text, limit=10):
+        """Rank names that text might have been meant to refer to.
+
+        :returns:
+            (matches, suggestions): matches are names beginning with text
+            or, failing that, containing its characters in order; those
+            are the names text could unambiguously resolve to.
+            suggestions are merely similar names, for error messages.
+        """
+        matches = self.names(text)
+        if matches:
+            matches.sort(key=lambda name: (len(name), name))
+            return matches[:limit], []
+        scored = []
+        for name in self.sorted_names:
+            score = fuzzy_score(text, name)
+            if score is not None:
+                scored.append(score)
+        if scored:
+            scored.sort()
+            return [score[-1] for score in scored[:limit]], []
+        suggestions = difflib.get_close_matches(
+            text, self.sorted_names, n=limit)
+        return [], suggestions
+
+
+def get_virtualenv_path(ve_base, ve_name, index=None, inexact=False):
+    """Check a virtualenv path, raising exceptions to explain problems.
+
+    ve_base may be a list of directories to search in order.
+
+    If inexact is true, ve_name may also be a prefix or abbreviation
+    of exactly one virtualenv name in index, a VirtualenvIndex over
+    the same directories.
+    """
+    if isinstance(ve_base, (list, tuple)):
+        ve_bases = [path for path in ve_base if path]
+    else:
+        ve_bases = [ve_base] if ve_base else []
+    if not ve_bases:
+        raise exceptions.NoVirtualenvsDirectory(
+            "could not figure out a virtualenvs directory. "
+            "make sure $HOME is set, or $WORKON_HOME,"
+            " or set virtualenvs=something in your .vexrc")
+
+    if not ve_name:
+        raise exceptions.InvalidVirtualenv("no virtualenv name")
+
+    # n.b.: if ve_name is absolute, ve_base is discarded by os.path.join,
+    # and an absolute path will be accepted as first arg.
+    # So we check if they gave an absolute path as ve_name.
+    # But we don't want this error if $PWD == $WORKON_HOME,
+    # in which case "foo" is a valid relative path to virtualenv foo.
+    ve_path = os.path.join(ve_bases[0], ve_name)
+    if ve_path == ve_name and os.path.basename(ve_name) != ve_name:
+        raise exceptions.InvalidVirtualenv(
+            "To run in a virtualenv by its path, "
+            "use 'vex --path {0}'".format(ve_path))
+
+    # Namespaced names like "team/service" are fine, as long as they
+    # stay inside the virtualenvs directory.
+    parts = ve_name.replace(os.sep, NAME_SEP).split(NAME_SEP)
+    if os.pardir in parts:
+        raise exceptions.InvalidVirtualenv(
+            "virtualenv names can't contain {0!r}; to run in a virtualenv "
+            "by its path, use 'vex --path'".format(os.pardir))
+
+    # The common case is an exact name: one stat per directory, in
+    # order, and the first hit wins as it would in the index.
+    for base in ve_bases:
+        path = os.path.join(base, ve_name)
+        if os.path.exists(path):
+            return os.path.abspath(path)
+
+    # Using this requires get_ve_base to pass through nonexistent dirs
+    existing = [path for path in ve_bases if os.path.exists(path)]
+    if not existing:
+        message = (
+            "virtualenvs directory {0!r} not found. "
+            "Create it or use vex --make to get started."
+        ).format(os.pathsep.join(ve_bases))
+        raise exceptions.NoVirtualenvsDirectory(message)
+    ve_path = os.path.abspath(os.path.join(existing[0], ve_name))
+    if index is None or not inexact:
+        raise exceptions.InvalidVirtualenv(
+            "no virtualenv found at {0!r}.".format(ve_path))
+    matches, suggestions = index.candidates(ve_name)
+    if len(matches) == 1:
+        return os.path.abspath(index.lookup(matches[0]))
+    if matches:
+        raise exceptions.AmbiguousVirtualenv(
+            "{0!r} could be any of: {1}".format(
+                ve_name, ", ".join(matches)),
+            matches)
+    message = "no virtualenv found at {0!r}.".format(ve_path)
+    if suggestions:
+        message += " Did you mean: {0}?".format(", ".join(suggestions))
+    raise exceptions.InvalidVirtualenv(message)
+
+
+def get_new_virtualenv_path(ve_base, ve_name):
+    """Work out where a new virtualenv called ve_name should go.
+    """
+    if not ve_base:
+        raise exceptions.NoVirtualenvsDirectory(
+            "could not figure out a virtualenvs directory. "
+            "make sure $HOME is set, or $WORKON_HOME,"
+            " or set virtualenvs=something in your .vexrc")
+    parts = ve_name.replace(os.sep, NAME_SEP).split(NAME_SEP)
+    if os.path.isabs(ve_name) or os.pardir in parts:
+        raise exceptions.InvalidVirtualenv(
+            "invalid virtualenv name: {0!r}".format(ve_name))
+    return os.path.abspath(os.path.join(ve_base, ve_name))
@@ -0,0 +1,205 @@
+"""Record when each virtualenv was last used, at almost no cost per run.
+
+Each run appends one short line to a log in its virtualenvs directory's
+store. The log is opened with O_APPEND, so runs at the same time don't
+wait for each other: each line is one write, and lands whole at the end
+of the file. Reading the records folds the log into an index of when
+each virtualenv was last used and how many times, and starts a new log.
+"""
+import os
+import sys
+import json
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from vex.cache import JSONCache
+from vex.index import is_virtualenv, name_for_path
+from vex.lock import FileLock
+from vex.store import STORE_DIR
+
+LOG = "last-used.log"
+INDEX = "last-used.json"
+
+# What compact renames the log to while it folds it into the index.
+_FOLDING = LOG + ".folding"
+
+
+def find_base(ve_bases, ve_path):
+    """Return the directory in ve_bases which ve_path is under, or None.
+    """
+    ve_path = os.path.abspath(ve_path)
+    for ve_base in ve_bases:
+        if not ve_base:
+            continue
+        relative = os.path.relpath(ve_path, os.path.abspath(ve_base))
+        if relative != os.curdir and not relative.startswith(os.pardir):
+            return ve_base
+    return None
+
+
+def record_use(ve_bases, ve_path, now=None):
+    """Note a run in the virtualenv at ve_path in its directory's log.
+
+    Virtualenvs outside ve_bases aren't recorded. Failing to record,
+    say on a read-only directory, is silently ignored.
+    """
+    ve_base = find_base(ve_bases, ve_path)
+    if ve_base is None:
+        return
+    line = "{0} {1}\n".format(
+        int(time.time() if now is None else now),
+        name_for_path([ve_base], ve_path)).encode("utf-8")
+    path = os.path.join(ve_base, STORE_DIR, LOG)
+    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+    # If compact renames the log away between opening and writing it,
+    # and may have read it already, try again with the new log.
+    for _ in range(3):
+        try:
+            try:
+                fd = os.open(path, flags, 0o666)
+            except OSError:
+                # Only the first run in a new directory gets here.
+                os.makedirs(os.path.dirname(path))
+                fd = os.open(path, flags, 0o666)
+        except OSError:
+            return
+        try:
+            _lock(fd, shared=True)
+            if _is_file_at(fd, path):
+                os.write(fd, line)
+                return
+        except OSError:
+            return
+        finally:
+            os.close(fd)
+
+
+def _lock(fd, shared=False):
+    """Lock the file open at fd, until it is closed.
+
+    Writers to the log share the lock; compact waits for them to finish
+    before reading it. Without flock, there is nothing to wait for.
+    """
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+
+def _is_file_at(fd, path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    opened = os.fstat(fd)
+    return (stat.st_dev, stat.st_ino) == (opened.st_dev, opened.st_ino)
+
+
+def fold(lines, index):
+    """Add log lines to index, a dict of name to [last used, runs].
+    """
+    for line in lines:
+        try:
+            when, name = line.decode("utf-8").rstrip("\n").split(" ", 1)
+            when = int(when)
+        except ValueError:
+            # A line cut short by a crash, say.
+            continue
+        last, runs = index.get(name, [0, 0])
+        index[name] = [max(last, when), runs + 1]
+
+
+def compact(ve_base):
+    """Fold ve_base's log into its index.
+
+    Runs logged while this happens go to a new log, to be folded next
+    time. Runs that opened the log before it was renamed finish writing
+    before it is read, and those which would write later see that it
+    was renamed and write to the new log instead.
+
+    :returns:
+        a dict of virtualenv name to [last used time, number of runs].
+    """
+    store = os.path.join(ve_base, STORE_DIR)
+    log = os.path.join(store, LOG)
+    folding = os.path.join(store, _FOLDING)
+    index = JSONCache(os.path.join(store, INDEX))
+    if not os.path.exists(log) and not os.path.exists(folding):
+        return index.load()
+    with FileLock(os.path.join(store, "locks", "last-used")):
+        # One left over from an interrupted compaction is folded first.
+        if not os.path.exists(folding):
+            try:
+                os.rename(log, folding)
+            except OSError:
+                # Someone else just folded it.
+                return index.load()
+        with open(folding, "rb") as inp:
+            _lock(inp.fileno())
+            data = dict(index.load())
+            fold(inp, data)
+        for name, entry in data.items():
+            index[name] = entry
+        index.save()
+        if not index.dirty:
+            os.unlink(folding)
+    return index.load()
+
+
+def forget(ve_base, names):
+    """Drop the index entries of virtualenvs in ve_base which are gone.
+    """
+    store = os.path.join(ve_base, STORE_DIR)
+    index = JSONCache(os.path.join(store, INDEX))
+    with FileLock(os.path.join(store, "locks", "last-used")):
+        for name in names:
+            del index[name]
+        index.save()
+
+
+def last_used(ve_bases):
+    """Compact each directory's log, and merge their indexes.
+
+    :returns:
+        a dict of absolute virtualenv path to [last used, runs].
+    """
+    found = {}
+    for ve_base in ve_bases:
+        if not ve_base or not os.path.isdir(ve_base):
+            continue
+        for name, entry in compact(ve_base).items():
+            path = os.path.abspath(os.path.join(ve_base, name))
+            found[path] = entry
+    return found
+
+
+def format_time(when):
+    if not when:
+        return "never"
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(when))
+
+
+def handle_last_used(ve_bases, index, prefix="", as_json=False):
+    """Print when virtualenvs matching prefix were last used, least
+    recently used first.
+    """
+    records = last_used(ve_bases)
+    rows = []
+    for name in index.names(prefix):
+        path = os.path.abspath(index.lookup(name))
+        if not is_virtualenv(path):
+            continue
+        when, runs = records.get(path, [0, 0])
+        rows.append((when, name, path, runs))
+    rows.sort()
+    for when, name, path, runs in rows:
+        if as_json:
+            line = json.dumps({
+                "name": name, "path": path, "runs": runs,
+                "last_used": when or None}, sort_keys=True)
+        else:
+            line = "{0}\t{1}\t{2}".format(format_time(when), runs, name)
+        sys.stdout.write(line + "\n")
+    return 0
@@ -0,0 +1,65 @@
+"""Where things are inside a virtualenv.
+"""
+import os
+import glob
+import platform
+
+
+def get_ve_bin(ve_path):
+    """Return the directory of a virtualenv's scripts.
+    """
+    if platform.system() == "Windows":
+        return os.path.join(ve_path, "Scripts")
+    return os.path.join(ve_path, "bin")
+
+
+def get_ve_python(ve_path):
+    """Return the path of a virtualenv's python interpreter.
+    """
+    if platform.system() == "Windows":
+        return os.path.join(ve_path, "Scripts", "python.exe")
+    return os.path.join(ve_path, "bin", "python")
+
+
+def get_site_packages(ve_path):
+    """Return existing site-packages directories of a virtualenv.
+
+    Found by looking rather than by asking the virtualenv's python,
+    so it costs no interpreter startup.
+    """
+    patterns = [
+        os.path.join(ve_path, "lib", "python*", "site-packages"),
+        os.path.join(ve_path, "lib64", "python*", "site-packages"),
+        os.path.join(ve_path, "lib", "site-packages"),
+        os.path.join(ve_path, "Lib", "site-packages"),
+        os.path.join(ve_path, "lib_pypy", "site-packages"),
+        os.path.join(ve_path, "site-packages"),
+    ]
+    found = []
+    seen = set()
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            # lib64 is often a symlink to lib.
+            real = os.path.realpath(path)
+            if real in seen or not os.path.isdir(path):
+                continue
+            seen.add(real)
+            found.append(path)
+    return found
+
+
+def read_pyvenv_cfg(ve_path):
+    """Return the settings in a virtualenv's pyvenv.cfg as a dict.
+
+    Returns None if there is no readable pyvenv.cfg.
+    """
+    settings = {}
+    try:
+        with open(os.path.join(ve_path, "pyvenv.cfg"), "rb") as inp:
+            for line in inp:
+                key, sep, value = line.decode("utf-8", "replace").partition("=")
+                if sep:
+                    settings[key.strip().lower()] = value.strip()
+    except (IOError, OSError):
+        return None
+    return settings
@@ -0,0 +1,234 @@
+"""Resource limits and scheduling settings for commands vex runs.
+
+Limits are applied in the child between fork and exec, so they cost
+no extra processes and don't affect vex itself. Where vex may have
+other threads running, as in vex.api, they are applied from the parent
+to the child just after it starts instead.
+"""
+import os
+import math
+from vex import exceptions
+from vex.config import parse_size, parse_duration
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# How long a timed-out command gets to exit after SIGTERM, by default.
+DEFAULT_KILL_AFTER = 10.0
+
+
+def parse_cpus(text):
+    """Parse a CPU list like "0-3,6" into a set of CPU numbers.
+    """
+    cpus = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        try:
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            return None
+        if last < first:
+            return None
+        cpus.update(range(first, last + 1))
+    return cpus or None
+
+
+def _lowered(hard, value, headroom):
+    """Make (soft, hard) limits of value and value + headroom, neither
+    above the existing hard limit, which only a privileged process
+    could raise.
+    """
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+        return value, min(value + headroom, hard)
+    return value, value + headroom
+
+
+def _lower_limit(kind, value, headroom=0):
+    """Set soft limit of kind to value, hard limit to value + headroom.
+    """
+    _, hard = resource.getrlimit(kind)
+    resource.setrlimit(kind, _lowered(hard, value, headroom))
+
+
+class Limits(object):
+    """What to restrict a command to. Unset (None) means don't restrict.
+
+    :param memory: bytes of address space (RLIMIT_AS).
+    :param cpu: seconds of CPU time (RLIMIT_CPU); SIGXCPU is sent then,
+        and SIGKILL a second later.
+    :param files: number of open files (RLIMIT_NOFILE).
+    :param nice: niceness increment.
+    :param cpus: set of CPU numbers to run on.
+    :param timeout: seconds of wall-clock time before SIGTERM.
+    :param kill_after: seconds after SIGTERM before SIGKILL.
+    """
+    def __init__(self, memory=None, cpu=None, files=None, nice=None,
+                 cpus=None, timeout=None, kill_after=DEFAULT_KILL_AFTER):
+        self.memory = memory
+        self.cpu = cpu
+        self.files = files
+        self.nice = nice
+        self.cpus = cpus
+        self.timeout = timeout
+        self.kill_after = kill_after
+
+    def restricts(self):
+        """Tell whether there is anything to apply to the command.
+        """
+        return any(value is not None for value in (
+            self.memory, self.cpu, self.files, self.nice, self.cpus))
+
+    def _rlimits(self):
+        """List (kind, value, headroom) for each resource limit set.
+        """
+        return [
+            (kind, value, headroom) for kind, value, headroom in (
+                ("RLIMIT_AS", self.memory, 0),
+                ("RLIMIT_CPU", self.cpu, 1),
+                ("RLIMIT_NOFILE", self.files, 0),
+            ) if value is not None]
+
+    def _unsupported(self, from_parent):
+        if self._rlimits() and (resource is None or (
+                from_parent and not hasattr(resource, "prlimit"))):
+            return "resource limits are not supported on this platform"
+        renice = "setpriority" if from_parent else "nice"
+        if self.nice is not None and not hasattr(os, renice):
+            return "nice is not supported on this platform"
+        if self.cpus is not None and not hasattr(os, "sched_setaffinity"):
+            return "CPU affinity is not supported on this platform"
+        return None
+
+    def check(self, from_parent=False):
+        """Raise BadConfig if these limits can't be applied here,
+        by apply or, if from_parent is true, by apply_to.
+        """
+        problem = self._unsupported(from_parent)
+        if problem:
+            raise exceptions.BadConfig(problem)
+
+    def can_apply_to(self):
+        """Tell whether apply_to works for these limits here.
+        """
+        return self._unsupported(True) is None
+
+    def explain_failure(self, error=None):
+        """Guess why applying these limits failed: in the child, the
+        error itself is lost, and from the parent, it is just error,
+        an OSError.
+        """
+        if self.cpus is not None and hasattr(os, "sched_getaffinity"):
+            available = os.sched_getaffinity(0)
+            if not self.cpus & available:
+                return "none of CPUs {0} are available (only {1})".format(
+                    ",".join(str(cpu) for cpu in sorted(self.cpus)),
+                    ",".join(str(cpu) for cpu in sorted(available)))
+        if self.nice is not None and self.nice < 0:
+            return "lowering niceness (--nice {0}) needs privileges".format(
+                self.nice)
+        if error is not None and error.strerror:
+            return error.strerror
+        return "a limit is above what this system allows"
+
+    def apply(self):
+        """Apply limits to the current process.
+
+        This runs in the child after fork, so it must be quick and
+        must not touch anything shared with the parent.
+        """
+        for kind, value, headroom in self._rlimits():
+            _lower_limit(getattr(resource, kind), value, headroom)
+        if self.nice is not None:
+            os.nice(self.nice)
+        if self.cpus is not None:
+            os.sched_setaffinity(0, self.cpus)
+
+    def apply_to(self, pid):
+        """Apply limits to the process pid, which has just started.
+
+        Unlike apply, this is safe with other threads running, but the
+        command goes unrestricted for the moment before it is called.
+        Raises OSError if a limit can't be applied.
+        """
+        for kind, value, headroom in self._rlimits():
+            kind = getattr(resource, kind)
+            _, hard = resource.prlimit(pid, kind)
+            resource.prlimit(pid, kind, _lowered(hard, value, headroom))
+        if self.nice is not None:
+            current = os.getpriority(os.PRIO_PROCESS, pid)
+            os.setpriority(os.PRIO_PROCESS, pid, current + self.nice)
+        if self.cpus is not None:
+            os.sched_setaffinity(pid, self.cpus)
+
+
+def _get_setting(options, settings, name, parse, description):
+    """Get a setting from options or, failing that, vexrc's limits.
+    """
+    value = getattr(options, "limit_" + name, None)
+    if value is None:
+        value = settings.get(name)
+    if value is None or value == "":
+        return None
+    parsed = parse(value)
+    if parsed is None:
+        raise exceptions.BadConfig(
+            "invalid {0}: {1!r}".format(description, value))
+    return parsed
+
+
+def _parse_int(text):
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+def _parse_seconds(text):
+    """Parse a CPU time limit, in whole seconds as RLIMIT_CPU takes.
+
+    Fractions round up, so 0.5 doesn't become a limit of 0; a limit of
+    0 itself is refused.
+    """
+    seconds = parse_duration(text)
+    if seconds is None or seconds <= 0:
+        return None
+    return int(math.ceil(seconds))
+
+
+def get_limits(options, vexrc):
+    """Make Limits from command-line options over the vexrc limits heading.
+
+    :returns:
+        a Limits instance, or None if nothing is limited.
+    """
+    settings = vexrc["limits"] or {}
+    limits = Limits(
+        memory=_get_setting(
+            options, settings, "memory", parse_size, "memory limit"),
+        cpu=_get_setting(
+            options, settings, "cpu", _parse_seconds, "CPU time limit"),
+        files=_get_setting(
+            options, settings, "files", _parse_int, "open files limit"),
+        nice=_get_setting(
+            options, settings, "nice", _parse_int, "nice level"),
+        cpus=_get_setting(
+            options, settings, "cpus", parse_cpus, "CPU list"),
+        timeout=_get_setting(
+            options, settings, "timeout", parse_duration, "timeout"),
+    )
+    kill_after = _get_setting(
+        options, settings, "kill_after", parse_duration, "kill delay")
+    if kill_after is not None:
+        limits.kill_after = kill_after
+    if not limits.restricts() and limits.timeout is None:
+        return None
+    limits.check()
+    return limits
@@ -0,0 +1,79 @@
+"""Make files share storage: hardlinks, and reflinks where supported.
+
+A reflink is a copy that shares the original's blocks until either is
+written, so unlike a hardlink the two stay separate files.
+"""
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl number of FICLONE on Linux, from linux/fs.h.
+FICLONE = 0x40049409
+
+
+def reflink(source, destination):
+    """Make destination a reflink copy of source.
+
+    Raises OSError if the platform or filesystem doesn't support it,
+    or if source and destination are on different filesystems.
+    """
+    if fcntl is None or not hasattr(fcntl, "ioctl"):
+        raise OSError("reflinks are not supported on this platform")
+    with open(source, "rb") as inp:
+        with open(destination, "wb") as out:
+            try:
+                fcntl.ioctl(out.fileno(), FICLONE, inp.fileno())
+            except (IOError, OSError):
+                out.close()
+                os.unlink(destination)
+                raise
+    shutil.copystat(source, destination)
+
+
+def replace_with_link(path, target, use_reflink=False):
+    """Atomically replace the file at path by a link to target.
+
+    The link is made under a temporary name in path's directory and
+    renamed over path, so path never stops existing or has partial
+    contents, even if this is interrupted.
+    """
+    parent = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=parent, prefix=".vex-link-")
+    os.close(fd)
+    try:
+        os.unlink(temp_path)
+        if use_reflink:
+            reflink(target, temp_path)
+        else:
+            os.link(target, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.lexists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def clone_file(source, destination):
+    """Copy a file as cheaply as possible: by reflink, else hardlink,
+    else by copying its contents.
+
+    :returns:
+        "reflink", "hardlink" or "copy", for what was done.
+    """
+    try:
+        reflink(source, destination)
+        return "reflink"
+    except (IOError, OSError):
+        pass
+    try:
+        os.link(source, destination)
+        return "hardlink"
+    except OSError:
+        pass
+    shutil.copy2(source, destination)
+    return "copy"
@@ -2,13 +2,32 @@
 """
 import sys
 import os
-import shutil
 from vex import config
+from vex.cache import JSONCache, open_cache
+from vex.index import VirtualenvIndex, name_for_path
+from vex.index import get_virtualenv_path, get_new_virtualenv_path
 from vex.options import get_options
 from vex.run import get_environ, run
+from vex.which import ExecutableCache
+from vex.report import get_report_destination, make_record, write_record
+from vex.limits import get_limits
 from vex.shell_config import handle_shell_config
 from vex.make import handle_make
+from vex.wheelhouse import handle_install
+from vex.store import PackageStore, STORE_DIR
+from vex.ensure import handle_ensure
 from vex.remove import handle_remove
+from vex.relocate import handle_clone, handle_rename
+from vex.archive import handle_export, handle_import
+from vex.sync import handle_sync
+from vex.precompile import handle_compile, parse_levels
+from vex.warm import handle_warm, record_imports
+from vex.check import handle_check
+from vex.usage import handle_usage
+from vex.dedupe import handle_dedupe
+from vex.lastused import handle_last_used, record_use
+from vex.gc import get_policy, handle_gc
+from vex.batch import handle_batch
 from vex import exceptions
 from vex._version import VERSION
 
@@ -27,6 +46,26 @@ def get_vexrc(options, environ):
         )
     filename = options.config or os.path.expanduser("~/.vexrc")
     vexrc = config.Vexrc.from_file(filename, environ)
+    # Only the user's own config can say which projects to trust; a
+    # .vexrc in any checkout could otherwise set what vex runs.
+    trusted = vexrc.get_trusted_dirs()
+    if options.no_project_config or not trusted:
+        return vexrc
+    # Layer any .vexrc files found above the working directory over the
+    # user's config, nearest last, as git does with its config files.
+    cache = open_cache(vexrc.get_cache_dir(environ), "vexrc-dirs")
+    user_path = os.path.abspath(filename)
+    for path in config.find_project_vexrcs(options.cwd or ".", cache):
+        if path == user_path or not config.is_trusted(path, trusted):
+            continue
+        # Don't let someone else's checkout configure what we run.
+        if not config.owned_by_user(path):
+            sys.stderr.write(
+                "Warning: ignoring {0!r} owned by another user\n"
+                .format(path))
+            continue
+        vexrc.read(path, environ)
+    cache.save()
     return vexrc
 
 
@@ -53,44 +92,6 @@ def get_virtualenv_name(options):
     return ve_name
 
 
-def get_virtualenv_path(ve_base, ve_name):
-    """Check a virtualenv path, raising exceptions to explain problems.
-    """
-    if not ve_base:
-        raise exceptions.NoVirtualenvsDirectory(
-            "could not figure out a virtualenvs directory. "
-            "make sure $HOME is set, or $WORKON_HOME,"
-            " or set virtualenvs=something in your .vexrc")
-
-    # Using this requires get_ve_base to pass through nonexistent dirs
-    if not os.path.exists(ve_base):
-        message = (
-            "virtualenvs directory {0!r} not found. "
-            "Create it or use vex --make to get started."
-        ).format(ve_base)
-        raise exceptions.NoVirtualenvsDirectory(message)
-
-    if not ve_name:
-        raise exceptions.InvalidVirtualenv("no virtualenv name")
-
-    # n.b.: if ve_name is absolute, ve_base is discarded by os.path.join,
-    # and an absolute path will be accepted as first arg.
-    # So we check if they gave an absolute path as ve_name.
-    # But we don't want this error if $PWD == $WORKON_HOME,
-    # in which case "foo" is a valid relative path to virtualenv foo.
-    ve_path = os.path.join(ve_base, ve_name)
-    if ve_path == ve_name and os.path.basename(ve_name) != ve_name:
-        raise exceptions.InvalidVirtualenv(
-            "To run in a virtualenv by its path, "
-            "use 'vex --path {0}'".format(ve_path))
-
-    ve_path = os.path.abspath(ve_path)
-    if not os.path.exists(ve_path):
-        raise exceptions.InvalidVirtualenv(
-            "no virtualenv found at {0!r}.".format(ve_path))
-    return ve_path
-
-
 def get_command(options, vexrc, environ):
     """Get a command to run.
 
@@ -109,27 +110,64 @@ def get_command(options, vexrc, environ):
     return command
 
 
+def get_ensure_python(options, vexrc, environ, executables):
+    """Find the python that --ensure should make a virtualenv with.
+    """
+    name = options.python or vexrc.get_default_python(environ) or "python3"
+    python = executables.find(name, environ.get("PATH"))
+    if not python:
+        raise exceptions.InvalidVirtualenv(
+            "the python for --ensure isn't executable: {0!r}".format(name))
+    return python
+
+
+def get_package_store(options, ve_base):
+    """Get the PackageStore to install into, if options ask for one.
+    """
+    if not options.share_packages:
+        return None
+    return PackageStore(os.path.join(ve_base, STORE_DIR))
+
+
+def wants_command(options):
+    """Decide whether to run a command after the virtualenv is ready.
+
+    Maintenance operations like --compile are enough on their own;
+    they only run a command if one was given.
+    """
+    if options.batch is not None:
+        return False
+    if options.rest:
+        return True
+    return not (options.compile or options.warm)
+
+
 def handle_version():
     sys.stdout.write(VERSION + "\n")
     return 0
 
 
-def handle_list(ve_base, prefix=""):
-    if not os.path.isdir(ve_base):
-        sys.stderr.write("no virtualenvs directory at {0!r}\n".format(ve_base))
+def handle_list(ve_base, prefix="", index=None):
+    ve_bases = ve_base if isinstance(ve_base, (list, tuple)) else [ve_base]
+    existing = [path for path in ve_bases if os.path.isdir(path)]
+    if not existing:
+        sys.stderr.write("no virtualenvs directory at {0!r}\n".format(
+            os.pathsep.join(ve_bases)))
         return 1
-    text = "\n".join(
-        sorted(
-            relative_path for relative_path in os.listdir(ve_base)
-            if (not relative_path.startswith("-"))
-            and relative_path.startswith(prefix)
-            and os.path.isdir(os.path.join(ve_base, relative_path))
-        )
-    )
+    if index is None:
+        index = VirtualenvIndex(existing, JSONCache(None))
+    text = "\n".join(index.names(prefix))
     sys.stdout.write(text + "\n")
     return 0
 
 
+def get_index(vexrc, environ):
+    """Get an index of the virtualenvs in all configured directories.
+    """
+    cache = open_cache(vexrc.get_cache_dir(environ), "index")
+    return VirtualenvIndex(vexrc.get_ve_bases(environ), cache)
+
+
 def _main(environ, argv):
     """Logic for main(), with less direct system interaction.
 
@@ -140,42 +178,131 @@ def _main(environ, argv):
     if options.version:
         return handle_version()
     vexrc = get_vexrc(options, environ)
+    if options.show_config:
+        sys.stdout.write(vexrc.dump())
+        return 0
     # Handle --shell-config as soon as its arguments are available.
     if options.shell_to_configure:
         return handle_shell_config(options.shell_to_configure, vexrc, environ)
     if options.list is not None:
-        return handle_list(vexrc.get_ve_base(environ), options.list)
+        return handle_list(
+            vexrc.get_ve_bases(environ), options.list,
+            get_index(vexrc, environ))
+    if options.check is not None:
+        return handle_check(
+            get_index(vexrc, environ),
+            open_cache(vexrc.get_cache_dir(environ), "check"),
+            options.check, options.jobs, options.json)
+    if options.disk_usage is not None:
+        return handle_usage(
+            get_index(vexrc, environ),
+            open_cache(vexrc.get_cache_dir(environ), "usage"),
+            options.disk_usage, options.jobs, options.json)
+    if options.dedupe is not None:
+        return handle_dedupe(
+            get_index(vexrc, environ),
+            open_cache(vexrc.get_cache_dir(environ), "hashes"),
+            options.dedupe, options.jobs, options.dry_run, options.reflink,
+            open_cache(vexrc.get_cache_dir(environ), "usage"))
+    if options.last_used is not None:
+        return handle_last_used(
+            vexrc.get_ve_bases(environ), get_index(vexrc, environ),
+            options.last_used, options.json)
+    if options.gc:
+        ve_bases = vexrc.get_ve_bases(environ)
+        return handle_gc(
+            ve_bases[0] if ve_bases else "", get_index(vexrc, environ),
+            open_cache(vexrc.get_cache_dir(environ), "usage"),
+            get_policy(options, vexrc), options.jobs, options.dry_run)
+    if options.clone or options.rename:
+        source_name, new_name = options.clone or options.rename
+        ve_bases = vexrc.get_ve_bases(environ)
+        source = get_virtualenv_path(
+            ve_bases, source_name, get_index(vexrc, environ))
+        destination = get_new_virtualenv_path(
+            ve_bases[0] if ve_bases else "", new_name)
+        handler = handle_clone if options.clone else handle_rename
+        return handler(
+            source, destination, options.jobs,
+            open_cache(vexrc.get_cache_dir(environ), "usage"))
+    if options.sync:
+        source, destination = options.sync
+        return handle_sync(
+            source, destination, options.jobs, options.prune,
+            options.dry_run)
+    if options.export:
+        source = get_virtualenv_path(
+            vexrc.get_ve_bases(environ), options.export,
+            get_index(vexrc, environ))
+        return handle_export(source, options.output, options.compress)
+    if options.import_archive:
+        archive, new_name = options.import_archive
+        ve_bases = vexrc.get_ve_bases(environ)
+        destination = get_new_virtualenv_path(
+            ve_bases[0] if ve_bases else "", new_name)
+        return handle_import(archive, destination, options.jobs)
 
     # Do as much as possible before a possible make, so errors can raise
     # without leaving behind an unused virtualenv.
     # get_virtualenv_name is destructive and must happen before get_command
     cwd = get_cwd(options)
-    ve_base = vexrc.get_ve_base(environ)
-    ve_name = get_virtualenv_name(options)
-    command = get_command(options, vexrc, environ)
+    ve_bases = vexrc.get_ve_bases(environ)
+    ve_base = ve_bases[0] if ve_bases else ""
+    if options.ensure:
+        if options.make or options.path or options.remove:
+            raise exceptions.InvalidArgument(
+                "--ensure can't be used with --make, --path or --remove")
+        ve_name = None
+    else:
+        ve_name = get_virtualenv_name(options)
+    command = None
+    if wants_command(options):
+        command = get_command(options, vexrc, environ)
+    if options.batch is not None and (options.rest or options.warm_record):
+        raise exceptions.InvalidArgument(
+            "--batch reads its commands, so don't give one or --warm-record")
+    if options.share_packages and not options.wheelhouse:
+        raise exceptions.InvalidArgument(
+            "--share-packages needs --wheelhouse")
+    if options.requirements and not (options.make and options.wheelhouse):
+        raise exceptions.InvalidArgument(
+            "--requirements needs --make and --wheelhouse")
+    levels = parse_levels(options.optimize) if options.optimize else None
+    limits = get_limits(options, vexrc)
+    executables = ExecutableCache(
+        open_cache(vexrc.get_cache_dir(environ), "executables"))
     # Either we create ve_path, get it from options.path or find it
     # in ve_base.
-    if options.make:
+    status = 0
+    if options.ensure:
+        python = get_ensure_python(options, vexrc, environ, executables)
+        ve_path = handle_ensure(
+            environ, options, ve_base, python,
+            open_cache(vexrc.get_cache_dir(environ), "interpreters"))
+    elif options.make:
         if options.path:
             make_path = os.path.abspath(options.path)
         else:
             make_path = os.path.abspath(os.path.join(ve_base, ve_name))
         if options.python is None:
             options.python = vexrc.get_default_python(environ)
-            if options.python and hasattr(shutil, "which"):
-                if not shutil.which(options.python):
-                    raise exceptions.InvalidVirtualenv(
-                        "the python specified in vexrc isn't executable: "
-                        "{!r}".format(options.python)
-                    )
-        elif hasattr(shutil, "which"):
-            if not shutil.which(options.python):
+            if options.python and not executables.find(
+                    options.python, environ.get("PATH")):
                 raise exceptions.InvalidVirtualenv(
-                    "the python specified by --python isn't executable: "
+                    "the python specified in vexrc isn't executable: "
                     "{!r}".format(options.python)
                 )
+        elif not executables.find(options.python, environ.get("PATH")):
+            raise exceptions.InvalidVirtualenv(
+                "the python specified by --python isn't executable: "
+                "{!r}".format(options.python)
+            )
         handle_make(environ, options, make_path)
         ve_path = make_path
+        if options.requirements:
+            status = handle_install(
+                environ, ve_path, options.wheelhouse, options.requirements,
+                options.jobs, get_package_store(options, ve_base))
     elif options.path:
         ve_path = os.path.abspath(options.path)
         if not os.path.exists(ve_path) or not os.path.isdir(ve_path):
@@ -183,16 +310,53 @@ def _main(environ, argv):
                 "argument for --path is not a directory")
     else:
         try:
-            ve_path = get_virtualenv_path(ve_base, ve_name)
+            # Don't guess which virtualenv was meant if it's to be removed.
+            ve_path = get_virtualenv_path(
+                ve_bases, ve_name, get_index(vexrc, environ),
+                inexact=not options.remove)
         except exceptions.NoVirtualenvName:
             options.print_help()
             raise
     # get_environ has to wait until ve_path is defined, which might
     # be after a make; of course we can't run until we have env.
-    env = get_environ(environ, vexrc["env"], ve_path)
-    returncode = run(command, env=env, cwd=cwd)
-    if options.remove:
-        handle_remove(ve_path)
+    env_name = name_for_path(ve_bases, ve_path)
+    env = get_environ(environ, vexrc.get_env(env_name), ve_path)
+    make_report = None
+    destination = get_report_destination(options, vexrc)
+    if destination:
+        def make_report(command):
+            def report(returncode, started, elapsed, rusage):
+                record = make_record(
+                    command, ve_path, returncode, started, elapsed, rusage)
+                write_record(record, destination)
+            return report
+    try:
+        if options.compile:
+            status = max(status, handle_compile(
+                environ, ve_path, options.jobs, levels, options.checked_hash))
+        if options.warm:
+            status = max(status, handle_warm(
+                ve_path, options.jobs, options.warm_list))
+        if options.batch is not None:
+            record_use(ve_bases, ve_path)
+            return max(status, handle_batch(
+                options.batch, env, cwd, executables, limits, options.jobs,
+                options.null, options.keep_going, options.json, make_report))
+        if command is None:
+            return status
+        record_use(ve_bases, ve_path)
+        report = make_report(command) if make_report else None
+        if options.warm_record:
+            returncode = record_imports(
+                command, env, cwd, options.warm_record, executables,
+                report, limits)
+        else:
+            returncode = run(
+                command, env=env, cwd=cwd, executables=executables,
+                report=report, limits=limits)
+    finally:
+        if options.remove:
+            handle_remove(ve_path)
     if returncode is None:
         raise exceptions.InvalidCommand(
             "command not found: {0!r}".format(command[0]))
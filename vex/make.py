@@ -1,7 +1,7 @@
 import os
 import sys
-import distutils.spawn
 from vex.run import run
+from vex.which import find_executable
 from vex import exceptions
 
 
@@ -25,7 +25,8 @@ def handle_make(environ, options, make_path):
         )
     ve_base = os.path.dirname(make_path)
     if not os.path.exists(ve_base):
-        os.mkdir(ve_base)
+        # makedirs, since a namespaced name may need its groups made too.
+        os.makedirs(ve_base)
     elif not os.path.isdir(ve_base):
         raise exceptions.VirtualenvNotMade(
             "could not make virtualenv: "
@@ -47,7 +48,7 @@ def handle_make(environ, options, make_path):
     args = [ve, make_path]
     if options.python:
         if os.name == "nt":
-            python = distutils.spawn.find_executable(options.python)
+            python = find_executable(options.python, environ.get("PATH"))
             if python:
                 options.python = python
         args += ["--python", options.python]
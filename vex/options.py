@@ -32,6 +32,162 @@ def make_arg_parser():
         help="use copies instead of symlinks in new virtualenv",
         action="store_true",
     )
+    make.add_argument(
+        "--requirements",
+        metavar="FILE",
+        default=None,
+        help="install requirements in FILE into the new virtualenv,\n"
+             "from the --wheelhouse directory only"
+    )
+    make.add_argument(
+        "--wheelhouse",
+        metavar="DIR",
+        default=None,
+        help="directory of wheels for --requirements"
+    )
+    make.add_argument(
+        "--share-packages",
+        action="store_true",
+        help="with --wheelhouse, link to one shared copy of each wheel\n"
+             "kept in the virtualenvs directory, instead of copying"
+    )
+
+    ensure = parser.add_argument_group(
+        title="To use a shared virtualenv made from requirements")
+    ensure.add_argument(
+        "--ensure",
+        metavar="FILE",
+        default=None,
+        help="run in the virtualenv for requirements FILE and --python,\n"
+             "making it first if nobody has yet (no name needed)"
+    )
+
+    maintain = parser.add_argument_group(
+        title="To maintain a virtualenv (no command needed)")
+    maintain.add_argument(
+        "--compile",
+        action="store_true",
+        help="compile site-packages to bytecode (after --make, if given)"
+    )
+    maintain.add_argument(
+        "--optimize",
+        metavar="LEVELS",
+        default=None,
+        help="with --compile, optimization levels to compile for,"
+             " e.g. 0,1,2"
+    )
+    maintain.add_argument(
+        "--checked-hash",
+        action="store_true",
+        help="with --compile, make .pyc files checked by source hash"
+             " instead of mtime"
+    )
+    maintain.add_argument(
+        "--warm",
+        action="store_true",
+        help="read the virtualenv's and its python's files into the\n"
+             "page cache, so the next command starts faster"
+    )
+    maintain.add_argument(
+        "--warm-list",
+        metavar="FILE",
+        default=None,
+        help="with --warm, warm only the files listed in FILE"
+    )
+    maintain.add_argument(
+        "--warm-record",
+        metavar="FILE",
+        default=None,
+        help="while running the command, record the files Python\n"
+             "imports in FILE, for use with --warm-list"
+    )
+    maintain.add_argument(
+        "-j", "--jobs",
+        metavar="N",
+        type=int,
+        default=None,
+        help="number of parallel workers (default: number of CPUs;\n"
+             "with --batch, 1)"
+    )
+
+    batch = parser.add_argument_group(
+        title="To run many commands in one virtualenv")
+    batch.add_argument(
+        "--batch",
+        metavar="FILE",
+        default=None,
+        help="run each command in FILE (- for stdin), one per line,\n"
+             "reporting each one's exit status and duration on stderr"
+    )
+    batch.add_argument(
+        "-0", "--null",
+        action="store_true",
+        help="with --batch, commands are separated by NULs, not newlines"
+    )
+    batch.add_argument(
+        "--keep-going",
+        action="store_true",
+        help="with --batch, carry on running commands after one fails"
+    )
+
+    copy = parser.add_argument_group(
+        title="To copy or rename a virtualenv (no command needed)")
+    copy.add_argument(
+        "--clone",
+        metavar=("SOURCE", "NEW"),
+        nargs=2,
+        default=None,
+        help="copy virtualenv SOURCE to a new virtualenv NEW"
+    )
+    copy.add_argument(
+        "--rename",
+        metavar=("OLD", "NEW"),
+        nargs=2,
+        default=None,
+        help="rename virtualenv OLD to NEW"
+    )
+    copy.add_argument(
+        "--sync",
+        metavar=("SOURCE", "DEST"),
+        nargs=2,
+        default=None,
+        help="copy changes to the virtualenvs in directory SOURCE\n"
+             "to directory DEST"
+    )
+    copy.add_argument(
+        "--prune",
+        action="store_true",
+        help="with --sync, remove virtualenvs SOURCE doesn't have"
+    )
+    copy.add_argument(
+        "--export",
+        metavar="NAME",
+        default=None,
+        help="write virtualenv NAME to stdout as a tar archive"
+    )
+    copy.add_argument(
+        "--import",
+        dest="import_archive",
+        metavar=("ARCHIVE", "NAME"),
+        nargs=2,
+        default=None,
+        help="make virtualenv NAME from a --export archive\n"
+             "(ARCHIVE may be - for stdin)"
+    )
+    copy.add_argument(
+        "--output",
+        metavar="FILE",
+        default=None,
+        help="with --export, write the archive to FILE instead"
+    )
+    copy.add_argument(
+        "--compress",
+        choices=("gz", "bz2", "xz"),
+        nargs="?",
+        const="gz",
+        default=None,
+        help="with --export, compress the archive (default: gz)"
+    )
 
     remove = parser.add_argument_group(title="To remove a virtualenv")
     remove.add_argument(
@@ -39,6 +195,81 @@ def make_arg_parser():
         action="store_true",
         help="remove the named virtualenv after running command"
     )
+    remove.add_argument(
+        "--gc",
+        action="store_true",
+        help="remove the least recently used virtualenvs as set in\n"
+             "the gc heading of .vexrc (no command needed)"
+    )
+    remove.add_argument(
+        "--max-total-size",
+        metavar="SIZE",
+        default=None,
+        help="with --gc, remove virtualenvs until they use at most SIZE"
+    )
+    remove.add_argument(
+        "--max-age",
+        metavar="AGE",
+        default=None,
+        help="with --gc, remove virtualenvs unused for longer than AGE"
+    )
+
+    report = parser.add_argument_group(title="To report resource usage")
+    report.add_argument(
+        "--report",
+        action="store_true",
+        help="print the command's time, CPU and memory use on stderr"
+    )
+    report.add_argument(
+        "--report-file",
+        metavar="FILE",
+        action="store",
+        default=None,
+        help="append the command's resource use to FILE as a JSON line"
+    )
+
+    limits = parser.add_argument_group(
+        title="To limit the command's resources")
+    limits.add_argument(
+        "--limit-memory",
+        metavar="SIZE",
+        help="limit address space, e.g. 2G (RLIMIT_AS)"
+    )
+    limits.add_argument(
+        "--limit-cpu",
+        metavar="SECONDS",
+        help="limit CPU time, rounded up to whole seconds (RLIMIT_CPU)"
+    )
+    limits.add_argument(
+        "--limit-files",
+        metavar="N",
+        help="limit number of open files (RLIMIT_NOFILE)"
+    )
+    limits.add_argument(
+        "--nice",
+        metavar="N",
+        dest="limit_nice",
+        help="run the command with niceness increased by N"
+    )
+    limits.add_argument(
+        "--cpus",
+        metavar="LIST",
+        dest="limit_cpus",
+        help="run the command only on these CPUs, e.g. 0-3,6"
+    )
+    limits.add_argument(
+        "--timeout",
+        metavar="SECONDS",
+        dest="limit_timeout",
+        help="send SIGTERM to the command after this long"
+    )
+    limits.add_argument(
+        "--kill-after",
+        metavar="SECONDS",
+        dest="limit_kill_after",
+        help="send SIGKILL this long after a --timeout SIGTERM"
+             " (default: 10)"
+    )
 
     parser.add_argument(
         "--path",
@@ -60,6 +291,16 @@ def make_arg_parser():
         action="store",
         help="path to config file to read (default: '~/.vexrc')"
     )
+    parser.add_argument(
+        "--no-project-config",
+        action="store_true",
+        help="don't read .vexrc files from --cwd and its parents"
+    )
+    parser.add_argument(
+        "--show-config",
+        action="store_true",
+        help="print the effective config and where each value came from"
+    )
     parser.add_argument(
         "--shell-config",
         metavar="SHELL",
@@ -77,6 +318,63 @@ def make_arg_parser():
         help="print a list of available virtualenvs [matching PREFIX]",
         action="store"
     )
+    parser.add_argument(
+        "--check",
+        metavar="PREFIX",
+        nargs="?",
+        const="",
+        default=None,
+        help="check virtualenvs [matching PREFIX] for broken pythons,\n"
+             "symlinks and scripts, without running them",
+        action="store"
+    )
+    parser.add_argument(
+        "--disk-usage",
+        metavar="PREFIX",
+        nargs="?",
+        const="",
+        default=None,
+        help="print disk used by virtualenvs [matching PREFIX],\n"
+             "counting hardlinked files once",
+        action="store"
+    )
+    parser.add_argument(
+        "--dedupe",
+        metavar="PREFIX",
+        nargs="?",
+        const="",
+        default=None,
+        help="replace identical files in virtualenvs [matching PREFIX]\n"
+             "with hardlinks to one copy",
+        action="store"
+    )
+    parser.add_argument(
+        "--last-used",
+        metavar="PREFIX",
+        nargs="?",
+        const="",
+        default=None,
+        help="print when virtualenvs [matching PREFIX] were last used\n"
+             "and how often, least recently used first",
+        action="store"
+    )
+    parser.add_argument(
+        "--reflink",
+        action="store_true",
+        help="with --dedupe, use reflinks (copy-on-write copies)\n"
+             "instead of hardlinks"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="with --dedupe, --sync or --gc, only print what would be done"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="with --check, --disk-usage, --last-used or --batch,\n"
+             "print results as JSON lines"
+    )
     parser.add_argument(
         "--version",
         help="print the version of vex that is being run",
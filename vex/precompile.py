@@ -0,0 +1,70 @@
+"""Compile a virtualenv's modules to bytecode ahead of time.
+
+Otherwise each module is compiled the first time it is imported,
+which makes the first run in a new virtualenv slow.
+"""
+import sys
+import time
+from vex import exceptions
+from vex.layout import get_ve_python, get_site_packages
+from vex.run import get_environ, run
+
+
+def parse_levels(text):
+    """Parse optimization levels like "0,1,2" into a list of ints.
+    """
+    levels = []
+    for part in text.split(","):
+        part = part.strip()
+        if part not in ("0", "1", "2"):
+            raise exceptions.InvalidArgument(
+                "optimization levels must be 0, 1 or 2: {0!r}".format(text))
+        if int(part) not in levels:
+            levels.append(int(part))
+    return levels
+
+
+def compile_command(python, dirs, jobs=None, levels=None,
+                    checked_hash=False):
+    """Make the command to compile dirs with the given python.
+
+    jobs of 0 or None means as many workers as CPUs.
+    """
+    args = [python, "-m", "compileall", "-q", "-j", str(jobs or 0)]
+    for level in levels or ():
+        args += ["-o", str(level)]
+    if checked_hash:
+        args += ["--invalidation-mode", "checked-hash"]
+    return args + list(dirs)
+
+
+def handle_compile(environ, ve_path, jobs=None, levels=None,
+                   checked_hash=False, paths=None):
+    """Compile everything in the virtualenv's site-packages.
+
+    This uses the virtualenv's own python, since bytecode is specific to
+    the interpreter version. Failures to compile individual files, e.g.
+    for another python version, are reported by compileall but are not
+    fatal. If paths are given, only those files and directories are
+    compiled.
+    """
+    dirs = paths or get_site_packages(ve_path)
+    if not dirs:
+        sys.stderr.write(
+            "no site-packages found in {0!r}\n".format(ve_path))
+        return 1
+    command = compile_command(
+        get_ve_python(ve_path), dirs, jobs, levels, checked_hash)
+    env = get_environ(environ, {}, ve_path)
+    started = time.time()
+    returncode = run(command, env=env, cwd=None)
+    if returncode is None:
+        raise exceptions.InvalidVirtualenv(
+            "no python found in {0!r}".format(ve_path))
+    if len(dirs) > 3:
+        what = "{0} paths".format(len(dirs))
+    else:
+        what = ", ".join(dirs)
+    sys.stderr.write("compiled {0} in {1:.2f}s\n".format(
+        what, time.time() - started))
+    return returncode
@@ -0,0 +1,236 @@
+"""Copy or move virtualenvs, fixing the paths that tie them to a place.
+
+Making a virtualenv writes its own absolute path into its scripts'
+shebangs, its activate scripts and a few other files, so after being
+copied or moved those still refer to the old place until rewritten.
+"""
+import os
+import re
+import sys
+import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from vex import exceptions
+from vex.layout import get_ve_bin, get_site_packages
+from vex.links import clone_file
+from vex.usage import forget_usage
+from vex.store import read_packages_record, write_packages_record
+from vex.walk import default_jobs, walk
+
+# Files outside bin which can hold the virtualenv's path.
+_PATH_FILE_SUFFIXES = (".pth", ".egg-link")
+
+# Anything bigger in bin is surely not a script.
+_MAX_SCRIPT_SIZE = 1 << 20
+
+
+def _prefixes(ve_path):
+    """Return the forms of ve_path that files in it might contain.
+    """
+    prefixes = [os.path.abspath(ve_path)]
+    real = os.path.realpath(ve_path)
+    if real not in prefixes:
+        prefixes.append(real)
+    return prefixes
+
+
+def prefix_pattern(old):
+    """Make a regex matching the path old, but not a longer name
+    beginning with it, like old + "-2".
+    """
+    return re.compile(
+        re.escape(old.encode("utf-8")) + br"(?![A-Za-z0-9._+-])")
+
+
+def path_patterns(old):
+    """Make the regexes matching any form of the path old.
+    """
+    return [prefix_pattern(prefix) for prefix in _prefixes(old)]
+
+
+def find_path_files(ve_path):
+    """List files in a virtualenv that might contain its path.
+    """
+    paths = []
+    for entry in os.scandir(ve_path):
+        if entry.is_file(follow_symlinks=False):
+            paths.append(entry.path)
+    bin_path = get_ve_bin(ve_path)
+    if os.path.isdir(bin_path):
+        for entry in os.scandir(bin_path):
+            if entry.is_file(follow_symlinks=False):
+                paths.append(entry.path)
+    for site_packages in get_site_packages(ve_path):
+        for entry in os.scandir(site_packages):
+            if entry.name.endswith(_PATH_FILE_SUFFIXES) and \
+                    entry.is_file(follow_symlinks=False):
+                paths.append(entry.path)
+    return paths
+
+
+def rewrite_file(path, patterns, new):
+    """Replace matches of patterns in the file at path with new.
+
+    Binary files and files with no matches are left alone. The
+    new contents are written to a new file renamed over the old, which
+    also separates a hardlinked file from the original.
+
+    :returns:
+        True if the file was rewritten.
+    """
+    try:
+        if os.path.getsize(path) > _MAX_SCRIPT_SIZE:
+            return False
+        with open(path, "rb") as inp:
+            data = inp.read()
+    except (IOError, OSError):
+        return False
+    if b"\0" in data:
+        return False
+    replacement = new.encode("utf-8")
+    changed = data
+    for pattern in patterns:
+        changed = pattern.sub(lambda match: replacement, changed)
+    if changed == data:
+        return False
+    temp_path = path + ".vex-tmp"
+    with open(temp_path, "wb") as out:
+        out.write(changed)
+    shutil.copystat(path, temp_path)
+    os.replace(temp_path, path)
+    return True
+
+
+def rewrite_paths(ve_path, old, jobs=None, location=None):
+    """Change references to old in the virtualenv at ve_path to ve_path,
+    or to location if it is going to be moved there.
+
+    :returns:
+        the number of files rewritten.
+    """
+    patterns = path_patterns(old)
+    new = os.path.abspath(location or ve_path)
+    with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+        results = executor.map(
+            lambda path: rewrite_file(path, patterns, new),
+            find_path_files(ve_path))
+        return sum(1 for rewritten in results if rewritten)
+
+
+def retarget_link(target, old, new):
+    """Point a symlink target under old at the same place under new.
+    """
+    if os.path.isabs(target):
+        relative = os.path.relpath(target, old)
+        if not relative.startswith(os.pardir):
+            return os.path.normpath(os.path.join(new, relative))
+    return target
+
+
+def _copy_symlink(source, destination, old, new):
+    os.symlink(retarget_link(os.readlink(source), old, new), destination)
+
+
+def copy_tree(source, destination, jobs=None):
+    """Copy the tree at source to destination, sharing storage if possible.
+
+    Directories are made as they are listed, and files copied on a
+    pool of workers. Absolute symlinks into source are pointed at the
+    same place in destination.
+    """
+    source = os.path.abspath(source)
+    destination = os.path.abspath(destination)
+    with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+        futures = []
+        for directory, _, nondirs in walk([source], jobs):
+            relative = os.path.relpath(directory, source)
+            target_dir = os.path.normpath(
+                os.path.join(destination, relative))
+            os.mkdir(target_dir)
+            shutil.copymode(directory, target_dir)
+            for entry in nondirs:
+                target = os.path.join(target_dir, entry.name)
+                if entry.is_symlink():
+                    _copy_symlink(entry.path, target, source, destination)
+                else:
+                    futures.append(
+                        executor.submit(clone_file, entry.path, target))
+        for future in futures:
+            future.result()
+
+
+def _move_packages(old, new, keep_old):
+    """Give new the references old has to package store entries.
+    """
+    record = read_packages_record(new)
+    if not record:
+        return
+    store, keys = record
+    for key in keys:
+        store.add_ref(key, new)
+        if not keep_old:
+            store.drop_ref(key, old)
+    write_packages_record(new, store, keys)
+
+
+def check_destination(destination):
+    """Make sure nothing is at destination, and its parent exists.
+    """
+    if os.path.lexists(destination):
+        raise exceptions.VirtualenvAlreadyMade(
+            "virtualenv already exists: {0!r}".format(destination))
+    parent = os.path.dirname(destination)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+
+
+def handle_clone(source, destination, jobs=None, usage_cache=None):
+    """Copy the virtualenv at source to a new one at destination.
+
+    Files may be hardlinked rather than copied, so the disk usage
+    records of both are dropped from usage_cache, if given.
+    """
+    started = time.time()
+    check_destination(destination)
+    try:
+        copy_tree(source, destination, jobs)
+        rewritten = rewrite_paths(destination, source, jobs)
+        _move_packages(source, destination, keep_old=True)
+    except BaseException:
+        if os.path.lexists(destination):
+            shutil.rmtree(destination)
+        raise
+    finally:
+        if usage_cache is not None:
+            forget_usage(usage_cache, [source, destination])
+            usage_cache.save()
+    sys.stderr.write("cloned {0!r} to {1!r}, rewrote {2} files, "
+                     "in {3:.2f}s\n".format(
+                         source, destination, rewritten,
+                         time.time() - started))
+    return 0
+
+
+def handle_rename(source, destination, jobs=None, usage_cache=None):
+    """Move the virtualenv at source to destination.
+
+    Disk usage records of source are dropped from usage_cache, if given.
+    """
+    started = time.time()
+    check_destination(destination)
+    try:
+        os.rename(source, destination)
+    except OSError as error:
+        raise exceptions.InvalidVirtualenv(
+            "could not rename {0!r}: {1}; use --clone and --remove "
+            "to move it to another filesystem".format(source, error))
+    rewritten = rewrite_paths(destination, source, jobs)
+    _move_packages(source, destination, keep_old=False)
+    if usage_cache is not None:
+        forget_usage(usage_cache, [source, destination])
+        usage_cache.save()
+    sys.stderr.write("renamed {0!r} to {1!r}, rewrote {2} files, "
+                     "in {3:.2f}s\n".format(
+                         source, destination, rewritten,
+                         time.time() - started))
+    return 0
@@ -1,6 +1,7 @@
 import os
 import shutil
 from vex import exceptions
+from vex.store import read_packages_record, release_packages
 
 
 def obviously_not_a_virtualenv(path):
@@ -9,6 +10,9 @@ def obviously_not_a_virtualenv(path):
     scripts = os.path.join(path, "Scripts")
     if not os.path.exists(bin) and not os.path.exists(scripts):
         return True
+    # Newer virtualenv versions leave include empty, but write pyvenv.cfg.
+    if os.path.exists(os.path.join(path, "pyvenv.cfg")):
+        return False
     if os.path.exists(include) and not any(
             filename.startswith("py") for filename in os.listdir(include)
     ):
@@ -16,7 +20,7 @@ def obviously_not_a_virtualenv(path):
     return False
 
 
-def handle_remove(ve_path):
+def handle_remove(ve_path, quiet=False):
     if not os.path.exists(ve_path):
         return
     if hasattr(os, "geteuid"):
@@ -33,5 +37,8 @@ def handle_remove(ve_path):
     if obviously_not_a_virtualenv(ve_path):
         raise exceptions.VirtualenvNotRemoved(
             "path {0!r} did not look like a virtualenv".format(ve_path))
-    print("Removing {0!r}".format(ve_path))
+    if not quiet:
+        print("Removing {0!r}".format(ve_path))
+    packages = read_packages_record(ve_path)
     shutil.rmtree(ve_path)
+    release_packages(packages, ve_path)
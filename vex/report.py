@@ -0,0 +1,67 @@
+"""Reports of what a command run by vex cost, from its rusage.
+"""
+import os
+import sys
+import json
+import platform
+
+
+def make_record(command, ve_path, returncode, started, elapsed, rusage):
+    """Make a dict describing one finished run.
+    """
+    max_rss = rusage.ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    if platform.system() == "Darwin":
+        max_rss //= 1024
+    return {
+        "command": list(command),
+        "virtualenv": ve_path,
+        "returncode": returncode,
+        "started": started,
+        "wall": round(elapsed, 6),
+        "user": round(rusage.ru_utime, 6),
+        "system": round(rusage.ru_stime, 6),
+        "max_rss_kb": max_rss,
+        "voluntary_switches": rusage.ru_nvcsw,
+        "involuntary_switches": rusage.ru_nivcsw,
+    }
+
+
+def format_record(record):
+    """Render a record for people, /usr/bin/time style.
+    """
+    return (
+        "vex: {wall:.3f}s wall, {user:.3f}s user, {system:.3f}s system, "
+        "{max_rss_kb} KB max RSS, {voluntary_switches} voluntary and "
+        "{involuntary_switches} involuntary context switches, "
+        "exit status {returncode}\n"
+    ).format(**record)
+
+
+def write_record(record, destination):
+    """Print record on stderr, or append it as a JSON line to a file.
+
+    destination is "stderr" or a path. The line goes to the file in a
+    single O_APPEND write, so concurrent runs don't interleave.
+    """
+    if destination == "stderr":
+        sys.stderr.write(format_record(record))
+        return
+    line = (json.dumps(record, sort_keys=True) + "\n").encode("utf-8")
+    fd = os.open(
+        os.path.expanduser(destination),
+        os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def get_report_destination(options, vexrc):
+    """Work out where run reports should go, or None for no report.
+    """
+    if options.report_file:
+        return options.report_file
+    if options.report:
+        return "stderr"
+    return vexrc[vexrc.default_heading].get("report") or None
@@ -1,10 +1,14 @@
 """Run subprocess.
 """
 import os
-import platform
+import sys
+import time
+import signal
+import threading
 import subprocess
-import distutils.spawn
 from vex import exceptions
+from vex.which import find_executable
+from vex.layout import get_ve_bin
 
 
 def get_environ(environ, defaults, ve_path):
@@ -23,10 +27,7 @@ def get_environ(environ, defaults, ve_path):
     # or there is nothing for us to do here and it's bad.
     if not ve_path:
         raise exceptions.BadConfig("ve_path must be set")
-    if platform.system() == "Windows":
-        ve_bin = os.path.join(ve_path, "Scripts")
-    else:
-        ve_bin = os.path.join(ve_path, "bin")
+    ve_bin = get_ve_bin(ve_path)
 
     # If user is currently in a virtualenv, DON'T just prepend
     # to its path (vex foo; echo $PATH -> " /foo/bin:/bar/bin")
@@ -64,25 +65,321 @@ def get_environ(environ, defaults, ve_path):
     return env
 
 
-def run(command, env, cwd):
+def returncode_from_status(status):
+    """Turn a status from os.wait into a returncode, as Popen gives.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def wait_for(process):
+    """Wait for process to finish, collecting its resource usage.
+
+    :returns:
+        (returncode, rusage), where rusage is None if the platform
+        has no os.wait4.
+    """
+    if not hasattr(os, "wait4"):
+        return process.wait(), None
+    _, status, rusage = os.wait4(process.pid, 0)
+    # Tell the Popen object, so it won't try to reap the process again.
+    process.returncode = returncode_from_status(status)
+    return process.returncode, rusage
+
+
+# Signals a supervising vex passes on to the command it is waiting for.
+FORWARDED_SIGNALS = ("SIGTERM", "SIGINT", "SIGHUP", "SIGUSR1", "SIGUSR2")
+
+
+def send_signal(process, signum, group=False):
+    """Signal process, or its whole process group if group is true.
+    """
+    if group:
+        os.killpg(process.pid, signum)
+    else:
+        os.kill(process.pid, signum)
+
+
+def wants_own_group():
+    """Decide whether a command should run in its own process group.
+
+    A command with a controlling terminal has to stay in the terminal's
+    foreground process group: it may open /dev/tty even when stdin is a
+    pipe, and would be stopped with SIGTTIN in a background group. The
+    terminal already sends the whole group Ctrl-C and friends. Anything
+    else is better off in its own group, so the signals vex forwards
+    reach its children too.
+    """
+    if not hasattr(os, "killpg"):
+        return False
+    try:
+        fd = os.open("/dev/tty", os.O_RDONLY | getattr(os, "O_NOCTTY", 0))
+    except OSError:
+        return True
+    os.close(fd)
+    return False
+
+
+def _in_main_thread():
+    # signal.signal only works in the main thread.
+    return threading.current_thread() is threading.main_thread()
+
+
+class SignalForwarder(object):
+    """Pass signals vex receives on to the commands it is running.
+
+    While installed, these signals no longer interrupt vex itself, so
+    it carries on waiting for its commands (and cleaning up after them).
+    Signals arriving while no command is running are delivered to the
+    next one as soon as it has started; every signal received is kept
+    in received, for callers deciding whether to start any more.
+    """
+    def __init__(self, group=False):
+        self.group = group
+        self.processes = []
+        self.finished = False
+        self.pending = []
+        self.received = []
+        self.previous = {}
+
+    def install(self):
+        if not hasattr(os, "kill") or not _in_main_thread():
+            return
+        for name in FORWARDED_SIGNALS:
+            signum = getattr(signal, name, None)
+            if signum is None:
+                continue
+            self.previous[signum] = signal.signal(signum, self._handle)
+
+    def _handle(self, signum, frame):
+        self.received.append(signum)
+        # Copied, since other threads may attach or detach meanwhile.
+        processes = list(self.processes)
+        if not processes:
+            self.pending.append(signum)
+        for process in processes:
+            self._send(process, signum)
+
+    def _send(self, process, signum):
+        if self.finished:
+            return
+        # Sharing the terminal's process group, the command got Ctrl-C
+        # from the terminal just as we did.
+        if signum == signal.SIGINT and not self.group:
+            return
+        try:
+            send_signal(process, signum, self.group)
+        except OSError:
+            pass
+
+    def attach(self, process):
+        self.processes.append(process)
+        pending, self.pending = self.pending, []
+        for signum in pending:
+            self._send(process, signum)
+
+    def detach(self, process):
+        """Stop forwarding to process, which has finished.
+        """
+        self.processes.remove(process)
+
+    def restore(self):
+        self.finished = True
+        for signum, handler in self.previous.items():
+            signal.signal(signum, handler)
+        self.previous = {}
+        # A signal that came before there was anything to forward it to
+        # is vex's own to handle.
+        for signum in self.pending:
+            os.kill(os.getpid(), signum)
+
+
+def _make_preexec(limits, group):
+    """Make a function for the child to run between fork and exec.
+    """
+    def preexec():
+        if group:
+            os.setpgid(0, 0)
+        if limits is not None:
+            limits.apply()
+    return preexec
+
+
+class Watchdog(object):
+    """Stop a process that runs too long: SIGTERM, then later SIGKILL.
+    """
+    def __init__(self, process, timeout, kill_after, group=False):
+        self.process = process
+        self.timeout = timeout
+        self.kill_after = kill_after
+        self.group = group
+        self.lock = threading.Lock()
+        self.finished = False
+        self.timer = None
+        self.timed_out = False
+
+    def _signal(self, signum, then=None):
+        with self.lock:
+            if self.finished:
+                return
+            self.timed_out = True
+            # os.kill rather than Popen.send_signal, which may try to
+            # reap the process behind wait_for's back.
+            try:
+                send_signal(self.process, signum, self.group)
+            except OSError:
+                return
+            if then is not None:
+                self._start(self.kill_after, then)
+
+    def _start(self, delay, signum, then=None):
+        self.timer = threading.Timer(delay, self._signal, [signum, then])
+        self.timer.daemon = True
+        self.timer.start()
+
+    def start(self):
+        kill = getattr(signal, "SIGKILL", signal.SIGTERM)
+        self._start(self.timeout, signal.SIGTERM, kill)
+
+    def stop(self):
+        """Call once the process is reaped, so its pid isn't signalled.
+        """
+        with self.lock:
+            self.finished = True
+            if self.timer is not None:
+                self.timer.cancel()
+
+
+def _start(command, exe, env, cwd, stdin, stderr, limits, group):
+    """Start command, in its own process group if group is true, and
+    apply limits to it.
+    """
+    # preexec_fn isn't safe with other threads running, as in a batch
+    # run with -j; then limits are applied from here once the command
+    # has started, where the platform allows.
+    limit_after = (
+        limits is not None and limits.restricts() and
+        threading.active_count() > 1 and limits.can_apply_to())
+    kwargs = {}
+    if group and sys.version_info >= (3, 11):
+        kwargs["process_group"] = 0
+        group = False
+    in_child = limits if not limit_after else None
+    if (in_child is not None and in_child.restricts()) or group:
+        kwargs["preexec_fn"] = _make_preexec(in_child, group)
+    try:
+        # Passing executable keeps argv[0] as the user typed it.
+        process = subprocess.Popen(
+            command, executable=exe, env=env, cwd=cwd, stdin=stdin,
+            stderr=stderr, **kwargs)
+    except subprocess.SubprocessError:
+        # All the child can tell us is that preexec_fn failed.
+        if limits is None:
+            raise
+        raise exceptions.BadConfig(
+            "can't apply limits to {0!r}: {1}".format(
+                command[0], limits.explain_failure()))
+    if limit_after:
+        try:
+            limits.apply_to(process.pid)
+        except OSError as error:
+            process.kill()
+            process.wait()
+            raise exceptions.BadConfig(
+                "can't apply limits to {0!r}: {1}".format(
+                    command[0], limits.explain_failure(error)))
+    return process
+
+
+def run(command, env, cwd, executables=None, report=None, limits=None,
+        supervise=True, stdin=None, stderr=None, forwarder=None):
     """Run the given command.
+
+    command[0] is looked up on env's PATH first, through executables
+    (an ExecutableCache) if given, so a missing command is reported
+    by returning None without trying to start anything.
+
+    If report is given, it is called after the command finishes with
+    the returncode, start time, elapsed time and rusage of the child.
+
+    limits is an optional vex.limits.Limits, applied in the child
+    before exec (or, with other threads running, from here just after),
+    whose timeout is enforced from here.
+
+    If supervise is true, the command runs in its own process group
+    unless it is interactive, and signals sent to vex while it waits
+    are forwarded to the command. To supervise several commands run
+    at once, pass the same installed SignalForwarder to each as
+    forwarder; its group says whether they get their own groups.
+
+    stdin and stderr are as for subprocess.Popen; by default, vex's own.
     """
     assert command
     if cwd:
         assert os.path.exists(cwd)
-    if platform.system() == "Windows":
-        exe = distutils.spawn.find_executable(command[0], path=env["PATH"])
-        if exe:
-            command[0] = exe
+    path = env.get("PATH", os.defpath)
+    # A relative path to a command is relative to cwd, which is the
+    # child's business, not ours; only bare names are searched for.
+    exe = None
+    if not os.path.dirname(command[0]):
+        if executables is not None:
+            exe = executables.find(command[0], path)
+        else:
+            exe = find_executable(command[0], path)
+        if not exe:
+            return None
     _, command_name = os.path.split(command[0])
     if (command_name in ("bash", "zsh")
     and "VIRTUALENVWRAPPER_PYTHON" not in env):
         env["VIRTUALENVWRAPPER_PYTHON"] = ":"
+    shared = forwarder is not None
+    if shared:
+        group = forwarder.group
+    else:
+        group = supervise and wants_own_group()
+        forwarder = SignalForwarder(group)
+        if supervise:
+            forwarder.install()
+    process = None
+    watchdog = None
     try:
-        process = subprocess.Popen(command, env=env, cwd=cwd)
-        process.wait()
-    except exceptions.CommandNotFoundError as error:
-        if error.errno != 2:
-            raise
-        return None
-    return process.returncode
+        started = time.time()
+        try:
+            process = _start(
+                command, exe, env, cwd, stdin, stderr, limits, group)
+        except exceptions.CommandNotFoundError as error:
+            if error.errno != 2:
+                raise
+            return None
+        if group:
+            # Also set from this side, so it's done before we signal it.
+            try:
+                os.setpgid(process.pid, process.pid)
+            except OSError:
+                pass
+        forwarder.attach(process)
+        if executables is not None:
+            # Now the command is on its way, not before.
+            executables.save()
+        if limits is not None and limits.timeout is not None:
+            watchdog = Watchdog(
+                process, limits.timeout, limits.kill_after, group)
+            watchdog.start()
+        if report is None:
+            process.wait()
+            return process.returncode
+        returncode, rusage = wait_for(process)
+    finally:
+        if watchdog is not None:
+            watchdog.stop()
+            if watchdog.timed_out:
+                sys.stderr.write("vex: {0!r} timed out after {1:g}s\n".format(
+                    command[0], limits.timeout))
+        if not shared:
+            forwarder.restore()
+        elif process is not None:
+            forwarder.detach(process)
+    if rusage is not None:
+        report(returncode, started, time.time() - started, rusage)
+    return returncode
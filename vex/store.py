@@ -0,0 +1,165 @@
+"""Shared storage under a virtualenvs directory, in its .vex-store.
+
+Besides the virtualenvs made by --ensure, this keeps a package store:
+one unpacked copy of each wheel, whose files virtualenvs link to rather
+than having their own copies. Each entry has a directory of references,
+one per virtualenv using it, and is removed when the last one goes.
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from vex.lock import FileLock
+
+# Under the virtualenvs directory; hidden, so not listed as a namespace.
+STORE_DIR = ".vex-store"
+
+# In a virtualenv, which store entries it links to.
+PACKAGES_RECORD = "vex-packages.json"
+
+# In a store entry, its files and what they were compiled for.
+MANIFEST = ".vex-manifest.json"
+
+
+def get_store(ve_base, kind):
+    """Return the directory in ve_base's store for kind of thing.
+    """
+    return os.path.join(ve_base, STORE_DIR, kind)
+
+
+def _makedirs(path):
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+
+def _ref_name(ve_path):
+    return hashlib.sha256(
+        os.path.abspath(ve_path).encode("utf-8")).hexdigest()[:32]
+
+
+class PackageStore(object):
+    """Unpacked wheels under root/packages, keyed by wheel filename.
+
+    Adding or dropping a reference and removing an entry happen under a
+    per-entry lock, so an entry can't be removed while it is being
+    linked into a new virtualenv.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, "packages", key)
+
+    def _refs(self, key):
+        return os.path.join(self.root, "refs", key)
+
+    def _lock(self, key):
+        return FileLock(os.path.join(self.root, "locks", key))
+
+    def has(self, key):
+        return os.path.exists(os.path.join(self.path(key), MANIFEST))
+
+    def manifest(self, key):
+        with open(os.path.join(self.path(key), MANIFEST), "r") as inp:
+            return json.load(inp)
+
+    def add_ref(self, key, ve_path):
+        """Record that the virtualenv at ve_path uses entry key.
+        """
+        with self._lock(key):
+            refs = self._refs(key)
+            _makedirs(refs)
+            with open(os.path.join(refs, _ref_name(ve_path)), "w") as out:
+                out.write(os.path.abspath(ve_path) + "\n")
+
+    def drop_ref(self, key, ve_path):
+        """Forget that ve_path uses entry key, removing it if unused.
+
+        :returns:
+            True if the entry was removed.
+        """
+        with self._lock(key):
+            refs = self._refs(key)
+            try:
+                os.unlink(os.path.join(refs, _ref_name(ve_path)))
+            except OSError:
+                pass
+            try:
+                os.rmdir(refs)
+            except OSError:
+                # Not empty: someone else still uses it.
+                return False
+            self._discard(self.path(key))
+            return True
+
+    def temp_dir(self, key):
+        """Make a directory to build entry key in before adding it.
+        """
+        parent = os.path.join(self.root, "packages")
+        _makedirs(parent)
+        return tempfile.mkdtemp(dir=parent, prefix=".tmp-" + key + "-")
+
+    def write_manifest(self, directory, manifest):
+        path = os.path.join(directory, MANIFEST)
+        with open(path + ".tmp", "w") as out:
+            json.dump(manifest, out, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    def add(self, key, directory):
+        """Move a built entry into place.
+
+        If another vex added the same entry meanwhile, its copy is kept
+        and directory is removed.
+        """
+        try:
+            os.rename(directory, self.path(key))
+        except OSError:
+            if not self.has(key):
+                raise
+            shutil.rmtree(directory)
+
+    def _discard(self, path):
+        # Rename first, so nothing sees a partly removed entry.
+        if not os.path.exists(path):
+            return
+        trash = tempfile.mkdtemp(
+            dir=os.path.dirname(path), prefix=".trash-")
+        os.rename(path, os.path.join(trash, "entry"))
+        shutil.rmtree(trash)
+
+
+def write_packages_record(ve_path, store, keys):
+    """Note in the virtualenv which store entries it links to.
+    """
+    path = os.path.join(ve_path, PACKAGES_RECORD)
+    with open(path, "w") as out:
+        json.dump({"store": store.root, "packages": sorted(keys)}, out,
+                  sort_keys=True)
+
+
+def read_packages_record(ve_path):
+    """Return (store, keys) for a virtualenv, or None if it has none.
+    """
+    try:
+        with open(os.path.join(ve_path, PACKAGES_RECORD), "r") as inp:
+            record = json.load(inp)
+        return PackageStore(record["store"]), record["packages"]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def release_packages(record, ve_path):
+    """Drop a removed virtualenv's references to store entries.
+
+    :returns:
+        the number of entries removed because nothing uses them now.
+    """
+    if not record:
+        return 0
+    store, keys = record
+    return sum(1 for key in keys if store.drop_ref(key, ve_path))
@@ -0,0 +1,391 @@
+"""Mirror the virtualenvs in one virtualenvs directory to another.
+
+Virtualenvs are compared file by file against manifests kept in each
+directory's store: the source's records content hashes, and the
+destination's records which source content each of its files was
+copied from. Only files whose size or mtime changed since the last run
+are read, and only files which differ are copied. A virtualenv new to
+the destination is built under a hidden name and renamed into place.
+"""
+import os
+import sys
+import time
+import shutil
+import hashlib
+import tempfile
+import stat as stat_module
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from vex import exceptions
+from vex.cache import JSONCache
+from vex.dedupe import hash_file
+from vex.index import VirtualenvIndex, NAME_SEP, is_virtualenv
+from vex.links import reflink
+from vex.lock import FileLock
+from vex.relocate import find_path_files, path_patterns, retarget_link
+from vex.relocate import rewrite_file
+from vex.remove import handle_remove
+from vex.store import PACKAGES_RECORD, get_store
+from vex.usage import format_size
+from vex.walk import default_jobs, walk
+
+# Not mirrored: the destination gets copies, not links into a store.
+_EXCLUDE = (PACKAGES_RECORD,)
+
+# What to do to a destination virtualenv: relative paths to remove,
+# directories to make, (path, target) symlinks to make, files to copy.
+Plan = namedtuple("Plan", ["remove", "dirs", "links", "copies"])
+
+
+def _manifest_key(name):
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()[:32]
+
+
+def manifest_cache(root, name):
+    """Open root's manifest for the virtualenv called name.
+
+    Each entry maps a relative path to [size, mtime, content hash].
+    """
+    return JSONCache(os.path.join(
+        get_store(root, "sync"), _manifest_key(name) + ".json"))
+
+
+def forget_manifests(root, names):
+    """Remove root's manifests for virtualenvs not in names.
+    """
+    directory = get_store(root, "sync")
+    keep = set(_manifest_key(name) + ".json" for name in names)
+    try:
+        filenames = os.listdir(directory)
+    except OSError:
+        return
+    for filename in filenames:
+        if filename.endswith(".json") and filename not in keep:
+            try:
+                os.unlink(os.path.join(directory, filename))
+            except OSError:
+                pass
+
+
+def list_virtualenvs(root):
+    """Map the name of each virtualenv under root to its path.
+    """
+    if not os.path.isdir(root):
+        return {}
+    index = VirtualenvIndex([root], JSONCache(None))
+    found = {}
+    for name in index.names():
+        path = index.lookup(name)
+        if is_virtualenv(path):
+            found[name] = path
+    return found
+
+
+def scan(ve_path, jobs=None):
+    """Stat everything in the virtualenv at ve_path.
+
+    :returns:
+        a dict from each path relative to ve_path to its lstat result.
+    """
+    stats = {}
+    for directory, dirs, nondirs in walk([ve_path], jobs):
+        relative = os.path.relpath(directory, ve_path)
+        for entry in dirs + nondirs:
+            if relative == os.curdir:
+                if entry.name in _EXCLUDE:
+                    continue
+                rel = entry.name
+            else:
+                rel = os.path.join(relative, entry.name)
+            try:
+                stats[rel] = entry.stat(follow_symlinks=False)
+            except OSError:
+                pass
+    return stats
+
+
+def _recorded_hash(stat, record):
+    """Return the hash in a manifest record if stat still matches it.
+    """
+    if record and record[0] == stat.st_size and record[1] == stat.st_mtime:
+        return record[2]
+    return None
+
+
+def hash_files(ve_path, stats, cache, jobs=None):
+    """Get the content hash of each regular file in stats.
+
+    Files whose size and mtime match cache aren't read. Entries for
+    files which are gone are dropped from cache.
+    """
+    for rel in list(cache.load()):
+        if rel not in stats:
+            del cache[rel]
+    hashes = {}
+    todo = []
+    for rel, stat in stats.items():
+        if not stat_module.S_ISREG(stat.st_mode):
+            continue
+        digest = _recorded_hash(stat, cache.get(rel))
+        if digest:
+            hashes[rel] = digest
+        else:
+            todo.append(rel)
+
+    def work(rel):
+        return rel, hash_file(os.path.join(ve_path, rel))
+
+    with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+        for rel, digest in executor.map(work, todo):
+            stat = stats[rel]
+            cache[rel] = [stat.st_size, stat.st_mtime, digest]
+            hashes[rel] = digest
+    return hashes
+
+
+def _is_copy(path, stat, digest, cache, rel):
+    """Decide whether the destination file at path has source content
+    digest, trusting its manifest if its stat hasn't changed.
+    """
+    recorded = _recorded_hash(stat, cache.get(rel))
+    if recorded:
+        return recorded == digest
+    # Not copied by a sync, or changed since: compare its contents.
+    try:
+        if hash_file(path) != digest:
+            return False
+    except (IOError, OSError):
+        return False
+    cache[rel] = [stat.st_size, stat.st_mtime, digest]
+    return True
+
+
+def make_plan(src_path, dst_path, src_stats, hashes, dst_stats, cache,
+              jobs=None):
+    """Work out what would make dst_path a copy of src_path.
+    """
+    remove = []
+    for rel in sorted(dst_stats):
+        stat = src_stats.get(rel)
+        if stat is None or stat_module.S_IFMT(stat.st_mode) != \
+                stat_module.S_IFMT(dst_stats[rel].st_mode):
+            # Removing a directory removes what is in it.
+            if not any(rel.startswith(parent + os.sep) for parent in remove):
+                remove.append(rel)
+    removed = set(remove)
+
+    def present(rel):
+        if rel not in dst_stats:
+            return False
+        parts = rel.split(os.sep)
+        return not any(
+            os.sep.join(parts[:i]) in removed for i in range(1, len(parts) + 1))
+
+    dirs = []
+    links = []
+    files = []
+    for rel in sorted(src_stats):
+        mode = src_stats[rel].st_mode
+        if stat_module.S_ISDIR(mode):
+            if not present(rel):
+                dirs.append(rel)
+        elif stat_module.S_ISLNK(mode):
+            target = retarget_link(
+                os.readlink(os.path.join(src_path, rel)), src_path, dst_path)
+            if not present(rel) or \
+                    os.readlink(os.path.join(dst_path, rel)) != target:
+                links.append((rel, target))
+        elif stat_module.S_ISREG(mode):
+            files.append((rel, present(rel)))
+
+    def work(item):
+        rel, check = item
+        if check and _is_copy(os.path.join(dst_path, rel), dst_stats[rel],
+                              hashes[rel], cache, rel):
+            return None
+        return rel
+
+    with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+        copies = [rel for rel in executor.map(work, files) if rel]
+    return Plan(remove, dirs, links, copies)
+
+
+def _copy_file(source, destination):
+    """Copy source over destination, atomically.
+    """
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(destination), prefix=".vex-sync-")
+    os.close(fd)
+    try:
+        os.unlink(temp_path)
+        try:
+            reflink(source, temp_path)
+        except (IOError, OSError):
+            shutil.copy2(source, temp_path)
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.lexists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _make_symlink(target, path):
+    temp_path = path + ".vex-sync"
+    if os.path.lexists(temp_path):
+        os.unlink(temp_path)
+    os.symlink(target, temp_path)
+    os.replace(temp_path, path)
+
+
+def apply_plan(plan, src_path, target, location, hashes, cache, jobs=None):
+    """Carry out plan on target, which will end up at location.
+
+    Copied files which hold the source's path are rewritten to hold
+    location instead, and recorded in cache with their new stat.
+    """
+    for rel in plan.remove:
+        path = os.path.join(target, rel)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.unlink(path)
+    for rel in plan.dirs:
+        path = os.path.join(target, rel)
+        os.mkdir(path)
+        shutil.copymode(os.path.join(src_path, rel), path)
+    for rel, link in plan.links:
+        _make_symlink(link, os.path.join(target, rel))
+
+    def work(rel):
+        _copy_file(os.path.join(src_path, rel), os.path.join(target, rel))
+
+    with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+        list(executor.map(work, plan.copies))
+    if os.path.abspath(src_path) != os.path.abspath(location):
+        patterns = path_patterns(src_path)
+        path_files = set(find_path_files(target))
+        for rel in plan.copies:
+            path = os.path.join(target, rel)
+            if path in path_files:
+                rewrite_file(path, patterns, location)
+    for rel in plan.copies:
+        stat = os.lstat(os.path.join(target, rel))
+        cache[rel] = [stat.st_size, stat.st_mtime, hashes[rel]]
+    for rel in list(cache.load()):
+        if rel not in hashes:
+            del cache[rel]
+
+
+def sync_virtualenv(name, src_path, dst_path, src_root, dst_root,
+                    jobs=None, dry_run=False):
+    """Make dst_path a copy of the virtualenv at src_path.
+
+    :returns:
+        (plan, whether dst_path is new).
+    """
+    src_cache = manifest_cache(src_root, name)
+    dst_cache = manifest_cache(dst_root, name)
+    src_stats = scan(src_path, jobs)
+    hashes = hash_files(src_path, src_stats, src_cache, jobs)
+    src_cache.save()
+    new = not os.path.lexists(dst_path)
+    if new:
+        for rel in list(dst_cache.load()):
+            del dst_cache[rel]
+        dst_stats = {}
+    else:
+        dst_stats = scan(dst_path, jobs)
+    plan = make_plan(
+        src_path, dst_path, src_stats, hashes, dst_stats, dst_cache, jobs)
+    if dry_run:
+        return plan, new
+    if not any(plan):
+        dst_cache.save()
+        return plan, new
+    if new:
+        parent = os.path.dirname(dst_path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        temp = tempfile.mkdtemp(dir=parent, prefix=".vex-sync-")
+        try:
+            shutil.copymode(src_path, temp)
+            apply_plan(
+                plan, src_path, temp, dst_path, hashes, dst_cache, jobs)
+            os.rename(temp, dst_path)
+        except BaseException:
+            shutil.rmtree(temp, ignore_errors=True)
+            raise
+    else:
+        apply_plan(
+            plan, src_path, dst_path, dst_path, hashes, dst_cache, jobs)
+    dst_cache.save()
+    return plan, new
+
+
+def handle_sync(source, destination, jobs=None, prune=False, dry_run=False):
+    """Mirror the virtualenvs in directory source to destination.
+
+    With prune, virtualenvs only destination has are removed. With
+    dry_run, only prints what would be done.
+    """
+    started = time.time()
+    source = os.path.abspath(source)
+    destination = os.path.abspath(destination)
+    if not os.path.isdir(source):
+        raise exceptions.NoVirtualenvsDirectory(
+            "no virtualenvs directory at {0!r}".format(source))
+    if source == destination:
+        raise exceptions.InvalidArgument(
+            "can't sync {0!r} to itself".format(source))
+    lock = None
+    if not dry_run:
+        lock = FileLock(os.path.join(get_store(destination, "locks"), "sync"))
+        if not lock.acquire(blocking=False):
+            sys.stderr.write(
+                "waiting for another sync to {0!r}\n".format(destination))
+            lock.acquire()
+    status = 0
+    try:
+        sources = list_virtualenvs(source)
+        existing = list_virtualenvs(destination)
+        copied = size = 0
+        for name in sorted(sources):
+            dst_path = os.path.join(
+                destination, name.replace(NAME_SEP, os.sep))
+            plan, new = sync_virtualenv(
+                name, sources[name], dst_path, source, destination, jobs,
+                dry_run)
+            if not any(plan):
+                continue
+            copied += len(plan.copies)
+            size += sum(
+                os.path.getsize(os.path.join(sources[name], rel))
+                for rel in plan.copies)
+            sys.stdout.write("{0}\t{1}\t{2} files, {3} removed\n".format(
+                "new" if new else "update", name, len(plan.copies),
+                len(plan.remove)))
+        extra = sorted(set(existing) - set(sources)) if prune else []
+        gone = set()
+        for name in extra:
+            sys.stdout.write("prune\t{0}\n".format(name))
+            if dry_run:
+                continue
+            try:
+                handle_remove(existing[name])
+            except exceptions.VirtualenvNotRemoved as error:
+                sys.stderr.write("can't prune {0!r}: {1}\n".format(
+                    name, error.message))
+                status = 1
+            else:
+                gone.add(name)
+        if not dry_run:
+            forget_manifests(source, sources)
+            forget_manifests(
+                destination, (set(existing) | set(sources)) - gone)
+    finally:
+        if lock is not None:
+            lock.release()
+    sys.stderr.write("{0} {1} files ({2}) in {3:.2f}s\n".format(
+        "would copy" if dry_run else "copied", copied, format_size(size),
+        time.time() - started))
+    return status
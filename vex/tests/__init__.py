@@ -1,7 +1,3 @@
 path_type = bytes
 
-try:
-    unicode
-    str_type = unicode
-except NameError:
-    str_type = str
+str_type = str
@@ -12,14 +12,19 @@ class Object(object):
 class FakePopen(object):
     def __init__(self, returncode=888):
         self.command = None
+        self.executable = None
         self.env = None
         self.cwd = None
         self.waited = False
+        self.pid = None
         self.expected_returncode = returncode
         self.returncode = None
 
-    def __call__(self, command, env=None, cwd=None):
+    def __call__(self, command, executable=None, env=None, cwd=None,
+                 **kwargs):
         self.command = command
+        self.executable = executable
+        self.kwargs = kwargs
         self.env = env
         self.cwd = cwd
         return self
@@ -0,0 +1,35 @@
+import os
+
+
+def write(path, data):
+    with open(path, "wb") as out:
+        out.write(data)
+
+
+def read(path):
+    with open(path, "rb") as inp:
+        return inp.read().decode("utf-8", "replace")
+
+
+def make_ve(root, name="old", home=None):
+    """Make a directory under root that looks enough like a virtualenv.
+
+    It has a script whose shebang names the virtualenv's python, which
+    is a symlink to python3 in home, or /usr/bin/python3 if home is
+    None. Given home, there is a pyvenv.cfg naming it too.
+    """
+    ve = os.path.join(root, name)
+    bin_path = os.path.join(ve, "bin")
+    os.makedirs(bin_path)
+    os.makedirs(os.path.join(ve, "lib"))
+    if home is None:
+        python = "/usr/bin/python3"
+    else:
+        python = os.path.join(home, "python3")
+        write(os.path.join(ve, "pyvenv.cfg"),
+              "home = {0}\n".format(home).encode("utf-8"))
+    os.symlink(python, os.path.join(bin_path, "python"))
+    write(os.path.join(bin_path, "tool"),
+          "#!{0}/bin/python\n".format(ve).encode("utf-8"))
+    write(os.path.join(ve, "lib", "mod.py"), b"pass\n")
+    return ve
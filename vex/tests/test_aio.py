@@ -0,0 +1,115 @@
+import os
+import sys
+import asyncio
+from pytest import raises, mark
+from vex import exceptions
+from vex.aio import AsyncVex
+from vex.limits import Limits, resource
+from . tempdir import TempDir
+from . test_api import make_vex
+
+
+class TestAsyncVex(object):
+
+    def test_run_with_readers(self):
+        with TempDir() as temp:
+            vex, ve_path = make_vex(temp.path.decode("utf-8"))
+            avex = AsyncVex(vex)
+            out, err = [], []
+
+            async def on_stderr(line):
+                err.append(line)
+
+            returncode = asyncio.run(avex.run(
+                "team/foo",
+                ["sh", "-c", "echo $VIRTUAL_ENV; echo $COLOR; "
+                             "echo oops >&2; printf tail; exit 3"],
+                on_stdout=out.append, on_stderr=on_stderr))
+            assert returncode == 3
+            assert out == [ve_path.encode("utf-8") + b"\n", b"blue\n",
+                           b"tail"]
+            assert err == [b"oops\n"]
+
+    def test_long_lines(self):
+        with TempDir() as temp:
+            vex, _ = make_vex(temp.path.decode("utf-8"))
+            avex = AsyncVex(vex, line_limit=16)
+            out = []
+            asyncio.run(avex.run(
+                "team/foo", ["sh", "-c", "printf '%0100d\\nend\\n' 0"],
+                on_stdout=out.append))
+            assert b"".join(out) == b"0" * 100 + b"\nend\n"
+            assert out[-1] == b"end\n"
+
+    def test_command_not_found(self):
+        with TempDir() as temp:
+            vex, _ = make_vex(temp.path.decode("utf-8"))
+            with raises(exceptions.InvalidCommand):
+                asyncio.run(AsyncVex(vex).run(
+                    "team/foo", ["no-such-command-here"]))
+
+    def test_timeout(self):
+        with TempDir() as temp:
+            vex, _ = make_vex(temp.path.decode("utf-8"))
+            returncode = asyncio.run(AsyncVex(vex).run(
+                "team/foo", ["sleep", "10"],
+                limits=Limits(timeout=0.1, kill_after=1)))
+            assert returncode == -15
+
+    @mark.skipif(not hasattr(resource, "prlimit"), reason="needs prlimit")
+    def test_limits(self):
+        code = (
+            "import resource, sys; "
+            "sys.exit(resource.getrlimit(resource.RLIMIT_NOFILE)[0])"
+        )
+        with TempDir() as temp:
+            vex, _ = make_vex(temp.path.decode("utf-8"))
+            avex = AsyncVex(vex)
+            returncode = asyncio.run(avex.run(
+                "team/foo", [sys.executable, "-c", code],
+                limits=Limits(files=42)))
+            assert returncode == 42
+            with raises(exceptions.BadConfig):
+                asyncio.run(avex.run(
+                    "team/foo", ["sleep", "10"],
+                    limits=Limits(cpus=set([100000]))))
+
+    def test_cancel_stops_command(self):
+        with TempDir() as temp:
+            vex, _ = make_vex(temp.path.decode("utf-8"))
+            avex = AsyncVex(vex)
+            pids = []
+
+            async def main():
+                task = asyncio.ensure_future(avex.run(
+                    "team/foo", ["sh", "-c", "echo $$; exec sleep 10"],
+                    on_stdout=lambda line: pids.append(int(line))))
+                while not pids:
+                    await asyncio.sleep(0.01)
+                task.cancel()
+                with raises(asyncio.CancelledError):
+                    await task
+
+            asyncio.run(main())
+            with raises(OSError):
+                os.kill(pids[0], 0)
+
+    def test_limit(self):
+        with TempDir() as temp:
+            vex, _ = make_vex(temp.path.decode("utf-8"))
+            avex = AsyncVex(vex, limit=2)
+            running = [0, 0]
+
+            def on_stdout(line):
+                running[0] += 1 if line == b"start\n" else -1
+                running[1] = max(running[1], running[0])
+
+            async def main():
+                return await asyncio.gather(*[
+                    avex.run("team/foo",
+                             ["sh", "-c", "echo start; sleep 0.1; echo end"],
+                             on_stdout=on_stdout)
+                    for _ in range(6)])
+
+            assert asyncio.run(main()) == [0] * 6
+            assert running == [0, 2]
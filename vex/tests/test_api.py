@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+import subprocess
+from pytest import raises, mark
+from vex import exceptions
+from vex.api import Vex
+from vex.limits import Limits, resource
+from . tempdir import TempDir
+
+
+def make_vex(top):
+    base = os.path.join(top, "virtualenvs")
+    os.makedirs(os.path.join(base, "team", "foo", "bin"))
+    config_path = os.path.join(top, "vexrc")
+    with open(config_path, "w") as out:
+        out.write("virtualenvs={0}\ncache=\nenv:team/*:\n  COLOR=blue\n"
+                  .format(base))
+    environ = {"PATH": os.environ.get("PATH", os.defpath), "HOME": top}
+    return Vex(config_path, environ), os.path.join(base, "team", "foo")
+
+
+class TestVex(object):
+
+    def test_resolve_and_environ(self):
+        with TempDir() as temp:
+            vex, ve_path = make_vex(temp.path.decode("utf-8"))
+            assert vex.resolve("team/foo") == ve_path
+            assert vex.resolve("tfoo", inexact=True) == ve_path
+            with raises(exceptions.InvalidVirtualenv):
+                vex.resolve("nope")
+            env = vex.environ("team/foo", {"EXTRA": "1"})
+            assert env["VIRTUAL_ENV"] == ve_path
+            assert env["PATH"].startswith(os.path.join(ve_path, "bin"))
+            assert env["COLOR"] == "blue"
+            assert env["EXTRA"] == "1"
+
+    def test_spawn(self):
+        with TempDir() as temp:
+            vex, ve_path = make_vex(temp.path.decode("utf-8"))
+            process = vex.spawn(
+                "team/foo", ["sh", "-c", "echo $VIRTUAL_ENV; exit 3"],
+                stdout=subprocess.PIPE)
+            assert process.pid > 0
+            output = process.stdout.read()
+            assert process.wait() == 3
+            assert output.decode("utf-8").strip() == ve_path
+            assert process.elapsed >= 0
+            if hasattr(os, "wait4"):
+                assert process.rusage is not None
+            process.stdout.close()
+            with raises(exceptions.InvalidCommand):
+                vex.spawn("team/foo", ["no-such-command-here"])
+
+    def test_wait_timeout_and_kill(self):
+        with TempDir() as temp:
+            vex, _ = make_vex(temp.path.decode("utf-8"))
+            process = vex.spawn("team/foo", ["sleep", "10"])
+            with raises(subprocess.TimeoutExpired):
+                process.wait(timeout=0.05)
+            assert process.poll() is None
+            process.kill()
+            assert process.wait(timeout=5) == -9
+
+    @mark.skipif(not hasattr(resource, "prlimit"), reason="needs prlimit")
+    def test_spawn_limits(self):
+        code = (
+            "import resource, sys; "
+            "sys.exit(resource.getrlimit(resource.RLIMIT_NOFILE)[0])"
+        )
+        with TempDir() as temp:
+            vex, _ = make_vex(temp.path.decode("utf-8"))
+            process = vex.spawn("team/foo", [sys.executable, "-c", code],
+                                limits=Limits(files=42))
+            assert process.wait() == 42
+            with raises(exceptions.BadConfig) as info:
+                vex.spawn("team/foo", ["sleep", "10"],
+                          limits=Limits(cpus=set([100000])))
+            assert "none of CPUs 100000" in info.value.message
+
+    def test_threads(self):
+        with TempDir() as temp:
+            vex, _ = make_vex(temp.path.decode("utf-8"))
+            results = []
+
+            def work():
+                process = vex.spawn("team/foo", [sys.executable, "-c", ""])
+                results.append(process.wait())
+
+            threads = [threading.Thread(target=work) for _ in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert results == [0] * 10
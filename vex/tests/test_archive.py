@@ -0,0 +1,110 @@
+import io
+import os
+import tarfile
+import pytest
+from vex import archive
+from vex import exceptions
+from vex.store import PACKAGES_RECORD
+from . files import make_ve, read, write
+from . tempdir import TempDir
+
+
+def _make_ve(top):
+    ve = make_ve(top)
+    os.link(os.path.join(ve, "lib", "mod.py"), os.path.join(ve, "lib", "twin"))
+    os.symlink(os.path.join(ve, "bin", "tool"),
+               os.path.join(ve, "bin", "abs-link"))
+    write(os.path.join(ve, PACKAGES_RECORD), b"{}")
+    return ve
+
+
+@pytest.mark.parametrize("compression", [None, "gz"])
+def test_round_trip(compression):
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        old = _make_ve(top)
+        buf = io.BytesIO()
+        archive.export_virtualenv(old, buf, compression)
+        buf.seek(0)
+        new = os.path.join(top, "group", "new")
+        count, rewritten = archive.import_virtualenv(buf, new)
+        assert rewritten == 1
+        bin_path = os.path.join(new, "bin")
+        assert read(os.path.join(bin_path, "tool")) == \
+            "#!{0}/bin/python\n".format(new)
+        # Hardlinked files are stored once and stay linked.
+        assert os.stat(os.path.join(new, "lib", "twin")).st_nlink == 2
+        assert os.readlink(os.path.join(bin_path, "python")) == \
+            "/usr/bin/python3"
+        assert os.readlink(os.path.join(bin_path, "abs-link")) == \
+            os.path.join(bin_path, "tool")
+        assert not os.path.exists(os.path.join(new, PACKAGES_RECORD))
+        assert sorted(os.listdir(os.path.join(top, "group"))) == ["new"]
+
+
+def test_import_root_mode_follows_umask():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        buf = io.BytesIO()
+        archive.export_virtualenv(_make_ve(top), buf)
+        buf.seek(0)
+        new = os.path.join(top, "new")
+        umask = os.umask(0o027)
+        try:
+            archive.import_virtualenv(buf, new)
+        finally:
+            os.umask(umask)
+        assert os.stat(new).st_mode & 0o777 == 0o750
+
+
+def test_unsafe_member():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            info = tarfile.TarInfo("../escape")
+            tar.addfile(info, io.BytesIO(b""))
+        buf.seek(0)
+        new = os.path.join(top, "new")
+        with pytest.raises(exceptions.InvalidArchive):
+            archive.import_virtualenv(buf, new)
+        assert os.listdir(top) == []
+        assert not os.path.exists(os.path.join(os.path.dirname(top), "escape"))
+
+
+def _symlink_info(name, target):
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.SYMTYPE
+    info.linkname = target
+    return info
+
+
+@pytest.mark.parametrize("members", [
+    [_symlink_info("lib", "/")],
+    # Writing into a directory through a symlink to it.
+    [_symlink_info("lib", "bin"), tarfile.TarInfo("lib/planted")],
+    # Overwriting whatever a symlink points at.
+    [_symlink_info("bin/python", "python3"),
+     tarfile.TarInfo("bin/python")],
+    [_symlink_info("up", "../..")],
+])
+def test_unsafe_symlinks(members):
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            for info in members:
+                tar.addfile(info, io.BytesIO(b""))
+        buf.seek(0)
+        new = os.path.join(top, "new")
+        with pytest.raises(exceptions.InvalidArchive):
+            archive.import_virtualenv(buf, new)
+        assert os.listdir(top) == []
+
+
+def test_not_an_archive():
+    with TempDir() as temp:
+        new = os.path.join(temp.path.decode("utf-8"), "new")
+        with pytest.raises(exceptions.InvalidArchive):
+            archive.import_virtualenv(io.BytesIO(b"nonsense" * 100), new)
+        assert not os.path.exists(new)
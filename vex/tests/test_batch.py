@@ -0,0 +1,98 @@
+import io
+import os
+import json
+import time
+import signal
+from mock import patch
+from pytest import raises, mark
+from vex import batch, exceptions
+from . tempdir import TempDir
+
+
+def test_read_records():
+    data = b"a\nb c\n" * 20000 + b"last"
+    records = list(batch.read_records(io.BytesIO(data)))
+    assert len(records) == 40001
+    assert records[:2] == [b"a", b"b c"]
+    assert records[-1] == b"last"
+    assert list(batch.read_records(io.BytesIO(b"x\ny\0z\0"), null=True)) \
+        == [b"x\ny", b"z"]
+
+
+def test_parse_command():
+    assert batch.parse_command(b"echo 'a b' c # note") == ["echo", "a b", "c"]
+    assert batch.parse_command(b"  # just a comment") == []
+    with raises(exceptions.InvalidCommand):
+        batch.parse_command(b"echo 'unclosed")
+
+
+def _write_batch(top, text):
+    path = os.path.join(top, "commands")
+    with open(path, "w") as out:
+        out.write(text)
+    return path
+
+
+def test_stop_or_keep_going(capsys):
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        path = _write_batch(top, "touch a\nsh -c 'exit 3'\ntouch b\n")
+        env = dict(os.environ)
+        assert batch.handle_batch(path, env, top) == 3
+        assert os.path.exists(os.path.join(top, "a"))
+        assert not os.path.exists(os.path.join(top, "b"))
+        err = capsys.readouterr()[1].splitlines()
+        assert err[0].startswith("1\t0\t")
+        assert err[1].startswith("2\t3\t")
+        assert err[-1] == "2 commands run, 1 failed"
+        assert batch.handle_batch(
+            path, env, top, keep_going=True, as_json=True) == 3
+        assert os.path.exists(os.path.join(top, "b"))
+        results = [json.loads(line)
+                   for line in capsys.readouterr()[1].splitlines()[:-1]]
+        assert [result["returncode"] for result in results] == [0, 3, 0]
+        assert results[2]["command"] == ["touch", "b"]
+
+
+def test_parallel(capsys):
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        path = _write_batch(
+            top, "".join("touch {0}\n".format(n) for n in range(20)) +
+            "no-such-command-here\n")
+        assert batch.handle_batch(
+            path, dict(os.environ), top, jobs=4, keep_going=True) == \
+            batch.NOT_FOUND
+        assert all(os.path.exists(os.path.join(top, str(n)))
+                   for n in range(20))
+        err = capsys.readouterr()[1].splitlines()
+        assert len(err) == 22
+        assert "21\tnot found\t" in "\n".join(err)
+        assert err[-1] == "21 commands run, 1 failed"
+
+
+@mark.skipif(not hasattr(os, "killpg"), reason="needs process groups")
+def test_parallel_signals(capsys):
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        # The third command signals vex, which should pass it on to all
+        # of them, and start no more.
+        path = _write_batch(
+            top, "sleep 30\nsleep 30\n"
+            "sh -c 'sleep 0.3; kill -TERM $PPID; sleep 30'\ntouch after\n")
+        started = time.time()
+        with patch("vex.batch.wants_own_group", return_value=True):
+            assert batch.handle_batch(
+                path, dict(os.environ), top, jobs=3) == 128 + signal.SIGTERM
+        assert time.time() - started < 10
+        assert not os.path.exists(os.path.join(top, "after"))
+        assert capsys.readouterr()[1].splitlines()[-1] == \
+            "3 commands run, 3 failed"
+        assert signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+
+
+def test_unreadable_file():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        with raises(exceptions.InvalidCommand):
+            batch.handle_batch(os.path.join(top, "nope"), {}, top)
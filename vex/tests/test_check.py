@@ -0,0 +1,101 @@
+import os
+import json
+from vex import check
+from vex.cache import JSONCache
+from vex.index import VirtualenvIndex
+from . files import make_ve, write
+from . tempdir import TempDir
+
+
+def test_read_shebang():
+    with TempDir() as temp:
+        path = os.path.join(temp.path.decode("utf-8"), "script")
+        write(path, b"#!/x/bin/python -E\nprint(1)\n")
+        assert check.read_shebang(path) == "/x/bin/python"
+        write(path, b"#!/bin/sh\n'''exec' /long/bin/python \"$0\" \"$@\"\n")
+        assert check.read_shebang(path) == "/long/bin/python"
+        write(path, b"\x7fELF")
+        assert check.read_shebang(path) is None
+
+
+def test_check_virtualenv_ok():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        home = os.path.join(top, "python", "bin")
+        os.makedirs(home)
+        write(os.path.join(home, "python3"), b"")
+        ve = make_ve(top, "ve", home)
+        problems, depends = check.check_virtualenv(ve)
+        assert problems == []
+        assert home in depends
+
+
+def test_check_virtualenv_broken_python():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        home = os.path.join(top, "python", "bin")
+        ve = make_ve(top, "ve", home)
+        problems, _ = check.check_virtualenv(ve)
+        assert len(problems) == 3
+        assert "pyvenv.cfg home" in problems[0]
+        assert problems[1].startswith("python is a dangling symlink")
+        assert problems[2].startswith("tool runs missing interpreter")
+
+
+def test_check_all_caches_until_changed():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        home = os.path.join(top, "python", "bin")
+        os.makedirs(home)
+        ve = make_ve(top, "ve", home)
+        cache = JSONCache(None)
+        assert check.check_all([ve], cache)[ve] == [
+            "python is a dangling symlink to {0!r}".format(
+                os.path.join(home, "python3")),
+            "tool runs missing interpreter {0!r}".format(
+                os.path.join(ve, "bin", "python")),
+        ]
+        entry = cache.get("check:" + ve)
+        assert check.is_current(entry)
+        # Installing the python changes its directory's mtime.
+        write(os.path.join(home, "python3"), b"")
+        os.utime(home, (0, 0))
+        assert not check.is_current(entry)
+        assert check.check_all([ve], cache)[ve] == []
+
+
+def test_check_all_prunes_removed_virtualenvs():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        home = os.path.join(top, "python", "bin")
+        os.makedirs(home)
+        write(os.path.join(home, "python3"), b"")
+        ve = make_ve(top, "ve", home)
+        gone = os.path.join(top, "gone")
+        cache = JSONCache(None)
+        cache["check:" + gone] = [[], 0, []]
+        check.check_all([ve], cache)
+        assert cache.get("check:" + ve)
+        assert cache.get("check:" + gone) is None
+
+
+def test_handle_check(capsys):
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        home = os.path.join(top, "python", "bin")
+        os.makedirs(home)
+        write(os.path.join(home, "python3"), b"")
+        root = os.path.join(top, "ves")
+        make_ve(root, "good", home)
+        make_ve(root, "bad", os.path.join(top, "gone"))
+        index = VirtualenvIndex([root], JSONCache(None))
+        assert check.handle_check(index, JSONCache(None)) == 1
+        out = capsys.readouterr()[0].splitlines()
+        assert out[0].startswith("broken\tbad\t")
+        assert out[1] == "ok\tgood"
+        assert check.handle_check(
+            index, JSONCache(None), "go", as_json=True) == 0
+        result = json.loads(capsys.readouterr()[0])
+        assert result["name"] == "good"
+        assert result["ok"] is True
+        assert result["problems"] == []
@@ -2,7 +2,9 @@ import os
 from io import BytesIO
 from mock import patch
 from vex import config
+from vex.cache import JSONCache
 from . fakes import FakeEnviron, PatchedModule, make_fake_exists
+from . tempdir import TempDir
 
 
 TYPICAL_VEXRC = """
@@ -15,6 +17,22 @@ arbitrary:
     x=y
 """.lstrip().encode("utf-8")
 
+SCOPED_VEXRC = """
+env:
+    ANSWER=42
+    COLOR=red
+
+env:web-*:
+    COLOR=blue
+    PORT=80
+
+env:web-api:
+    PORT=8080
+
+env:web*:
+    COLOR=green
+""".lstrip().encode("utf-8")
+
 EXPAND_VEXRC = """
 a="{SHELL}"
 b='{SHELL}'
@@ -36,6 +54,12 @@ class TestExtractHeading(object):
     def test_no_colon(self):
         assert config.extract_heading("foo") is None
 
+    def test_scoped(self):
+        assert config.extract_heading("env:web-*:") == "env:web-*"
+
+    def test_scoped_with_space(self):
+        assert config.extract_heading("env:web api:") is None
+
 
 class TestExtractKeyValue(object):
     def test_normal(self):
@@ -83,6 +107,23 @@ class TestVexrc(object):
             assert list(vexrc["env"].items()) == [("ANSWER", "42")]
             assert list(vexrc["arbitrary"].items()) == [("x", "y")]
 
+    def test_get_env_scoped(self):
+        with patch("vex.config.open", create=True) as mock_open:
+            mock_open.return_value = BytesIO(SCOPED_VEXRC)
+            vexrc = config.Vexrc.from_file("stuff", {})
+        assert vexrc.get_env("other") == {"ANSWER": "42", "COLOR": "red"}
+        assert vexrc.get_env("web-ui") == {
+            "ANSWER": "42", "COLOR": "green", "PORT": "80"}
+        # exact section wins over globs regardless of position
+        assert vexrc.get_env("web-api") == {
+            "ANSWER": "42", "COLOR": "green", "PORT": "8080"}
+
+    def test_get_env_cached(self):
+        with patch("vex.config.open", create=True) as mock_open:
+            mock_open.return_value = BytesIO(SCOPED_VEXRC)
+            vexrc = config.Vexrc.from_file("stuff", {})
+        assert vexrc.get_env("web-ui") is vexrc.get_env("web-ui")
+
     def test_read_expand(self):
         environ = {"SHELL": "smash"}
         with patch("vex.config.open", create=True) as mock_open:
@@ -144,6 +185,33 @@ class TestVexrc(object):
             environ = {"WORKON_HOME": "", "HOME": ""}
             assert vexrc.get_ve_base(environ) == ""
 
+    def test_get_ve_bases_in_vexrc_file(self):
+        vexrc = config.Vexrc()
+        root = vexrc.headings[vexrc.default_heading]
+        root["virtualenvs"] = os.pathsep.join(["/mine", "", "/shared"])
+        environ = {"WORKON_HOME": "/bad1", "HOME": "/bad2"}
+        assert vexrc.get_ve_bases(environ) == ["/mine", "/shared"]
+        assert vexrc.get_ve_base(environ) == "/mine"
+
+    def test_get_ve_bases_workon_home(self):
+        vexrc = config.Vexrc()
+        environ = {"WORKON_HOME": os.pathsep.join(["/a", "/b"])}
+        assert vexrc.get_ve_bases(environ) == ["/a", "/b"]
+
+    def test_get_cache_dir(self):
+        vexrc = config.Vexrc()
+        assert vexrc.get_cache_dir({"HOME": "/home/me"}) == \
+            os.path.join("/home/me", ".cache", "vex")
+        assert vexrc.get_cache_dir(
+            {"HOME": "/home/me", "XDG_CACHE_HOME": "/caches"}) == \
+            os.path.join("/caches", "vex")
+        # Relative directories are ignored, rather than used from '.'.
+        assert vexrc.get_cache_dir(
+            {"HOME": "/home/me", "XDG_CACHE_HOME": "caches"}) == \
+            os.path.join("/home/me", ".cache", "vex")
+        assert vexrc.get_cache_dir({"HOME": "ignore"}) == ""
+        assert vexrc.get_cache_dir({}) == ""
+
     def test_ve_base_fake_windows(self):
         vexrc = config.Vexrc()
         environ = {"HOMEDRIVE": "C:", "HOMEPATH": "foo", "WORKON_HOME": ""}
@@ -159,3 +227,64 @@ class TestVexrc(object):
             logging.error("path is %r", path)
             assert path
             assert path.startswith("C:")
+
+
+class TestFindProjectVexrcs(object):
+
+    def test_finds_outermost_first(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            inner = os.path.join(top, "a", "b")
+            os.makedirs(inner)
+            for directory in (top, os.path.join(top, "a", "b")):
+                with open(os.path.join(directory, ".vexrc"), "wb"):
+                    pass
+            found = config.find_project_vexrcs(inner, JSONCache(None))
+            assert found[-2:] == [
+                os.path.join(top, ".vexrc"),
+                os.path.join(inner, ".vexrc"),
+            ]
+
+    def test_cached_walk_does_not_probe(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            with open(os.path.join(top, ".vexrc"), "wb"):
+                pass
+            cache = JSONCache(None)
+            first = config.find_project_vexrcs(top, cache)
+            with patch("os.path.isfile", side_effect=AssertionError):
+                second = config.find_project_vexrcs(top, cache)
+            assert first == second
+
+    def test_new_file_invalidates(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            cache = JSONCache(None)
+            before = config.find_project_vexrcs(top, cache)
+            assert os.path.join(top, ".vexrc") not in before
+            path = os.path.join(top, ".vexrc")
+            with open(path, "wb"):
+                pass
+            # Make sure mtime differs even on coarse-grained filesystems.
+            stat = os.stat(top)
+            os.utime(top, (stat.st_atime, stat.st_mtime + 10))
+            assert path in config.find_project_vexrcs(top, cache)
+
+
+class TestDump(object):
+
+    def test_dump_shows_origins(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            user = os.path.join(top, "user")
+            project = os.path.join(top, "project")
+            with open(user, "wb") as out:
+                out.write(b"shell=bash\nenv:\n    A=1\n")
+            with open(project, "wb") as out:
+                out.write(b"shell=zsh\n")
+            vexrc = config.Vexrc.from_file(user, {})
+            vexrc.read(project, {})
+            dump = vexrc.dump()
+        assert "# read: {0}".format(user) in dump
+        assert "    shell=zsh  # {0}".format(project) in dump
+        assert "    A=1  # {0}".format(user) in dump
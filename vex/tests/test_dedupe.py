@@ -0,0 +1,99 @@
+import os
+from vex import dedupe, exceptions
+from vex.cache import JSONCache
+from vex.index import VirtualenvIndex
+from vex.links import replace_with_link
+from . files import write
+from . tempdir import TempDir
+
+
+def _setup(top):
+    root = os.path.join(top, "ves")
+    for name in ("a", "b", "c"):
+        os.makedirs(os.path.join(root, name, "bin"))
+        write(os.path.join(root, name, "bin", "same"), b"same" * 100)
+        write(os.path.join(root, name, "bin", "other"), name.encode() * 400)
+    # Same size as "same", different contents.
+    write(os.path.join(root, "c", "bin", "same"), b"diff" * 100)
+    return root
+
+
+def test_replace_with_link():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        target = os.path.join(top, "target")
+        path = os.path.join(top, "path")
+        write(target, b"x")
+        write(path, b"x")
+        replace_with_link(path, target)
+        assert os.path.samefile(path, target)
+        assert sorted(os.listdir(top)) == ["path", "target"]
+
+
+def test_plan_links():
+    with TempDir() as temp:
+        root = _setup(temp.path.decode("utf-8"))
+        roots = [os.path.join(root, name) for name in ("a", "b", "c")]
+        infos = dedupe.collect_files(roots)
+        assert len(infos) == 6
+        groups = dedupe.group_candidates(infos)
+        hashes = dedupe.hash_inodes(
+            [info for group in groups for info in group], JSONCache(None))
+        links, saved = dedupe.plan_links(groups, hashes)
+        assert [(info.path, keeper.path) for info, keeper in links] == [(
+            os.path.join(root, "b", "bin", "same"),
+            os.path.join(root, "a", "bin", "same"),
+        )]
+        assert saved == 400
+
+
+def test_hash_inodes_uses_cache():
+    with TempDir() as temp:
+        root = _setup(temp.path.decode("utf-8"))
+        infos = dedupe.collect_files([os.path.join(root, "a")])
+        cache = JSONCache(None)
+        hashes = dedupe.hash_inodes(infos, cache)
+        info = infos[0]
+        key = "hash:{0}:{1}".format(info.dev, info.ino)
+        cache[key] = [info.mtime, info.size, "cached"]
+        assert dedupe.hash_inodes(infos, cache)[
+            (info.dev, info.ino)] == "cached"
+        assert hashes[(info.dev, info.ino)] != "cached"
+
+
+def test_handle_dedupe(capsys):
+    with TempDir() as temp:
+        root = _setup(temp.path.decode("utf-8"))
+        a_same = os.path.join(root, "a", "bin", "same")
+        b_same = os.path.join(root, "b", "bin", "same")
+        index = VirtualenvIndex([root], JSONCache(None))
+        usage_cache = JSONCache(None)
+        usage_cache["du:" + os.path.dirname(a_same)] = [0, 0, 0, [], []]
+        assert dedupe.handle_dedupe(
+            index, JSONCache(None), dry_run=True) == 0
+        out, err = capsys.readouterr()
+        assert out == "{0} -> {1}\n".format(b_same, a_same)
+        assert err == "would link 1 files, saving 400B\n"
+        assert not os.path.samefile(a_same, b_same)
+        assert dedupe.handle_dedupe(
+            index, JSONCache(None), usage_cache=usage_cache) == 0
+        assert os.path.samefile(a_same, b_same)
+        assert "du:" + os.path.dirname(a_same) not in usage_cache
+        assert not os.path.samefile(
+            a_same, os.path.join(root, "c", "bin", "same"))
+
+
+def test_apply_links_stays_inside_roots():
+    with TempDir() as temp:
+        root = _setup(temp.path.decode("utf-8"))
+        roots = [os.path.join(root, name) for name in ("a", "b")]
+        infos = dedupe.collect_files(roots)
+        groups = dedupe.group_candidates(infos)
+        hashes = dedupe.hash_inodes(infos, JSONCache(None))
+        links, _ = dedupe.plan_links(groups, hashes)
+        try:
+            dedupe.apply_links(links, roots[:1])
+        except exceptions.InvalidArgument:
+            pass
+        else:
+            assert False, "linked outside roots"
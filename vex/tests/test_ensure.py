@@ -0,0 +1,107 @@
+import os
+import sys
+from argparse import Namespace
+from mock import patch
+from pytest import raises
+from vex import ensure, exceptions
+from vex.cache import JSONCache
+from vex.lock import FileLock
+from vex.store import STORE_DIR
+from . tempdir import TempDir
+
+
+def test_requirements_hash():
+    first = ensure.requirements_hash("3.11.7", b"six==1.16.0\n")
+    assert first == ensure.requirements_hash("3.11.7", b"six==1.16.0\n")
+    assert first != ensure.requirements_hash("3.11.8", b"six==1.16.0\n")
+    assert first != ensure.requirements_hash("3.11.7", b"six==1.15.0\n")
+    assert first != ensure.requirements_hash(
+        "3.11.7", b"six==1.16.0\n", site_packages=True)
+    assert first != ensure.requirements_hash(
+        "3.11.7", b"six==1.16.0\n", always_copy=True)
+    assert first != ensure.requirements_hash(
+        "3.11.7", b"six==1.16.0\n", wheelhouse="/wheels")
+
+
+def test_read_requirements_follows_includes():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        os.mkdir(os.path.join(top, "sub"))
+        paths = {
+            "reqs.txt": b"-r sub/base.txt\n--constraint=sub/pins.txt\n"
+                        b"-r https://example.com/x.txt\n",
+            "sub/base.txt": b"six\n-r ../reqs.txt\n",
+            "sub/pins.txt": b"six==1.16.0\n",
+        }
+        for name, data in paths.items():
+            with open(os.path.join(top, name), "wb") as out:
+                out.write(data)
+        reqs = os.path.join(top, "reqs.txt")
+        first = ensure.read_requirements(reqs)
+        assert first == b"\0".join([
+            paths["reqs.txt"], paths["sub/base.txt"], b"",
+            paths["sub/pins.txt"]])
+        # Changing a pin changes what gets hashed.
+        with open(os.path.join(top, "sub", "pins.txt"), "wb") as out:
+            out.write(b"six==1.15.0\n")
+        assert ensure.read_requirements(reqs) != first
+        os.remove(os.path.join(top, "sub", "pins.txt"))
+        with raises(exceptions.InvalidArgument):
+            ensure.read_requirements(reqs)
+
+
+def test_interpreter_version_is_cached():
+    cache = JSONCache(None)
+    version = ensure.interpreter_version(sys.executable, cache)
+    assert version.startswith(sys.version.split()[0])
+    key = "python:" + os.path.realpath(sys.executable)
+    cache[key] = cache[key][:2] + ["cached"]
+    assert ensure.interpreter_version(sys.executable, cache) == "cached"
+
+
+def test_file_lock():
+    with TempDir() as temp:
+        path = os.path.join(temp.path.decode("utf-8"), "locks", "x")
+        with FileLock(path):
+            assert not FileLock(path).acquire(blocking=False)
+        other = FileLock(path)
+        assert other.acquire(blocking=False)
+        other.release()
+
+
+def test_handle_ensure_reuses_complete():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        reqs = os.path.join(top, "reqs.txt")
+        with open(reqs, "wb") as out:
+            out.write(b"six==1.16.0\n")
+        cache = JSONCache(None)
+        version = ensure.interpreter_version(sys.executable, cache)
+        key = ensure.requirements_hash(version, b"six==1.16.0\n")
+        ve_path = os.path.join(top, STORE_DIR, "envs", key)
+        os.makedirs(ve_path)
+        with open(os.path.join(ve_path, ensure.MARKER), "w"):
+            pass
+        options = Namespace(ensure=reqs, site_packages=False)
+        found = ensure.handle_ensure(
+            {}, options, top, sys.executable, cache)
+        assert found == ve_path
+
+
+def test_build_cleans_up_failure():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        ve_path = os.path.join(top, "ve")
+        os.makedirs(os.path.join(ve_path, "leftover"))
+
+        def fail(environ, options, path):
+            assert not os.path.exists(os.path.join(path, "leftover"))
+            os.makedirs(path)
+            raise exceptions.VirtualenvNotMade("no")
+
+        with patch("vex.ensure.handle_make", fail):
+            try:
+                ensure.build({}, Namespace(), ve_path, "reqs.txt", "3")
+            except exceptions.VirtualenvNotMade:
+                pass
+        assert not os.path.exists(ve_path)
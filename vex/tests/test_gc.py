@@ -0,0 +1,101 @@
+import os
+import shutil
+from mock import patch
+from pytest import raises
+from vex import gc
+from vex import exceptions
+from vex.cache import JSONCache
+from vex.config import Vexrc
+from vex.ensure import MARKER
+from vex.index import VirtualenvIndex
+from vex.lastused import record_use
+from vex.store import get_store
+from vex.usage import Usage
+from . fakes import Object
+from . tempdir import TempDir
+
+
+def make_options(**kwargs):
+    values = {"max_total_size": None, "max_age": None}
+    values.update(kwargs)
+    return Object(**values)
+
+
+class TestGetPolicy(object):
+    def test_nothing(self):
+        with raises(exceptions.BadConfig):
+            gc.get_policy(make_options(), Vexrc())
+
+    def test_options_over_vexrc(self):
+        vexrc = Vexrc()
+        vexrc.headings["gc"] = {
+            "max_total_size": "1G", "max_age": "30d",
+            "protect": "base, team/*"}
+        policy = gc.get_policy(make_options(max_age="7d"), vexrc)
+        assert policy.max_total_size == 1 << 30
+        assert policy.max_age == 7 * 86400
+        assert policy.min_age == gc.DEFAULT_MIN_AGE
+        assert policy.is_protected("team/web")
+        assert not policy.is_protected("web")
+
+    def test_invalid(self):
+        vexrc = Vexrc()
+        vexrc.headings["gc"] = {"max_total_size": "lots"}
+        with raises(exceptions.BadConfig):
+            gc.get_policy(make_options(), vexrc)
+
+
+def test_plan_removal():
+    found = [(t, name, "/ves/" + name) for t, name in [
+        (100, "oldest"), (200, "base"), (300, "old"), (900, "new"),
+        (990, "newest")]]
+    usages = dict((path, Usage(10, 10)) for _, _, path in found)
+    policy = gc.Policy(max_total_size=25, min_age=50, protect=["base"])
+    chosen = gc.plan_removal(found, usages, 50, policy, 1000)
+    assert [name for name, _, _ in chosen] == ["oldest", "old", "new"]
+    policy = gc.Policy(max_age=750, min_age=50)
+    chosen = gc.plan_removal(found, usages, 50, policy, 1000)
+    assert [name for name, _, _ in chosen] == ["oldest", "base"]
+
+
+def test_handle_gc():
+    with TempDir() as temp:
+        base = temp.path.decode("utf-8")
+        paths = {}
+        for name in ("a", "b", "c"):
+            paths[name] = os.path.join(base, name)
+            os.makedirs(os.path.join(paths[name], "bin"))
+            with open(os.path.join(paths[name], "bin", "big"), "wb") as out:
+                out.write(b"x" * 100000)
+            os.utime(paths[name], (1, 1))
+        # b was used recently, so a and c go first.
+        record_use([base], paths["b"])
+        index = VirtualenvIndex([base], JSONCache(None))
+        policy = gc.Policy(max_total_size=150000, min_age=0)
+        with patch("vex.gc.handle_remove",
+                   side_effect=lambda path, quiet: shutil.rmtree(path)) as rm:
+            assert gc.handle_gc(base, index, JSONCache(None), policy) == 0
+        assert [call[0][0] for call in rm.call_args_list] == [
+            paths["a"], paths["c"]]
+        assert os.path.isdir(paths["b"])
+
+
+def test_handle_gc_ensured():
+    with TempDir() as temp:
+        base = temp.path.decode("utf-8")
+        envs = get_store(base, "envs")
+        done = os.path.join(envs, "a" * 32)
+        building = os.path.join(envs, "b" * 32)
+        for path in (done, building):
+            os.makedirs(os.path.join(path, "bin"))
+        with open(os.path.join(done, MARKER), "w") as out:
+            out.write("{}")
+        for path in (done, building):
+            os.utime(path, (1, 1))
+        index = VirtualenvIndex([base], JSONCache(None))
+        assert [name for _, name, _ in gc.find_virtualenvs(base, index)] \
+            == [".vex-store/envs/" + "a" * 32]
+        policy = gc.Policy(max_age=60, min_age=0)
+        with patch("vex.gc.handle_remove") as rm:
+            assert gc.handle_gc(base, index, JSONCache(None), policy) == 0
+        rm.assert_called_once_with(done, quiet=True)
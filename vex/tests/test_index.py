@@ -0,0 +1,250 @@
+import os
+from pytest import raises
+from mock import patch
+from vex import exceptions
+from vex.cache import JSONCache
+from vex.index import VirtualenvIndex, fuzzy_score, name_for_path
+from vex.index import get_virtualenv_path
+from . fakes import make_fake_exists
+from . tempdir import TempDir
+
+
+def make_virtualenvs(top, names):
+    """Make directories that look enough like virtualenvs.
+    """
+    for name in names:
+        os.makedirs(os.path.join(top, name, "bin"))
+
+
+class TestVirtualenvIndex(object):
+
+    def test_shadowing(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            first = os.path.join(top, "first")
+            second = os.path.join(top, "second")
+            make_virtualenvs(first, ["a", "b"])
+            make_virtualenvs(second, ["b", "c", ".hidden", "-flag"])
+            index = VirtualenvIndex([first, second], JSONCache(None))
+            assert index.names() == ["a", "b", "c"]
+            assert index.lookup("b") == os.path.join(first, "b")
+            assert index.lookup("c") == os.path.join(second, "c")
+            assert index.lookup(".hidden") is None
+            assert index.shadowed["b"] == [os.path.join(second, "b")]
+
+    def test_missing_root(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            make_virtualenvs(top, ["a"])
+            missing = os.path.join(top, "missing")
+            index = VirtualenvIndex([missing, top], JSONCache(None))
+            assert index.names() == ["a"]
+
+    def test_cached_listing(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            make_virtualenvs(top, ["a", "b"])
+            cache = JSONCache(None)
+            assert VirtualenvIndex([top], cache).names() == ["a", "b"]
+            # An unchanged directory is not listed again.
+            cache["dir:" + top][1].append("phantom")
+            assert VirtualenvIndex([top], cache).names() == [
+                "a", "b", "phantom"]
+
+    def test_prunes_removed_directories(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            gone = os.path.join(top, "gone")
+            make_virtualenvs(top, ["a"])
+            cache = JSONCache(None)
+            cache["dir:" + gone] = [0, []]
+            cache["other:" + gone] = 1
+            assert VirtualenvIndex([top], cache).names() == ["a"]
+            assert "dir:" + gone not in cache.load()
+            assert cache.get("other:" + gone) == 1
+
+    def test_prefix(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            make_virtualenvs(top, ["alpha", "beta", "alps"])
+            index = VirtualenvIndex([top], JSONCache(None))
+            assert index.names("al") == ["alpha", "alps"]
+            assert index.names("z") == []
+
+    def test_namespaces(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            make_virtualenvs(top, [
+                "plain",
+                os.path.join("team", "api", "py311"),
+                os.path.join("team", "api", "py312"),
+                os.path.join("team", "web"),
+            ])
+            os.makedirs(os.path.join(top, "empty_group"))
+            index = VirtualenvIndex([top], JSONCache(None))
+            assert index.names() == [
+                "empty_group", "plain",
+                "team/api/py311", "team/api/py312", "team/web"]
+            assert index.names("team/api/") == [
+                "team/api/py311", "team/api/py312"]
+            assert index.lookup("team/web") == os.path.join(
+                top, "team", "web")
+            # Virtualenvs are leaves: their own directories aren't indexed.
+            assert "plain/bin" not in index.load()
+
+    def test_group_becomes_virtualenv(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            pending = os.path.join(top, "pending")
+            os.makedirs(pending)
+            cache = JSONCache(None)
+            # An empty directory is listed, as it might be a virtualenv.
+            assert VirtualenvIndex([top], cache).names() == ["pending"]
+            os.makedirs(os.path.join(pending, "bin"))
+            stat = os.stat(pending)
+            os.utime(pending, (stat.st_atime, stat.st_mtime + 10))
+            # ...and once it is one, what's inside it isn't.
+            assert VirtualenvIndex([top], cache).names() == ["pending"]
+
+    def test_empty_include(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            # Newer virtualenv versions leave include empty.
+            make_virtualenvs(top, [os.path.join("venv", "include")])
+            with open(os.path.join(top, "venv", "pyvenv.cfg"), "w") as out:
+                out.write("home = /usr/bin\n")
+            os.makedirs(os.path.join(top, "venv", "bin"))
+            index = VirtualenvIndex([top], JSONCache(None))
+            assert index.names() == ["venv"]
+
+    def test_candidates(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            make_virtualenvs(top, [
+                "service-api-py311",
+                "service-web-py311",
+                "tools",
+            ])
+            index = VirtualenvIndex([top], JSONCache(None))
+            assert index.candidates("to") == (["tools"], [])
+            assert index.candidates("service-") == (
+                ["service-api-py311", "service-web-py311"], [])
+            assert index.candidates("sweb") == (["service-web-py311"], [])
+            assert index.candidates("tols") == (["tools"], [])
+            assert index.candidates("xyzzy") == ([], [])
+            assert index.candidates("toolz") == ([], ["tools"])
+
+
+def test_fuzzy_score_prefers_tight_matches():
+    assert fuzzy_score("api", "xapi") < fuzzy_score("api", "a-p-i")
+    assert fuzzy_score("q", "api") is None
+
+
+def test_name_for_path():
+    roots = ["/a", "/b"]
+    assert name_for_path(roots, "/b/team/x") == "team/x"
+    assert name_for_path(roots, "/elsewhere/y") == "y"
+
+
+class TestGetVirtualenvPath(object):
+
+    def test_no_ve_base(self):
+        with raises(exceptions.NoVirtualenvsDirectory):
+            get_virtualenv_path("", "anything")
+
+    def test_nonexistent_ve_base(self):
+        with raises(exceptions.NoVirtualenvsDirectory):
+            get_virtualenv_path("/unlikely_to_exist1", "anything")
+
+    def test_no_ve_name(self):
+        fake_path = os.path.abspath(os.path.join("pretends_to_exist"))
+        fake_exists = make_fake_exists([fake_path])
+        with patch("os.path.exists", wraps=fake_exists), \
+          raises(exceptions.InvalidVirtualenv):
+            get_virtualenv_path(fake_path, "")
+
+    def test_nonexistent_ve_path(self):
+        fake_path = os.path.abspath(os.path.join("pretends_to_exist"))
+        fake_exists = make_fake_exists([fake_path])
+        with patch("os.path.exists", wraps=fake_exists), \
+          raises(exceptions.InvalidVirtualenv):
+            get_virtualenv_path(fake_path, "/unlikely_to_exist2")
+
+    def test_happy(self):
+        fake_base = os.path.abspath(os.path.join("pretends_to_exist"))
+        fake_name = "also_pretend"
+        fake_path = os.path.join(fake_base, fake_name)
+        fake_exists = make_fake_exists([fake_base, fake_path])
+        with patch("os.path.exists", wraps=fake_exists):
+            path = get_virtualenv_path(fake_base, fake_name)
+            assert path == fake_path
+
+
+    def test_multiple_roots(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            first = os.path.join(top, "first")
+            second = os.path.join(top, "second")
+            os.makedirs(os.path.join(first, "mine", "bin"))
+            os.makedirs(os.path.join(second, "mine", "bin"))
+            os.makedirs(os.path.join(second, "shared", "bin"))
+            roots = [first, second]
+            index = VirtualenvIndex(roots, JSONCache(None))
+            assert get_virtualenv_path(roots, "mine", index) == \
+                os.path.join(first, "mine")
+            assert get_virtualenv_path(roots, "shared", index) == \
+                os.path.join(second, "shared")
+            with raises(exceptions.InvalidVirtualenv):
+                get_virtualenv_path(roots, "nope", index)
+
+    def test_multiple_roots_exact_name_skips_index(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            os.makedirs(os.path.join(top, "second", "shared", "bin"))
+            roots = [os.path.join(top, "first"), os.path.join(top, "second")]
+            index = VirtualenvIndex(roots, JSONCache(None))
+            assert get_virtualenv_path(roots, "shared", index) == \
+                os.path.join(top, "second", "shared")
+            assert index.paths is None
+
+    def test_multiple_roots_first_missing(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            os.makedirs(os.path.join(top, "there"))
+            roots = [os.path.join(top, "missing"), top]
+            index = VirtualenvIndex(roots, JSONCache(None))
+            assert get_virtualenv_path(roots, "there", index) == \
+                os.path.join(top, "there")
+
+
+    def test_namespaced(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            os.makedirs(os.path.join(top, "team", "api", "bin"))
+            path = get_virtualenv_path(top, "team/api")
+            assert path == os.path.join(top, "team", "api")
+
+    def test_namespaced_escape(self):
+        fake_base = os.path.abspath(os.path.join("pretends_to_exist"))
+        fake_exists = make_fake_exists([fake_base])
+        with patch("os.path.exists", wraps=fake_exists), \
+          raises(exceptions.InvalidVirtualenv):
+            get_virtualenv_path(fake_base, "team/../../etc")
+
+
+    def test_inexact(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            for name in ("service-api", "service-web", "tools"):
+                os.makedirs(os.path.join(top, name, "bin"))
+            index = VirtualenvIndex([top], JSONCache(None))
+            path = get_virtualenv_path(top, "to", index, inexact=True)
+            assert path == os.path.join(top, "tools")
+            path = get_virtualenv_path(top, "sweb", index, inexact=True)
+            assert path == os.path.join(top, "service-web")
+            with raises(exceptions.AmbiguousVirtualenv) as info:
+                get_virtualenv_path(
+                    top, "service", index, inexact=True)
+            assert info.value.candidates == ["service-api", "service-web"]
+            with raises(exceptions.InvalidVirtualenv):
+                get_virtualenv_path(top, "to", index)
@@ -0,0 +1,73 @@
+import os
+from mock import patch
+from vex import lastused
+from vex.store import STORE_DIR
+from . tempdir import TempDir
+
+
+def test_record_and_compact():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        base = os.path.join(top, "virtualenvs")
+        os.makedirs(base)
+        foo = os.path.join(base, "team", "foo")
+        lastused.record_use([base], foo, now=100)
+        lastused.record_use([base], foo, now=300)
+        lastused.record_use([base], os.path.join(base, "bar"), now=200)
+        # Not under any of the directories, so not recorded.
+        lastused.record_use([base], os.path.join(top, "elsewhere"), now=1)
+        log = os.path.join(base, STORE_DIR, lastused.LOG)
+        with open(log, "rb") as inp:
+            assert inp.read() == b"100 team/foo\n300 team/foo\n200 bar\n"
+        assert lastused.compact(base) == {
+            "team/foo": [300, 2], "bar": [200, 1]}
+        assert not os.path.exists(log)
+        lastused.record_use([base], foo, now=250)
+        assert lastused.compact(base)["team/foo"] == [300, 3]
+        assert lastused.last_used([base])[foo] == [300, 3]
+
+
+def test_record_after_log_renamed():
+    with TempDir() as temp:
+        base = temp.path.decode("utf-8")
+        store = os.path.join(base, STORE_DIR)
+        log = os.path.join(store, lastused.LOG)
+        folding = os.path.join(store, lastused._FOLDING)
+        foo = os.path.join(base, "foo")
+        lastused.record_use([base], foo, now=100)
+        real_lock = lastused._lock
+
+        def rename_first(fd, shared=False):
+            # As if compact renamed the log just after this run opened
+            # it, and then read it.
+            if shared and not os.path.exists(folding):
+                os.rename(log, folding)
+            real_lock(fd, shared)
+
+        with patch("vex.lastused._lock", side_effect=rename_first):
+            lastused.record_use([base], foo, now=200)
+        with open(folding, "rb") as inp:
+            assert inp.read() == b"100 foo\n"
+        with open(log, "rb") as inp:
+            assert inp.read() == b"200 foo\n"
+        assert lastused.compact(base) == {"foo": [100, 1]}
+        assert lastused.compact(base) == {"foo": [200, 2]}
+
+
+def test_index_is_shared():
+    with TempDir() as temp:
+        base = temp.path.decode("utf-8")
+        lastused.record_use([base], os.path.join(base, "foo"), now=100)
+        umask = os.umask(0o022)
+        try:
+            lastused.compact(base)
+        finally:
+            os.umask(umask)
+        index = os.path.join(base, STORE_DIR, lastused.INDEX)
+        assert os.stat(index).st_mode & 0o777 == 0o644
+
+
+def test_fold_skips_broken_lines():
+    index = {"a": [5, 1]}
+    lastused.fold([b"7 a\n", b"garbage\n", b"8 b c\n", b"9"], index)
+    assert index == {"a": [7, 2], "b c": [8, 1]}
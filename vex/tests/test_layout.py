@@ -0,0 +1,27 @@
+import os
+from vex import layout
+from . tempdir import TempDir
+
+
+def test_get_site_packages():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        site = os.path.join(top, "lib", "python3.11", "site-packages")
+        os.makedirs(site)
+        os.symlink("lib", os.path.join(top, "lib64"))
+        assert layout.get_site_packages(top) == [site]
+
+
+def test_get_site_packages_none():
+    with TempDir() as temp:
+        assert layout.get_site_packages(temp.path.decode("utf-8")) == []
+
+
+def test_read_pyvenv_cfg():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        assert layout.read_pyvenv_cfg(top) is None
+        with open(os.path.join(top, "pyvenv.cfg"), "wb") as out:
+            out.write(b"home = /usr/bin\nVersion = 3.11.7\njunk\n")
+        assert layout.read_pyvenv_cfg(top) == {
+            "home": "/usr/bin", "version": "3.11.7"}
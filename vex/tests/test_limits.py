@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+from pytest import raises, mark
+from vex import limits
+from vex import exceptions
+from vex.config import Vexrc
+from vex.run import run
+from . fakes import Object
+
+
+def make_options(**kwargs):
+    names = ("memory", "cpu", "files", "nice", "cpus", "timeout",
+             "kill_after")
+    values = dict(("limit_" + name, None) for name in names)
+    values.update(kwargs)
+    return Object(**values)
+
+
+class TestParseCpus(object):
+    def test_list(self):
+        assert limits.parse_cpus("0-2,5") == set([0, 1, 2, 5])
+
+    def test_bad(self):
+        assert limits.parse_cpus("3-1") is None
+        assert limits.parse_cpus("a") is None
+        assert limits.parse_cpus("") is None
+
+
+class TestGetLimits(object):
+    def test_nothing(self):
+        assert limits.get_limits(make_options(), Vexrc()) is None
+
+    def test_options_over_vexrc(self):
+        vexrc = Vexrc()
+        vexrc.headings["limits"] = {"memory": "1G", "files": "100"}
+        options = make_options(limit_files="50", limit_timeout="2m")
+        result = limits.get_limits(options, vexrc)
+        assert result.memory == 1 << 30
+        assert result.files == 50
+        assert result.timeout == 120
+        assert result.kill_after == limits.DEFAULT_KILL_AFTER
+
+    def test_invalid(self):
+        with raises(exceptions.BadConfig):
+            limits.get_limits(make_options(limit_memory="lots"), Vexrc())
+
+    def test_cpu_rounds_up(self):
+        result = limits.get_limits(make_options(limit_cpu="0.5"), Vexrc())
+        assert result.cpu == 1
+        result = limits.get_limits(make_options(limit_cpu="1.5m"), Vexrc())
+        assert result.cpu == 90
+        with raises(exceptions.BadConfig):
+            limits.get_limits(make_options(limit_cpu="0"), Vexrc())
+
+
+@mark.skipif(limits.resource is None, reason="needs resource module")
+def test_applied_in_child():
+    code = (
+        "import resource, sys; "
+        "sys.exit(resource.getrlimit(resource.RLIMIT_NOFILE)[0])"
+    )
+    returncode = run(
+        [sys.executable, "-c", code], env=os.environ.copy(), cwd=None,
+        limits=limits.Limits(files=42))
+    assert returncode == 42
+
+
+@mark.skipif(os.name == "nt", reason="needs POSIX signals")
+def test_timeout(capsys):
+    code = "import time; time.sleep(30)"
+    started = time.time()
+    returncode = run(
+        [sys.executable, "-c", code], env=os.environ.copy(), cwd=None,
+        limits=limits.Limits(timeout=0.2, kill_after=1))
+    assert returncode < 0
+    assert time.time() - started < 10
+    assert "timed out after 0.2s" in capsys.readouterr()[1]
+
+
+@mark.skipif(not hasattr(os, "sched_setaffinity"), reason="needs affinity")
+def test_failure_in_child():
+    with raises(exceptions.BadConfig) as info:
+        run([sys.executable, "-c", ""], env=os.environ.copy(), cwd=None,
+            limits=limits.Limits(cpus=set([100000])))
+    assert "none of CPUs 100000 are available" in info.value.message
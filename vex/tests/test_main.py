@@ -6,7 +6,8 @@ from mock import patch
 from vex import main
 from vex.config import Vexrc
 from vex import exceptions
-from . fakes import Object, make_fake_exists
+from . fakes import Object
+from . tempdir import TempDir
 
 
 class TestGetVexrc(object):
@@ -32,6 +33,49 @@ class TestGetVexrc(object):
             assert vexrc
 
 
+    def test_get_vexrc_layers_project_config(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            user = os.path.join(top, "user_vexrc")
+            with open(user, "wb") as out:
+                out.write("shell=bash\npython=python3\ntrust={0}\n".format(
+                    top).encode("utf-8"))
+            with open(os.path.join(top, ".vexrc"), "wb") as out:
+                out.write(b"shell=zsh\n")
+            options = main.get_options(["--config", user, "--cwd", top])
+            vexrc = main.get_vexrc(options, {})
+            root = vexrc[vexrc.default_heading]
+            assert root["shell"] == "zsh"
+            assert root["python"] == "python3"
+            assert vexrc.sources[0] == user
+
+            options = main.get_options(
+                ["--config", user, "--cwd", top, "--no-project-config"])
+            vexrc = main.get_vexrc(options, {})
+            assert vexrc[vexrc.default_heading]["shell"] == "bash"
+
+    def test_get_vexrc_untrusted_project_config(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            project = os.path.join(top, "clone")
+            os.makedirs(project)
+            with open(os.path.join(project, ".vexrc"), "wb") as out:
+                out.write(b"shell=evil\nenv:\n    LD_PRELOAD=/tmp/x.so\n")
+            user = os.path.join(top, "user_vexrc")
+            with open(user, "wb") as out:
+                out.write(b"shell=bash\n")
+            options = main.get_options(["--config", user, "--cwd", project])
+            vexrc = main.get_vexrc(options, {})
+            assert vexrc[vexrc.default_heading]["shell"] == "bash"
+            assert "LD_PRELOAD" not in vexrc.get_env("foo")
+            # Trusting somewhere else doesn't trust this one either.
+            with open(user, "ab") as out:
+                out.write("trust={0}\n".format(
+                    os.path.join(top, "mine")).encode("utf-8"))
+            vexrc = main.get_vexrc(options, {})
+            assert vexrc.sources == [user]
+
+
 class TestGetCwd(object):
 
     def test_get_cwd_no_option(self):
@@ -53,40 +97,6 @@ class TestGetCwd(object):
         assert cwd == "foo"
 
 
-class TestGetVirtualenvPath(object):
-
-    def test_no_ve_base(self):
-        with raises(exceptions.NoVirtualenvsDirectory):
-            main.get_virtualenv_path("", "anything")
-
-    def test_nonexistent_ve_base(self):
-        with raises(exceptions.NoVirtualenvsDirectory):
-            main.get_virtualenv_path("/unlikely_to_exist1", "anything")
-
-    def test_no_ve_name(self):
-        fake_path = os.path.abspath(os.path.join("pretends_to_exist"))
-        fake_exists = make_fake_exists([fake_path])
-        with patch("os.path.exists", wraps=fake_exists), \
-          raises(exceptions.InvalidVirtualenv):
-            main.get_virtualenv_path(fake_path, "")
-
-    def test_nonexistent_ve_path(self):
-        fake_path = os.path.abspath(os.path.join("pretends_to_exist"))
-        fake_exists = make_fake_exists([fake_path])
-        with patch("os.path.exists", wraps=fake_exists), \
-          raises(exceptions.InvalidVirtualenv):
-            main.get_virtualenv_path(fake_path, "/unlikely_to_exist2")
-
-    def test_happy(self):
-        fake_base = os.path.abspath(os.path.join("pretends_to_exist"))
-        fake_name = "also_pretend"
-        fake_path = os.path.join(fake_base, fake_name)
-        fake_exists = make_fake_exists([fake_base, fake_path])
-        with patch("os.path.exists", wraps=fake_exists):
-            path = main.get_virtualenv_path(fake_base, fake_name)
-            assert path == fake_path
-
-
 class TestGetCommand(object):
 
     def test_shell_options(self):
@@ -122,3 +132,14 @@ class TestGetCommand(object):
         environ = {}
         with raises(exceptions.InvalidCommand):
             main.get_command(options, vexrc, environ)
+
+
+class TestMain(object):
+
+    def test_share_packages_needs_wheelhouse(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            environ = {"HOME": top, "WORKON_HOME": top}
+            with raises(exceptions.InvalidArgument):
+                main._main(environ, ["--make", "--share-packages", "foo"])
+            assert not os.path.exists(os.path.join(top, "foo"))
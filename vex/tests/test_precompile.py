@@ -0,0 +1,28 @@
+from pytest import raises
+from vex import precompile
+from vex import exceptions
+
+
+class TestParseLevels(object):
+    def test_levels(self):
+        assert precompile.parse_levels("0, 2,2") == [0, 2]
+
+    def test_bad(self):
+        with raises(exceptions.InvalidArgument):
+            precompile.parse_levels("3")
+
+
+class TestCompileCommand(object):
+    def test_defaults(self):
+        command = precompile.compile_command("py", ["/sp"])
+        assert command == ["py", "-m", "compileall", "-q", "-j", "0", "/sp"]
+
+    def test_everything(self):
+        command = precompile.compile_command(
+            "py", ["/a", "/b"], jobs=4, levels=[0, 1], checked_hash=True)
+        assert command == [
+            "py", "-m", "compileall", "-q", "-j", "4",
+            "-o", "0", "-o", "1",
+            "--invalidation-mode", "checked-hash",
+            "/a", "/b",
+        ]
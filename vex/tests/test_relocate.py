@@ -0,0 +1,86 @@
+import os
+from vex import relocate
+from vex.cache import JSONCache
+from vex.store import PackageStore, read_packages_record
+from vex.store import write_packages_record
+from vex.usage import measure
+from . files import make_ve, read, write
+from . tempdir import TempDir
+
+
+def _make_ve(top, name="old"):
+    ve = make_ve(top, name)
+    site = os.path.join(ve, "lib", "python3.11", "site-packages")
+    os.makedirs(site)
+    write(os.path.join(ve, "bin", "activate"),
+          "VIRTUAL_ENV='{0}'\nOTHER='{0}-2'\n".format(ve).encode("utf-8"))
+    write(os.path.join(ve, "bin", "plain"), b"#!/bin/sh\ntrue\n")
+    write(os.path.join(ve, "bin", "binary"),
+          ve.encode("utf-8") + b"\0\1\2")
+    write(os.path.join(site, "mod.py"), ve.encode("utf-8"))
+    os.symlink(os.path.join(ve, "bin", "tool"),
+               os.path.join(ve, "bin", "abs-link"))
+    os.symlink("tool", os.path.join(ve, "bin", "rel-link"))
+    return ve
+
+
+def test_prefix_pattern():
+    pattern = relocate.prefix_pattern("/ves/foo")
+    assert pattern.sub(b"X", b"/ves/foo/bin /ves/foo-2 '/ves/foo'") == \
+        b"X/bin /ves/foo-2 'X'"
+
+
+def test_clone():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        old = _make_ve(top)
+        new = os.path.join(top, "new")
+        plain_before = os.stat(os.path.join(old, "bin", "plain"))
+        relocate.handle_clone(old, new)
+        assert read(os.path.join(new, "bin", "tool")) == \
+            "#!{0}/bin/python\n".format(new)
+        assert read(os.path.join(new, "bin", "activate")) == \
+            "VIRTUAL_ENV='{0}'\nOTHER='{1}-2'\n".format(new, old)
+        # The original is untouched.
+        assert read(os.path.join(old, "bin", "tool")) == \
+            "#!{0}/bin/python\n".format(old)
+        # Binary files and files outside bin are left alone.
+        assert old in read(os.path.join(new, "bin", "binary"))
+        site = os.path.join("lib", "python3.11", "site-packages", "mod.py")
+        assert read(os.path.join(new, site)) == old
+        # Files without the old path aren't rewritten.
+        plain_after = os.stat(os.path.join(new, "bin", "plain"))
+        assert plain_after.st_mtime == plain_before.st_mtime
+        assert os.readlink(os.path.join(new, "bin", "abs-link")) == \
+            os.path.join(new, "bin", "tool")
+        assert os.readlink(os.path.join(new, "bin", "rel-link")) == "tool"
+
+
+def test_clone_forgets_usage():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        old = _make_ve(top)
+        new = os.path.join(top, "new")
+        cache = JSONCache(None)
+        measure([old], cache)
+        relocate.handle_clone(old, new, usage_cache=cache)
+        total = measure([old, new], cache)[1]
+        assert total.actual == measure([old, new], JSONCache(None))[1].actual
+
+
+def test_rename_moves_package_refs():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        old = _make_ve(top)
+        new = os.path.join(top, "group", "new")
+        store = PackageStore(os.path.join(top, "store"))
+        store.add_ref("pkg", old)
+        write_packages_record(old, store, ["pkg"])
+        relocate.handle_rename(old, new)
+        assert not os.path.exists(old)
+        assert read(os.path.join(new, "bin", "tool")) == \
+            "#!{0}/bin/python\n".format(new)
+        refs = os.listdir(os.path.join(top, "store", "refs", "pkg"))
+        assert len(refs) == 1
+        assert read_packages_record(new)[1] == ["pkg"]
+        assert store.drop_ref("pkg", new)
@@ -0,0 +1,26 @@
+import os
+from vex.remove import obviously_not_a_virtualenv
+from . tempdir import TempDir
+
+
+def _touch(path):
+    with open(path, "w"):
+        pass
+
+
+def test_pyvenv_cfg_with_empty_include():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        os.makedirs(os.path.join(top, "include"))
+        os.makedirs(os.path.join(top, "bin"))
+        # Without pyvenv.cfg, an empty include means it isn't one.
+        assert obviously_not_a_virtualenv(top)
+        _touch(os.path.join(top, "pyvenv.cfg"))
+        assert not obviously_not_a_virtualenv(top)
+
+
+def test_pyvenv_cfg_alone_is_not_enough():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        _touch(os.path.join(top, "pyvenv.cfg"))
+        assert obviously_not_a_virtualenv(top)
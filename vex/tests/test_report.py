@@ -0,0 +1,53 @@
+import os
+import json
+from vex import report
+from . fakes import Object
+from . tempdir import TempDir
+
+
+FAKE_RUSAGE = Object(
+    ru_maxrss=2048, ru_utime=0.5, ru_stime=0.25,
+    ru_nvcsw=3, ru_nivcsw=4,
+)
+
+
+def test_make_record():
+    record = report.make_record(
+        ["python", "-V"], "/ve", 0, 1000.0, 1.5, FAKE_RUSAGE)
+    assert record["command"] == ["python", "-V"]
+    assert record["virtualenv"] == "/ve"
+    assert record["wall"] == 1.5
+    assert record["user"] == 0.5
+    assert record["system"] == 0.25
+    assert record["voluntary_switches"] == 3
+    assert record["involuntary_switches"] == 4
+
+
+def test_format_record():
+    record = report.make_record(["x"], "/ve", 2, 0.0, 1.0, FAKE_RUSAGE)
+    text = report.format_record(record)
+    assert "1.000s wall" in text
+    assert "exit status 2" in text
+
+
+def test_write_record_appends_json_lines():
+    record = report.make_record(["x"], "/ve", 0, 0.0, 1.0, FAKE_RUSAGE)
+    with TempDir() as temp:
+        path = os.path.join(temp.path.decode("utf-8"), "report.jsonl")
+        report.write_record(record, path)
+        report.write_record(record, path)
+        with open(path) as inp:
+            lines = inp.read().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0]) == record
+
+
+def test_get_report_destination():
+    from vex.config import Vexrc
+    vexrc = Vexrc()
+    options = Object(report=False, report_file=None)
+    assert report.get_report_destination(options, vexrc) is None
+    vexrc[vexrc.default_heading]["report"] = "~/runs.jsonl"
+    assert report.get_report_destination(options, vexrc) == "~/runs.jsonl"
+    options = Object(report=True, report_file=None)
+    assert report.get_report_destination(options, vexrc) == "stderr"
@@ -4,7 +4,7 @@ import os.path
 import subprocess
 import platform
 from mock import patch
-from pytest import raises
+from pytest import raises, mark
 from vex import run
 from vex import exceptions
 from . fakes import FakeEnviron, PatchedModule, FakePopen
@@ -43,14 +43,16 @@ def test_get_environ():
 def test_run():
     # mock subprocess.Popen because we are cowards
     with PatchedModule(os.path, exists=lambda path: True), \
+       PatchedModule(run, find_executable=lambda name, path: "/bin/foo"), \
        PatchedModule(subprocess, Popen=FakePopen(returncode=888)) as mod:
         assert not mod.Popen.waited
-        command = "foo"
+        command = ["foo"]
         env = {"this": "irrelevant"}
         cwd = "also_irrelevant"
-        returncode = run.run(command, env=env, cwd=cwd)
+        returncode = run.run(command, env=env, cwd=cwd, supervise=False)
         assert mod.Popen.waited
         assert mod.Popen.command == command
+        assert mod.Popen.executable == "/bin/foo"
         assert mod.Popen.env == env
         assert mod.Popen.cwd == cwd
         assert returncode == 888
@@ -62,6 +64,71 @@ def test_run_bad_command():
     assert returncode is None
 
 
+def test_run_missing_command_not_spawned():
+    popen = FakePopen()
+    with PatchedModule(subprocess, Popen=popen):
+        returncode = run.run(
+            ["blah_unlikely"], env={"PATH": os.defpath}, cwd=None)
+    assert returncode is None
+    assert popen.command is None
+
+
+def test_run_report():
+    import sys
+    reports = []
+
+    def report(*args):
+        reports.append(args)
+
+    env = os.environ.copy()
+    returncode = run.run(
+        [sys.executable, "-c", "import sys; sys.exit(3)"],
+        env=env, cwd=None, report=report)
+    assert returncode == 3
+    if hasattr(os, "wait4"):
+        (reported, started, elapsed, rusage), = reports
+        assert reported == 3
+        assert elapsed > 0
+        assert rusage.ru_utime >= 0
+
+
+@mark.skipif(not hasattr(os, "killpg"), reason="needs process groups")
+def test_wants_own_group():
+    # No controlling terminal: nothing to stay in the foreground of.
+    with patch("vex.run.os.open", side_effect=OSError):
+        assert run.wants_own_group()
+    # With one, stdin being a pipe doesn't matter; the command could
+    # still read /dev/tty.
+    fd = os.open(os.devnull, os.O_RDONLY)
+    with patch("vex.run.os.open", return_value=fd) as fake_open, \
+            patch("vex.run.os.isatty", return_value=False):
+        assert not run.wants_own_group()
+    assert fake_open.call_args[0][0] == "/dev/tty"
+
+
+@mark.skipif(not hasattr(os, "killpg"), reason="needs process groups")
+def test_run_forwards_signals_to_group():
+    import sys
+    import signal
+    # The child signals vex, which should pass SIGTERM on to the child's
+    # whole process group; the grandchild's exit status shows it got it.
+    code = (
+        "import os, signal, subprocess, sys, time; "
+        "child = subprocess.Popen([sys.executable, '-c', "
+        "'import time; time.sleep(30)']); "
+        "signal.signal(signal.SIGTERM, signal.SIG_IGN); "
+        "time.sleep(0.2); "
+        "os.kill(os.getppid(), signal.SIGTERM); "
+        "sys.exit(-child.wait())"
+    )
+    with patch("vex.run.wants_own_group", return_value=True):
+        returncode = run.run(
+            [sys.executable, "-c", code], env=os.environ.copy(), cwd=None)
+    assert returncode == signal.SIGTERM
+    # vex's own handler is back in place.
+    assert signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+
+
 class TestGetEnviron(object):
     def test_ve_path_None(self):
         with raises(exceptions.BadConfig):
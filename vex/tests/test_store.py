@@ -0,0 +1,52 @@
+import os
+from vex import store
+from . tempdir import TempDir
+
+
+def _add_entry(package_store, key):
+    temp = package_store.temp_dir(key)
+    with open(os.path.join(temp, "file"), "wb") as out:
+        out.write(b"data")
+    package_store.write_manifest(temp, {"files": [], "compiled": []})
+    package_store.add(key, temp)
+
+
+def test_refs_and_removal():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        package_store = store.PackageStore(os.path.join(top, "store"))
+        package_store.add_ref("pkg", "/ves/a")
+        package_store.add_ref("pkg", "/ves/b")
+        _add_entry(package_store, "pkg")
+        assert package_store.has("pkg")
+        assert not package_store.drop_ref("pkg", "/ves/a")
+        assert package_store.has("pkg")
+        assert package_store.drop_ref("pkg", "/ves/b")
+        assert not os.path.exists(package_store.path("pkg"))
+        assert os.listdir(os.path.join(top, "store", "packages")) == []
+
+
+def test_add_keeps_existing_entry():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        package_store = store.PackageStore(top)
+        _add_entry(package_store, "pkg")
+        _add_entry(package_store, "pkg")
+        assert os.listdir(os.path.join(top, "packages")) == ["pkg"]
+
+
+def test_packages_record():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        ve = os.path.join(top, "ve")
+        os.makedirs(ve)
+        assert store.read_packages_record(ve) is None
+        package_store = store.PackageStore(os.path.join(top, "store"))
+        package_store.add_ref("pkg", ve)
+        _add_entry(package_store, "pkg")
+        store.write_packages_record(ve, package_store, ["pkg"])
+        record = store.read_packages_record(ve)
+        assert record[0].root == package_store.root
+        assert record[1] == ["pkg"]
+        assert store.release_packages(record, ve) == 1
+        assert store.release_packages(None, ve) == 0
@@ -0,0 +1,77 @@
+import os
+from mock import patch
+from vex import sync
+from vex.store import PACKAGES_RECORD
+from . files import make_ve, read, write
+from . tempdir import TempDir
+
+
+def _make_ve(root, name):
+    ve = make_ve(root, name)
+    write(os.path.join(ve, PACKAGES_RECORD), b"{}")
+    return ve
+
+
+def _sync(source, destination, name, dry_run=False):
+    return sync.sync_virtualenv(
+        name, os.path.join(source, name), os.path.join(destination, name),
+        source, destination, dry_run=dry_run)[0]
+
+
+def test_new_and_unchanged():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        source = os.path.join(top, "golden")
+        destination = os.path.join(top, "node")
+        _make_ve(source, "foo")
+        assert _sync(source, destination, "foo", dry_run=True).copies
+        assert not os.path.exists(os.path.join(destination, "foo"))
+        plan = _sync(source, destination, "foo")
+        assert sorted(plan.copies) == [
+            os.path.join("bin", "tool"), os.path.join("lib", "mod.py")]
+        ve = os.path.join(destination, "foo")
+        assert read(os.path.join(ve, "bin", "tool")) == \
+            "#!{0}/bin/python\n".format(ve)
+        assert os.readlink(os.path.join(ve, "bin", "python")) == \
+            "/usr/bin/python3"
+        assert not os.path.exists(os.path.join(ve, PACKAGES_RECORD))
+        # The rewritten script isn't copied again.
+        assert not any(_sync(source, destination, "foo"))
+
+
+def test_update():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        source = os.path.join(top, "golden")
+        destination = os.path.join(top, "node")
+        src_ve = _make_ve(source, "foo")
+        _sync(source, destination, "foo")
+        ve = os.path.join(destination, "foo")
+        write(os.path.join(src_ve, "lib", "mod.py"), b"changed = 1\n")
+        write(os.path.join(ve, "lib", "extra.py"), b"")
+        write(os.path.join(ve, "bin", "tool"), b"edited locally")
+        plan = _sync(source, destination, "foo")
+        assert sorted(plan.copies) == [
+            os.path.join("bin", "tool"), os.path.join("lib", "mod.py")]
+        assert plan.remove == [os.path.join("lib", "extra.py")]
+        assert read(os.path.join(ve, "lib", "mod.py")) == "changed = 1\n"
+        assert read(os.path.join(ve, "bin", "tool")) == \
+            "#!{0}/bin/python\n".format(ve)
+        assert sorted(os.listdir(os.path.join(ve, "lib"))) == ["mod.py"]
+
+
+def test_handle_sync_prunes():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        source = os.path.join(top, "golden")
+        destination = os.path.join(top, "node")
+        _make_ve(source, os.path.join("team", "foo"))
+        old = _make_ve(destination, "old")
+        with patch("vex.sync.handle_remove") as remove:
+            assert sync.handle_sync(source, destination) == 0
+            assert not remove.called
+            assert sync.handle_sync(source, destination, prune=True) == 0
+        remove.assert_called_once_with(old)
+        assert os.path.isdir(os.path.join(destination, "team", "foo"))
+        assert [name for name in os.listdir(
+            os.path.join(destination, "team"))] == ["foo"]
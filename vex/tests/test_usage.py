@@ -0,0 +1,116 @@
+import os
+import json
+from vex import usage
+from vex.cache import JSONCache
+from vex.index import VirtualenvIndex
+from . files import write
+from . tempdir import TempDir
+
+
+def _setup(top):
+    root = os.path.join(top, "ves")
+    for name in ("a", "b"):
+        os.makedirs(os.path.join(root, name, "bin"))
+    write(os.path.join(root, "a", "bin", "own"), b"x" * 1000)
+    write(os.path.join(root, "a", "bin", "shared"), b"x" * 5000)
+    os.link(os.path.join(root, "a", "bin", "shared"),
+            os.path.join(root, "a", "bin", "shared2"))
+    os.link(os.path.join(root, "a", "bin", "shared"),
+            os.path.join(root, "b", "bin", "shared"))
+    return root
+
+
+def test_format_size():
+    assert usage.format_size(0) == "0B"
+    assert usage.format_size(1023) == "1023B"
+    assert usage.format_size(1536) == "1.5K"
+    assert usage.format_size(3 * 1024 ** 3) == "3.0G"
+
+
+def test_measure_counts_hardlinks_once():
+    with TempDir() as temp:
+        root = _setup(temp.path.decode("utf-8"))
+        a = os.path.join(root, "a")
+        b = os.path.join(root, "b")
+        dir_size = os.lstat(os.path.join(a, "bin")).st_size
+        usages, total, visited = usage.measure([a, b], JSONCache(None))
+        ve_dir_sizes = os.stat(a).st_size + dir_size
+        assert usages[a].apparent == ve_dir_sizes + 6000
+        ve_dir_sizes = os.stat(b).st_size + dir_size
+        assert usages[b].apparent == ve_dir_sizes + 5000
+        assert total.apparent == (
+            usages[a].apparent + usages[b].apparent - 5000)
+        assert "du:" + os.path.join(a, "bin") in visited
+
+
+def test_measure_uses_cache_until_changed():
+    with TempDir() as temp:
+        root = _setup(temp.path.decode("utf-8"))
+        a = os.path.join(root, "a")
+        bin_path = os.path.join(a, "bin")
+        cache = JSONCache(None)
+        before = usage.measure([a], cache)[0][a].apparent
+        bin_size = os.lstat(bin_path).st_size
+        # A stale record is trusted while the directory is unchanged...
+        record = cache["du:" + bin_path]
+        record[1] += 7
+        assert usage.measure([a], cache)[0][a].apparent == before + 7
+        # ...but not once files have come or gone.
+        write(os.path.join(bin_path, "new"), b"x" * 10)
+        after = usage.measure([a], cache)[0][a].apparent
+        grown = os.lstat(bin_path).st_size - bin_size
+        assert after == before + 10 + grown
+
+
+def test_forget_usage_after_linking():
+    with TempDir() as temp:
+        root = _setup(temp.path.decode("utf-8"))
+        a = os.path.join(root, "a")
+        b = os.path.join(root, "b")
+        cache = JSONCache(None)
+        usage.measure([a, b], cache)
+        # A new link to a file that had none, like --clone makes,
+        # leaves every directory's mtime alone except the new one's.
+        os.link(os.path.join(a, "bin", "own"), os.path.join(b, "own"))
+        usage.forget_usage(cache, [a, b])
+        assert not [key for key in cache.load() if key.startswith("du:")]
+        total = usage.measure([a, b], cache)[1]
+        assert total.apparent == usage.measure([a, b], JSONCache(None))[1] \
+            .apparent
+
+
+def test_forget_usage_only_under_paths():
+    cache = JSONCache(None)
+    for key in ("du:/ves/a", "du:/ves/a/bin", "du:/ves/ab", "other"):
+        cache[key] = 1
+    usage.forget_usage(cache, ["/ves/a"])
+    assert sorted(cache.load()) == ["du:/ves/ab", "other"]
+
+
+def test_forget_unvisited():
+    cache = JSONCache(None)
+    cache["du:/gone"] = [0, 0, 0, [], []]
+    cache["du:/here"] = [0, 0, 0, [], []]
+    cache["other"] = 1
+    usage.forget_unvisited(cache, set(["du:/here"]))
+    assert "du:/gone" not in cache
+    assert "du:/here" in cache
+    assert "other" in cache
+
+
+def test_handle_usage(capsys):
+    with TempDir() as temp:
+        root = _setup(temp.path.decode("utf-8"))
+        index = VirtualenvIndex([root], JSONCache(None))
+        assert usage.handle_usage(
+            index, JSONCache(None), as_json=True) == 0
+        lines = [json.loads(line)
+                 for line in capsys.readouterr()[0].splitlines()]
+        assert [line.get("name") for line in lines] == ["a", "b", None]
+        assert lines[2]["total"] is True
+        assert lines[2]["apparent"] < lines[0]["apparent"] + \
+            lines[1]["apparent"]
+        assert usage.handle_usage(index, JSONCache(None), "b") == 0
+        out = capsys.readouterr()[0].splitlines()
+        assert out[0].endswith("\tb")
+        assert out[1].endswith("\ttotal")
@@ -0,0 +1,36 @@
+import os
+from vex.walk import walk, walk_files
+from . tempdir import TempDir
+
+
+def make_tree(top):
+    os.makedirs(os.path.join(top, "a", "b"))
+    os.makedirs(os.path.join(top, "skip"))
+    for name in ("x", os.path.join("a", "y"), os.path.join("a", "b", "z"),
+                 os.path.join("skip", "w")):
+        with open(os.path.join(top, name), "wb"):
+            pass
+    os.symlink("a", os.path.join(top, "link"))
+
+
+def test_walk_files():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        make_tree(top)
+        found = sorted(
+            os.path.relpath(entry.path, top) for entry in walk_files([top]))
+        assert found == sorted([
+            "link", "x", os.path.join("a", "y"),
+            os.path.join("a", "b", "z"), os.path.join("skip", "w"),
+        ])
+
+
+def test_walk_prune():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        make_tree(top)
+        directories = sorted(
+            os.path.relpath(directory, top) for directory, _, _ in
+            walk([top], jobs=2, prune=lambda entry: entry.name == "skip"))
+        assert directories == sorted(
+            [".", "a", os.path.join("a", "b")])
@@ -0,0 +1,83 @@
+import os
+import sys
+from pytest import raises
+from vex import exceptions
+from vex import warm
+from . tempdir import TempDir
+
+
+def test_parse_verbose_line():
+    assert warm.parse_verbose_line(
+        "# code object from '/x/__pycache__/y.cpython-311.pyc'"
+    ) == "/x/__pycache__/y.cpython-311.pyc"
+    assert warm.parse_verbose_line(
+        "# extension module 'z' loaded from '/x/z.so'") == "/x/z.so"
+    assert warm.parse_verbose_line(
+        "# /x/y.pyc matches /x/y.py") == "/x/y.pyc"
+    assert warm.parse_verbose_line("# cleanup[2] removing sys") == ""
+    assert warm.parse_verbose_line(
+        "import 'os' # <_frozen_importlib_external.SourceFileLoader>") == ""
+    # The command's own output is left alone.
+    assert warm.parse_verbose_line("import me") is None
+    assert warm.parse_verbose_line("# a comment") is None
+
+
+def test_warm_file():
+    with TempDir() as temp:
+        path = os.path.join(temp.path.decode("utf-8"), "data")
+        with open(path, "wb") as out:
+            out.write(b"x" * 1000)
+        assert warm.warm_file(path) == 1000
+        assert warm.warm_file(path + "-missing") == 0
+
+
+def test_handle_warm_unreadable_list():
+    with TempDir() as temp:
+        path = os.path.join(temp.path.decode("utf-8"), "missing")
+        with raises(exceptions.InvalidArgument) as excinfo:
+            warm.handle_warm(temp.path.decode("utf-8"), list_path=path)
+        assert repr(path) in str(excinfo.value)
+
+
+def test_find_files_to_warm():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        base = os.path.join(top, "base")
+        stdlib = os.path.join(base, "lib", "python3.11")
+        os.makedirs(os.path.join(stdlib, "test"))
+        os.makedirs(os.path.join(base, "bin"))
+        ve = os.path.join(top, "ve")
+        site = os.path.join(ve, "lib", "python3.11", "site-packages")
+        os.makedirs(site)
+        with open(os.path.join(ve, "pyvenv.cfg"), "wb") as out:
+            out.write("home = {0}\nversion = 3.11.7\n".format(
+                os.path.join(base, "bin")).encode("utf-8"))
+        for path in (os.path.join(stdlib, "os.py"),
+                     os.path.join(stdlib, "test", "test_os.py"),
+                     os.path.join(site, "mod.pyc"),
+                     os.path.join(site, "README.txt")):
+            with open(path, "wb"):
+                pass
+        files = sorted(warm.find_files_to_warm(ve))
+        assert files == sorted([
+            os.path.join(stdlib, "os.py"),
+            os.path.join(site, "mod.pyc"),
+        ])
+
+
+def test_record_imports(capsys):
+    with TempDir() as temp:
+        list_path = os.path.join(temp.path.decode("utf-8"), "imports")
+        code = ("import sys, json; "
+                "sys.stderr.write('import me\\n# mine\\n'); sys.exit(3)")
+        returncode = warm.record_imports(
+            [sys.executable, "-c", code], dict(os.environ), None, list_path)
+        assert returncode == 3
+        assert capsys.readouterr()[1] == "import me\n# mine\n"
+        with open(list_path) as inp:
+            files = inp.read().splitlines()
+        assert any("json" in path for path in files)
+        assert warm.record_imports(
+            ["no-such-command-here"], dict(os.environ), None,
+            list_path + "2") is None
+        assert not os.path.exists(list_path + "2")
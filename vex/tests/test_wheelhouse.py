@@ -0,0 +1,175 @@
+import os
+import zipfile
+from mock import patch
+from vex import wheelhouse
+from vex.store import PackageStore
+from . files import write
+from . tempdir import TempDir
+
+
+def _make_wheel(directory, name="demo", version="1.0", requires=()):
+    path = os.path.join(
+        directory, "{0}-{1}-py3-none-any.whl".format(name, version))
+    dist_info = "{0}-{1}.dist-info".format(name, version)
+    with zipfile.ZipFile(path, "w") as wheel:
+        wheel.writestr("demo/__init__.py", "def main():\n    return 0\n")
+        wheel.writestr(dist_info + "/METADATA", "Name: demo\n" + "".join(
+            "Requires-Dist: {0}\n".format(line) for line in requires))
+        wheel.writestr(dist_info + "/entry_points.txt",
+                       "[console_scripts]\ndemo = demo:main\n")
+        wheel.writestr(dist_info + "/RECORD", "")
+        wheel.writestr("{0}-{1}.data/scripts/tool".format(name, version),
+                       "#!python\nprint(1)\n")
+    return path
+
+
+def test_parse_requirements():
+    with TempDir() as temp:
+        path = os.path.join(temp.path.decode("utf-8"), "reqs.txt")
+        write(path, (
+            b"# pinned\n"
+            b"Six==1.16.0  # comment\n"
+            b"idna==3.4 \\\n"
+            b"    --hash=sha256:" + b"A" * 64 + b"\n"))
+        assert wheelhouse.parse_requirements(path) == [
+            wheelhouse.Requirement("Six", "1.16.0", []),
+            wheelhouse.Requirement("idna", "3.4", ["a" * 64]),
+        ]
+        for line in (b"six>=1.0\n", b"six[x]==1.0\n", b"-e .\n",
+                     b"six==1.0; python_version<'3'\n"):
+            write(path, line)
+            assert wheelhouse.parse_requirements(path) is None
+
+
+def test_is_compatible():
+    assert wheelhouse.is_compatible("py2.py3", "none", "any", (3, 11))
+    assert wheelhouse.is_compatible("py38", "none", "any", (3, 11))
+    assert not wheelhouse.is_compatible("py312", "none", "any", (3, 11))
+    assert not wheelhouse.is_compatible(
+        "cp311", "cp311", "manylinux_2_17_x86_64", (3, 11))
+
+
+def test_find_wheels():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        for filename in ("Foo_Bar-1.0-py3-none-any.whl",
+                         "baz-2.0-cp311-cp311-linux_x86_64.whl"):
+            write(os.path.join(top, filename), b"")
+        found = wheelhouse.find_wheels(
+            top, [wheelhouse.Requirement("foo.bar", "1.0", [])], (3, 11))
+        assert found == [os.path.join(top, "Foo_Bar-1.0-py3-none-any.whl")]
+        assert wheelhouse.find_wheels(
+            top, [wheelhouse.Requirement("baz", "2.0", [])], (3, 11)) is None
+
+
+def test_make_script():
+    script = wheelhouse.make_script("/ve/bin/python", "pkg.cli", "main.run")
+    assert script.startswith("#!/ve/bin/python\n")
+    assert "from pkg.cli import main\n" in script
+    assert "sys.exit(main.run())" in script
+
+
+def test_install_wheel():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        ve = os.path.join(top, "ve")
+        site = os.path.join(ve, "lib", "python3.11", "site-packages")
+        os.makedirs(site)
+        os.makedirs(os.path.join(ve, "bin"))
+        wheel = _make_wheel(top)
+        tops = wheelhouse.install_wheel(wheel, ve, site)
+        assert tops == [os.path.join(site, "demo")]
+        assert os.path.exists(os.path.join(site, "demo", "__init__.py"))
+        with open(os.path.join(ve, "bin", "tool"), "rb") as inp:
+            assert inp.read().startswith(
+                "#!{0}\n".format(os.path.join(ve, "bin", "python"))
+                .encode("utf-8"))
+        assert os.access(os.path.join(ve, "bin", "demo"), os.X_OK)
+        with open(os.path.join(site, "demo-1.0.dist-info", "RECORD")) as inp:
+            record = [line.split(",")[0] for line in inp.read().splitlines()]
+        assert "demo/__init__.py" in record
+        assert "../../../bin/demo" in record
+        assert "demo-1.0.dist-info/INSTALLER" in record
+        assert record[-1] == "demo-1.0.dist-info/RECORD"
+
+
+def test_plan_fast_install():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        ve = os.path.join(top, "ve")
+        site = os.path.join(ve, "lib", "python3.11", "site-packages")
+        os.makedirs(site)
+        write(os.path.join(ve, "pyvenv.cfg"), b"version = 3.11.7\n")
+        house = os.path.join(top, "house")
+        os.makedirs(house)
+        wheel = _make_wheel(house)
+        reqs = os.path.join(top, "reqs.txt")
+        write(reqs, b"demo==1.0\n")
+        assert wheelhouse.plan_fast_install(ve, house, reqs) == (
+            [wheel], site)
+        # Already installed: leave replacing it to pip.
+        os.makedirs(os.path.join(site, "demo-0.9.dist-info"))
+        assert wheelhouse.plan_fast_install(ve, house, reqs) is None
+
+
+def test_wheel_dependencies():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        wheel = _make_wheel(top, requires=[
+            "Six (>=1.0)", "attrs>=20; python_version < '4'",
+            "pytest; extra == 'test'", "zope.interface"])
+        assert wheelhouse.wheel_dependencies(wheel) == [
+            "six", "attrs", "zope-interface"]
+
+
+def test_plan_fast_install_unlisted_dependency():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        ve = os.path.join(top, "ve")
+        site = os.path.join(ve, "lib", "python3.11", "site-packages")
+        os.makedirs(site)
+        write(os.path.join(ve, "pyvenv.cfg"), b"version = 3.11.7\n")
+        house = os.path.join(top, "house")
+        os.makedirs(house)
+        wheel = _make_wheel(house, requires=["six"])
+        reqs = os.path.join(top, "reqs.txt")
+        write(reqs, b"demo==1.0\n")
+        # pip has to find six, or say it's missing.
+        assert wheelhouse.plan_fast_install(ve, house, reqs) is None
+        os.makedirs(os.path.join(site, "six-1.16.0.dist-info"))
+        assert wheelhouse.plan_fast_install(ve, house, reqs) == (
+            [wheel], site)
+
+
+def test_install_linked():
+    with TempDir() as temp:
+        top = temp.path.decode("utf-8")
+        wheel = _make_wheel(top)
+        package_store = PackageStore(os.path.join(top, "store"))
+        sites = []
+        for name in ("ve1", "ve2"):
+            ve = os.path.join(top, name)
+            site = os.path.join(ve, "lib", "python3.11", "site-packages")
+            os.makedirs(site)
+            os.makedirs(os.path.join(ve, "bin"))
+            with open(os.path.join(ve, "pyvenv.cfg"), "wb") as out:
+                out.write(b"version = 3.11.7\n")
+            with patch("vex.wheelhouse.handle_compile") as handle_compile:
+                paths = wheelhouse.install_linked(
+                    {}, ve, [wheel], site, package_store)
+            # Compiled once, in the store, for the first only.
+            assert handle_compile.called == (name == "ve1")
+            assert paths == []
+            sites.append(site)
+        first, second = [
+            os.path.join(site, "demo", "__init__.py") for site in sites]
+        assert os.path.samefile(first, second)
+        assert os.path.samefile(first, os.path.join(
+            package_store.path("demo-1.0-py3-none-any"),
+            "demo", "__init__.py"))
+        with open(os.path.join(sites[1], "demo-1.0.dist-info", "RECORD")) \
+                as inp:
+            assert "demo/__init__.py," in inp.read()
+        with open(os.path.join(top, "ve2", "bin", "tool"), "rb") as inp:
+            assert inp.read().startswith(b"#!" + os.path.join(
+                top, "ve2", "bin", "python").encode("utf-8"))
@@ -0,0 +1,139 @@
+import os
+from mock import patch
+from vex.cache import JSONCache
+from vex.which import find_executable, ExecutableCache
+from . tempdir import TempDir
+
+
+def make_executable(path):
+    with open(path, "wb") as out:
+        out.write(b"#!/bin/sh\n")
+    os.chmod(path, 0o755)
+
+
+def bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+
+class TestFindExecutable(object):
+
+    def test_found_in_order(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            first = os.path.join(top, "first")
+            second = os.path.join(top, "second")
+            os.mkdir(first)
+            os.mkdir(second)
+            make_executable(os.path.join(first, "tool"))
+            make_executable(os.path.join(second, "tool"))
+            path = os.pathsep.join([first, second])
+            assert find_executable("tool", path) == os.path.join(
+                first, "tool")
+
+    def test_not_executable(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            with open(os.path.join(top, "data"), "wb"):
+                pass
+            assert find_executable("data", top) is None
+
+    def test_missing(self):
+        assert find_executable("blah_unlikely", os.defpath) is None
+
+
+class TestExecutableCache(object):
+
+    def test_hit_and_invalidate(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            ve_bin = os.path.join(top, "ve_bin")
+            system = os.path.join(top, "system")
+            os.mkdir(ve_bin)
+            os.mkdir(system)
+            make_executable(os.path.join(system, "tool"))
+            path = os.pathsep.join([ve_bin, system])
+            executables = ExecutableCache(JSONCache(None))
+            found = executables.find("tool", path)
+            assert found == os.path.join(system, "tool")
+            assert executables.find("tool", path) == found
+
+            # Installing into the virtualenv shadows the system one.
+            make_executable(os.path.join(ve_bin, "tool"))
+            bump_mtime(ve_bin)
+            assert executables.find("tool", path) == os.path.join(
+                ve_bin, "tool")
+
+    def test_negative_entries(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            executables = ExecutableCache(JSONCache(None))
+            assert executables.find("tool", top) is None
+            make_executable(os.path.join(top, "tool"))
+            bump_mtime(top)
+            assert executables.find("tool", top) == os.path.join(top, "tool")
+
+    def test_misses_are_not_cached(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            cache = JSONCache(None)
+            executables = ExecutableCache(cache)
+            tool = os.path.join(top, "tool")
+            with open(tool, "wb") as out:
+                out.write(b"#!/bin/sh\n")
+            assert executables.find("tool", top) is None
+            assert top not in cache.load()
+            # chmod +x doesn't change the directory's mtime.
+            os.chmod(tool, 0o755)
+            assert executables.find("tool", top) == tool
+
+    def test_entries_are_per_directory(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            system = os.path.join(top, "system")
+            os.mkdir(system)
+            make_executable(os.path.join(system, "tool"))
+            cache = JSONCache(None)
+            executables = ExecutableCache(cache)
+            for name in ("a", "b", "c"):
+                ve_bin = os.path.join(top, name, "bin")
+                os.makedirs(ve_bin)
+                assert executables.find(
+                    "tool", os.pathsep.join([ve_bin, system])) == \
+                    os.path.join(system, "tool")
+            # One entry for each directory, not each PATH, and none
+            # for the virtualenvs' directories, which didn't have it.
+            assert sorted(cache.load()) == [system]
+            assert cache.load()[system][1] == {"tool": "tool"}
+
+    def test_save_forgets_missing_directories(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            gone = os.path.join(top, "gone")
+            os.mkdir(gone)
+            make_executable(os.path.join(gone, "tool"))
+            make_executable(os.path.join(top, "tool"))
+            cache = JSONCache(os.path.join(top, "executables.json"))
+            cache["old\0format"] = ["/x", []]
+            executables = ExecutableCache(cache)
+            assert executables.find("tool", gone)
+            os.remove(os.path.join(gone, "tool"))
+            os.rmdir(gone)
+            executables.find("tool", top)
+            executables.save()
+            assert list(JSONCache(cache.path).load()) == [top]
+
+    def test_save_caps_entries(self):
+        with TempDir() as temp:
+            top = temp.path.decode("utf-8")
+            cache = JSONCache(None)
+            cache[os.path.join(top)] = [0, {}]
+            here = os.path.join(top, "here")
+            os.mkdir(here)
+            make_executable(os.path.join(here, "tool"))
+            executables = ExecutableCache(cache)
+            executables.find("tool", here)
+            with patch("vex.which.MAX_DIRS", 1):
+                executables.save()
+            # Only what this run looked in is kept.
+            assert list(cache.load()) == [here]
@@ -0,0 +1,206 @@
+"""Measure how much disk virtualenvs use.
+
+Files hardlinked between virtualenvs, or within one, are counted once
+per device and inode, unlike adding up each virtualenv's du.
+"""
+import os
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from vex.walk import default_jobs
+
+# Bytes in a unit of st_blocks, whatever the filesystem's block size.
+_BLOCK_SIZE = 512
+
+
+class Usage(object):
+    """Apparent size (bytes in files) and actual size (bytes allocated).
+    """
+    def __init__(self, apparent=0, actual=0):
+        self.apparent = apparent
+        self.actual = actual
+
+    def add(self, apparent, actual):
+        self.apparent += apparent
+        self.actual += actual
+
+
+def _sizes(stat):
+    return stat.st_size, getattr(stat, "st_blocks", 0) * _BLOCK_SIZE
+
+
+def _scan(path, entry, follow=False):
+    """Stat path and, unless entry is a current record of it, list it.
+
+    A record is [mtime, apparent, actual, linked, subdirs]: the sizes of
+    the directory's files that have no other links, [dev, ino, apparent,
+    actual] for those which do, and the names of subdirectories.
+    The directory's mtime changes when entries are added, removed or
+    renamed, which is how files in a virtualenv get changed; but not
+    when its files gain links from elsewhere, so whatever makes those
+    links must call forget_usage.
+
+    :returns:
+        (path, stat, record, fresh), with stat None if path is gone.
+    """
+    try:
+        stat = os.stat(path) if follow else os.lstat(path)
+    except OSError:
+        return path, None, None, False
+    if entry and entry[0] == stat.st_mtime:
+        return path, stat, entry, False
+    apparent = actual = 0
+    linked = []
+    subdirs = []
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        entries = []
+    for item in entries:
+        try:
+            if item.is_dir(follow_symlinks=False):
+                subdirs.append(item.name)
+                continue
+            item_stat = item.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        item_apparent, item_actual = _sizes(item_stat)
+        if item_stat.st_nlink > 1:
+            linked.append([item_stat.st_dev, item_stat.st_ino,
+                           item_apparent, item_actual])
+        else:
+            apparent += item_apparent
+            actual += item_actual
+    record = [stat.st_mtime, apparent, actual, linked, subdirs]
+    return path, stat, record, True
+
+
+def measure(paths, cache, jobs=None):
+    """Measure disk use of the directory trees at paths, concurrently.
+
+    Directory listings are kept in cache, so directories that haven't
+    changed since the last time cost one stat.
+
+    :returns:
+        (usages, total, visited): a dict mapping each path to its Usage,
+        the Usage of all of them together, with every inode counted
+        once, and the set of cache keys of the directories measured.
+    """
+    usages = dict((path, Usage()) for path in paths)
+    total = Usage()
+    seen_total = set()
+    seen = dict((path, set()) for path in paths)
+    visited = set()
+    with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+        pending = {}
+        for path in paths:
+            future = executor.submit(
+                _scan, path, cache.get("du:" + path), True)
+            pending[future] = path
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                root = pending.pop(future)
+                directory, stat, record, fresh = future.result()
+                if stat is None:
+                    continue
+                key = "du:" + directory
+                visited.add(key)
+                if fresh:
+                    cache[key] = record
+                usage = usages[root]
+                own = _sizes(stat)
+                usage.add(*own)
+                total.add(*own)
+                _, apparent, actual, linked, subdirs = record
+                usage.add(apparent, actual)
+                total.add(apparent, actual)
+                for dev, ino, apparent, actual in linked:
+                    inode = (dev, ino)
+                    if inode not in seen[root]:
+                        seen[root].add(inode)
+                        usage.add(apparent, actual)
+                    if inode not in seen_total:
+                        seen_total.add(inode)
+                        total.add(apparent, actual)
+                for name in subdirs:
+                    subdir = os.path.join(directory, name)
+                    future = executor.submit(
+                        _scan, subdir, cache.get("du:" + subdir))
+                    pending[future] = root
+    return usages, total, visited
+
+
+def forget_usage(cache, paths):
+    """Drop the records of the directory trees at paths.
+
+    Linking to a file doesn't change any directory's mtime, so anything
+    that hardlinks files in virtualenvs (--dedupe, --clone) calls this
+    for the trees on both sides, then saves the cache. Otherwise files
+    counted as having no other links would be counted twice.
+    """
+    prefixes = ["du:" + os.path.abspath(path) for path in paths]
+    for key in list(cache.load()):
+        for prefix in prefixes:
+            if key == prefix or key.startswith(prefix + os.sep):
+                del cache[key]
+                break
+
+
+def forget_unvisited(cache, visited):
+    """Drop cached directories that were not seen by the last measure.
+    """
+    data = cache.load()
+    for key in [key for key in data if key.startswith("du:")]:
+        if key not in visited:
+            del cache[key]
+
+
+def format_size(size):
+    """Format a number of bytes for people, like du -h.
+    """
+    for unit in ("B", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            break
+        size /= 1024.0
+    if unit == "B":
+        return "{0}B".format(size)
+    return "{0:.1f}{1}".format(size, unit)
+
+
+def format_usage(name, usage, as_json=False):
+    """Format one line of output for a virtualenv or the total.
+    """
+    if as_json:
+        return json.dumps({
+            "name": name, "apparent": usage.apparent, "actual": usage.actual,
+        }, sort_keys=True)
+    return "{0:>8}\t{1:>8}\t{2}".format(
+        format_size(usage.actual), format_size(usage.apparent), name)
+
+
+def handle_usage(index, cache, prefix="", jobs=None, as_json=False):
+    """Print disk use of virtualenvs in index whose names begin with prefix.
+
+    One line per virtualenv, in name order, with the actual size then
+    the apparent size, and finally a total, in which files hardlinked
+    between virtualenvs are only counted once.
+    """
+    names = index.names(prefix)
+    paths = [os.path.abspath(index.lookup(name)) for name in names]
+    usages, total, visited = measure(paths, cache, jobs)
+    if not prefix:
+        # Everything was walked, so anything else cached is gone.
+        forget_unvisited(cache, visited)
+    cache.save()
+    for name, path in zip(names, paths):
+        sys.stdout.write(format_usage(name, usages[path], as_json) + "\n")
+    if as_json:
+        line = json.dumps({
+            "total": True, "apparent": total.apparent,
+            "actual": total.actual,
+        }, sort_keys=True)
+    else:
+        line = format_usage("total", total)
+    sys.stdout.write(line + "\n")
+    return 0
@@ -0,0 +1,59 @@
+"""Walk directory trees with several directories being listed at once.
+
+Listing directories is mostly waiting on the filesystem, which threads
+can overlap, especially on network filesystems and cold caches.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+def default_jobs(jobs=None):
+    """Return jobs, or a default number of I/O workers if it's unset.
+    """
+    if jobs:
+        return jobs
+    return min(32, (os.cpu_count() or 1) * 4)
+
+
+def _scan(directory):
+    dirs = []
+    nondirs = []
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return directory, dirs, nondirs
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            is_dir = False
+        (dirs if is_dir else nondirs).append(entry)
+    return directory, dirs, nondirs
+
+
+def walk(roots, jobs=None, prune=None):
+    """Walk the trees under roots, like os.walk but in parallel.
+
+    Yields (directory, dirs, nondirs) for each directory, where dirs and
+    nondirs are lists of os.DirEntry; symlinks are never followed and
+    count as nondirs. Directories come in no particular order.
+    If prune(entry) returns true for a directory entry, it isn't entered.
+    """
+    with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+        pending = set(executor.submit(_scan, root) for root in roots)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory, dirs, nondirs = future.result()
+                for entry in dirs:
+                    if prune is None or not prune(entry):
+                        pending.add(executor.submit(_scan, entry.path))
+                yield directory, dirs, nondirs
+
+
+def walk_files(roots, jobs=None, prune=None):
+    """Yield os.DirEntry for every non-directory under roots.
+    """
+    for _, _, nondirs in walk(roots, jobs, prune):
+        for entry in nondirs:
+            yield entry
@@ -0,0 +1,229 @@
+"""Pull a virtualenv's files into the page cache before they're needed.
+
+After a reboot or deploy, the first command in a virtualenv spends
+most of its time waiting for the disk to read the interpreter, the
+standard library and site-packages. Warming reads those in parallel,
+ahead of time.
+"""
+import os
+import re
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from vex import exceptions
+from vex.layout import get_ve_python, read_pyvenv_cfg
+from vex.run import run
+from vex.walk import default_jobs, walk_files
+
+# Kinds of files that importing modules reads.
+WARM_SUFFIXES = (".py", ".pyc", ".so", ".pyd", ".dll", ".pth", ".zip")
+
+# Parts of the standard library that a typical program doesn't import.
+STDLIB_SKIP = frozenset([
+    "test", "tests", "idlelib", "tkinter", "turtledemo", "ensurepip",
+    "lib2to3", "site-packages", "dist-packages",
+])
+
+_CHUNK_SIZE = 1 << 20
+
+
+def get_stdlib_dirs(ve_path):
+    """Guess where the virtualenv's interpreter keeps its stdlib.
+
+    Uses pyvenv.cfg rather than asking the interpreter, since starting
+    it is exactly the cold-cache cost we are trying to avoid.
+    """
+    settings = read_pyvenv_cfg(ve_path)
+    if not settings or not settings.get("home"):
+        return []
+    base = os.path.dirname(settings["home"].rstrip(os.sep))
+    version = settings.get("version") or settings.get("version_info") or ""
+    match = re.match(r"(\d+)\.(\d+)", version)
+    candidates = []
+    if match:
+        candidates.append(os.path.join(
+            base, "lib", "python{0}.{1}".format(*match.groups())))
+    candidates.append(os.path.join(base, "Lib"))
+    return [path for path in candidates if os.path.isdir(path)]
+
+
+def get_interpreter_files(ve_path):
+    """Return the interpreter binary and shared libpython, if found.
+    """
+    files = []
+    python = os.path.realpath(get_ve_python(ve_path))
+    if os.path.isfile(python):
+        files.append(python)
+        lib = os.path.join(os.path.dirname(os.path.dirname(python)), "lib")
+        try:
+            names = os.listdir(lib)
+        except OSError:
+            names = []
+        files.extend(
+            os.path.join(lib, name) for name in names
+            if name.startswith("libpython") and ".so" in name)
+    return files
+
+
+def find_files_to_warm(ve_path, jobs=None):
+    """List files in the virtualenv and its stdlib that imports read.
+    """
+    roots = [ve_path] + get_stdlib_dirs(ve_path)
+    stdlib_roots = set(roots[1:])
+
+    def prune(entry):
+        if entry.name in STDLIB_SKIP:
+            parent = os.path.dirname(entry.path)
+            return parent in stdlib_roots
+        return False
+
+    files = get_interpreter_files(ve_path)
+    for entry in walk_files(roots, jobs, prune):
+        if entry.name.endswith(WARM_SUFFIXES) and entry.is_file():
+            files.append(entry.path)
+    return files
+
+
+def warm_file(path):
+    """Get path's contents into the page cache. Returns its size.
+
+    Where possible this just asks the kernel to read ahead, which
+    returns quickly; otherwise the file is read and discarded.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return 0
+    try:
+        size = os.fstat(fd).st_size
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        else:
+            while os.read(fd, _CHUNK_SIZE):
+                pass
+        return size
+    except OSError:
+        return 0
+    finally:
+        os.close(fd)
+
+
+def read_file_list(path):
+    """Read a file list, one path per line, as written by record_imports.
+    """
+    try:
+        with open(path, "r") as inp:
+            return [line.rstrip("\n") for line in inp if line.strip()]
+    except (IOError, OSError) as error:
+        raise exceptions.InvalidArgument(
+            "can't read --warm-list file {0!r}: {1}".format(
+                path, error.strerror))
+
+
+def handle_warm(ve_path, jobs=None, list_path=None):
+    """Warm the virtualenv's files, reporting what was done on stderr.
+    """
+    started = time.time()
+    if list_path:
+        files = read_file_list(list_path)
+    else:
+        files = find_files_to_warm(ve_path, jobs)
+    with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+        total = sum(executor.map(warm_file, files))
+    sys.stderr.write("warmed {0} files, {1:.1f} MB in {2:.2f}s\n".format(
+        len(files), total / 1048576.0, time.time() - started))
+    return 0
+
+
+# Lines from python -v naming files that an import read.
+_VERBOSE_PATTERNS = [
+    re.compile(r"^# code object from '?(.+?)'?$"),
+    re.compile(r"^# extension module '[^']*' (?:loaded|executed) from "
+               r"'(.+)'$"),
+    re.compile(r"^# (\S+) matches \S+$"),
+]
+
+# Other lines python -v writes, exactly as it writes them, so that the
+# command's own output is never mistaken for them.
+_VERBOSE_OTHER = re.compile(
+    r"^(import '[\w.]+' # .+"
+    r"|import [\w.]+ # \w+"
+    r"|# (cleanup\[\d+\] (removing|wiping) \S+|destroy \S+|clear [\w.]+( hooks)?"
+    r"|restore \S+|installing zipimport hook|installed zipimport hook"
+    r"|bytecode is stale for '.+'|wrote '.+'|could not create '.+'"
+    r"|possible namespace for \S+|trying \S+|\S+ has bad (mtime|magic))"
+    r"|Processing (global|user) site-packages"
+    r"|Processing \.pth file: '.+'|Adding directory: '.+'"
+    r"|Python \d+\.\d+\.\d+\S* \(.+"
+    r"|Type \"help\", \"copyright\", \"credits\" or \"license\" .+)$")
+
+
+def parse_verbose_line(line):
+    """Return the file named in a line of python -v output, "" for
+    other python -v output, or None for a line that isn't any.
+    """
+    for pattern in _VERBOSE_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            return match.group(1)
+    if _VERBOSE_OTHER.match(line):
+        return ""
+    return None
+
+
+def _filter_verbose(fd, files):
+    """Read stderr from fd, adding files imports read to files and
+    passing every line that isn't python -v output through.
+    """
+    seen = set()
+    out = getattr(sys.stderr, "buffer", sys.stderr)
+    with os.fdopen(fd, "rb") as inp:
+        for raw in inp:
+            path = parse_verbose_line(
+                raw.decode("utf-8", "replace").rstrip("\n"))
+            if path is None:
+                out.write(raw)
+                out.flush()
+            elif path and path not in seen and os.path.isfile(path):
+                seen.add(path)
+                files.append(path)
+
+
+def record_imports(command, env, cwd, list_path, executables=None,
+                   report=None, limits=None):
+    """Run command, recording the files Python imports into list_path.
+
+    This sets PYTHONVERBOSE for the command and picks the files out of
+    the verbose output on its stderr. The command is run by
+    vex.run.run, as it would be without recording; its arguments have
+    the same meanings. The resulting list can be given to handle_warm
+    later.
+
+    :returns:
+        the command's exit status, or None if it wasn't found.
+    """
+    env = dict(env)
+    env["PYTHONVERBOSE"] = "1"
+    read_fd, write_fd = os.pipe()
+    files = []
+    reader = threading.Thread(target=_filter_verbose, args=(read_fd, files))
+    reader.daemon = True
+    reader.start()
+    try:
+        returncode = run(
+            command, env=env, cwd=cwd, executables=executables,
+            report=report, limits=limits, stderr=write_fd)
+    finally:
+        # The reader finishes once the command's copies are closed too.
+        os.close(write_fd)
+        reader.join()
+    if returncode is not None:
+        try:
+            with open(list_path, "w") as out_list:
+                out_list.writelines(path + "\n" for path in files)
+        except (IOError, OSError) as error:
+            raise exceptions.InvalidArgument(
+                "can't write --warm-record file {0!r}: {1}".format(
+                    list_path, error.strerror))
+    return returncode
@@ -0,0 +1,628 @@
+"""Install requirements into a new virtualenv from a local wheelhouse.
+
+When every requirement is pinned to a pure-Python wheel that is in the
+wheelhouse, and those wheels need nothing that isn't listed or already
+installed, the wheels are unpacked directly, in parallel, which is much
+faster than pip resolving and installing them one at a time.
+Otherwise pip does the install, still without using the network.
+"""
+import os
+import re
+import sys
+import stat
+import time
+import base64
+import hashlib
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from vex import exceptions
+from vex.layout import get_ve_bin, get_ve_python, get_site_packages
+from vex.layout import read_pyvenv_cfg
+from vex.precompile import handle_compile
+from vex.run import get_environ, run
+from vex.store import write_packages_record
+from vex.walk import default_jobs
+
+Requirement = namedtuple("Requirement", "name version hashes")
+
+# name==version, with nothing else but --hash options after it.
+_PINNED_RE = re.compile(
+    r"^([A-Za-z0-9][A-Za-z0-9._-]*)\s*==\s*([A-Za-z0-9._+!-]+)\s*$")
+_HASH_RE = re.compile(r"--hash[=\s]\s*sha256:([0-9a-fA-F]{64})")
+# The name at the start of a Requires-Dist value, and its marker if any.
+_REQUIRES_DIST_RE = re.compile(
+    r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)[^;]*(?:;(.*))?$")
+
+SCRIPT_TEMPLATE = """#!{python}
+# -*- coding: utf-8 -*-
+import re
+import sys
+from {module} import {import_name}
+if __name__ == "__main__":
+    sys.argv[0] = re.sub(r"(-script\\.pyw|\\.exe)?$", "", sys.argv[0])
+    sys.exit({call}())
+"""
+
+_CHUNK_SIZE = 1 << 20
+
+
+def normalize_name(name):
+    """Normalize a distribution name for comparison, as in PEP 503.
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _logical_lines(inp):
+    """Yield lines of a requirements file with continuations joined
+    and comments removed.
+    """
+    pending = ""
+    for line in inp:
+        line = re.sub(r"(^|\s)#.*$", "", line.rstrip("\n"))
+        if line.endswith("\\"):
+            pending += line[:-1] + " "
+            continue
+        line = (pending + line).strip()
+        pending = ""
+        if line:
+            yield line
+    if pending.strip():
+        yield pending.strip()
+
+
+def parse_requirements(path):
+    """Read a requirements file of exactly pinned requirements.
+
+    :returns:
+        a list of Requirement, or None if any line is something else,
+        like a range, an extra, a marker, a URL or an option.
+    """
+    requirements = []
+    with open(path, "r") as inp:
+        for line in _logical_lines(inp):
+            hashes = [digest.lower() for digest in _HASH_RE.findall(line)]
+            spec = _HASH_RE.sub("", line).strip()
+            match = _PINNED_RE.match(spec)
+            if not match:
+                return None
+            requirements.append(
+                Requirement(match.group(1), match.group(2), hashes))
+    return requirements
+
+
+def parse_wheel_filename(filename):
+    """Split a wheel's filename into (name, version, python, abi, platform).
+
+    Returns None if it is not a wheel's filename.
+    """
+    if not filename.endswith(".whl"):
+        return None
+    parts = filename[:-len(".whl")].split("-")
+    if len(parts) not in (5, 6):
+        return None
+    return parts[0], parts[1], parts[-3], parts[-2], parts[-1]
+
+
+def is_compatible(python_tag, abi, platform, version_info):
+    """Tell whether a pure-Python wheel's tags suit the given python.
+
+    Wheels with compiled code are left for pip, which knows
+    which platforms are compatible.
+    """
+    if abi != "none" or platform != "any":
+        return False
+    major, minor = version_info
+    for tag in python_tag.split("."):
+        if tag in ("py{0}".format(major), "cp{0}{1}".format(major, minor)):
+            return True
+        match = re.match(r"^py{0}(\d+)$".format(major), tag)
+        if match and int(match.group(1)) <= minor:
+            return True
+    return False
+
+
+def find_wheels(wheelhouse, requirements, version_info):
+    """Find a compatible wheel for each requirement.
+
+    :returns:
+        a list of wheel paths in order of requirements, or None if
+        any requirement has no compatible wheel.
+    """
+    available = {}
+    for filename in os.listdir(wheelhouse):
+        parsed = parse_wheel_filename(filename)
+        if not parsed:
+            continue
+        name, version, python_tag, abi, platform = parsed
+        if is_compatible(python_tag, abi, platform, version_info):
+            key = (normalize_name(name), version)
+            available.setdefault(key, os.path.join(wheelhouse, filename))
+    wheels = []
+    for requirement in requirements:
+        key = (normalize_name(requirement.name), requirement.version)
+        if key not in available:
+            return None
+        wheels.append(available[key])
+    return wheels
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as inp:
+        for chunk in iter(lambda: inp.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_hashes(wheels, requirements):
+    """Raise if any wheel doesn't match a hash its requirement gives.
+    """
+    for path, requirement in zip(wheels, requirements):
+        if not requirement.hashes:
+            continue
+        if file_hash(path) not in requirement.hashes:
+            raise exceptions.VirtualenvNotMade(
+                "hash of {0!r} does not match requirements".format(path))
+
+
+def _record_hash(data):
+    digest = hashlib.sha256(data).digest()
+    encoded = base64.urlsafe_b64encode(digest).rstrip(b"=")
+    return "sha256=" + encoded.decode("ascii")
+
+
+def _target_path(name, dirs, data_dir):
+    """Work out where a file in a wheel should be installed.
+
+    Returns None for a file in a part of the .data directory that
+    nothing installs to, like headers.
+    """
+    parts = name.split("/")
+    if "" in parts or os.pardir in parts or os.curdir in parts:
+        raise exceptions.VirtualenvNotMade(
+            "unsafe path in wheel: {0!r}".format(name))
+    if parts[0] == data_dir and len(parts) > 2:
+        base = dirs.get(parts[1])
+        if base is None:
+            return None
+        return os.path.join(base, *parts[2:])
+    return os.path.join(dirs["purelib"], *parts)
+
+
+def parse_entry_points(text):
+    """Parse console_scripts and gui_scripts from entry_points.txt.
+
+    :returns:
+        a list of (script name, module, attributes) tuples.
+    """
+    scripts = []
+    section = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(("#", ";")):
+            continue
+        if line.startswith("["):
+            section = line.strip("[]").strip()
+            continue
+        if section not in ("console_scripts", "gui_scripts"):
+            continue
+        name, sep, value = line.partition("=")
+        if not sep:
+            continue
+        value = value.split("[")[0].strip()
+        module, _, attrs = value.partition(":")
+        scripts.append((name.strip(), module.strip(), attrs.strip()))
+    return scripts
+
+
+def make_script(python, module, attrs):
+    """Make the text of a script that calls an entry point.
+    """
+    if attrs:
+        import_name = attrs.split(".")[0]
+        call = attrs
+    else:
+        module, _, import_name = module.rpartition(".")
+        call = import_name
+    return SCRIPT_TEMPLATE.format(
+        python=python, module=module, import_name=import_name, call=call)
+
+
+def _write(path, data, mode=None):
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        try:
+            os.makedirs(parent)
+        except OSError:
+            # Another worker may have made it meanwhile.
+            if not os.path.isdir(parent):
+                raise
+    with open(path, "wb") as out:
+        out.write(data)
+    if mode is not None:
+        os.chmod(path, mode)
+
+
+def _install_dirs(ve_path, site_packages):
+    return {
+        "purelib": site_packages,
+        "platlib": site_packages,
+        "scripts": get_ve_bin(ve_path),
+        "data": ve_path,
+    }
+
+
+def _fix_shebang(data, python):
+    if data.startswith(b"#!python"):
+        return b"#!" + python.encode("utf-8") + data[len(b"#!python"):]
+    return data
+
+
+def _finish_install(ve_path, site_packages, dist_info, entry_points,
+                    written):
+    """Write entry point scripts, INSTALLER and RECORD for a wheel.
+
+    :returns:
+        the paths of what was installed directly in site-packages,
+        other than the .dist-info directory.
+    """
+    python = get_ve_python(ve_path)
+    bin_path = get_ve_bin(ve_path)
+    for script, module, attrs in parse_entry_points(entry_points):
+        data = make_script(python, module, attrs).encode("utf-8")
+        target = os.path.join(bin_path, script)
+        _write(target, data, 0o755)
+        written.append((target, _record_hash(data), len(data)))
+    installer = os.path.join(site_packages, dist_info, "INSTALLER")
+    _write(installer, b"vex\n")
+    written.append((installer, _record_hash(b"vex\n"), 4))
+    record_path = os.path.join(site_packages, dist_info, "RECORD")
+    lines = [
+        "{0},{1},{2}\n".format(
+            os.path.relpath(path, site_packages).replace(os.sep, "/"),
+            digest, size)
+        for path, digest, size in written
+    ]
+    lines.append("{0}/RECORD,,\n".format(dist_info))
+    _write(record_path, "".join(lines).encode("utf-8"))
+    tops = set()
+    for path, _, _ in written:
+        relative = os.path.relpath(path, site_packages)
+        top = relative.split(os.sep)[0]
+        if top != os.pardir and top != dist_info:
+            tops.add(os.path.join(site_packages, top))
+    return sorted(tops)
+
+
+def install_wheel(wheel_path, ve_path, site_packages):
+    """Unpack a pure-Python wheel into a virtualenv, as pip would.
+
+    Writes the files, the scripts for its entry points and a RECORD
+    of everything written, so pip can uninstall it later.
+
+    :returns:
+        the paths of what was installed directly in site-packages,
+        other than the .dist-info directory.
+    """
+    name, version = parse_wheel_filename(os.path.basename(wheel_path))[:2]
+    python = get_ve_python(ve_path)
+    bin_path = get_ve_bin(ve_path)
+    dirs = _install_dirs(ve_path, site_packages)
+    data_dir = "{0}-{1}.data".format(name, version)
+    written = []
+    dist_info = None
+    entry_points = ""
+    with zipfile.ZipFile(wheel_path) as wheel:
+        for info in wheel.infolist():
+            if info.filename.endswith("/"):
+                continue
+            top = info.filename.split("/")[0]
+            if top.endswith(".dist-info"):
+                dist_info = top
+                if info.filename == top + "/RECORD":
+                    continue
+            target = _target_path(info.filename, dirs, data_dir)
+            if target is None:
+                continue
+            data = wheel.read(info)
+            mode = None
+            if target.startswith(bin_path + os.sep):
+                data = _fix_shebang(data, python)
+                mode = 0o755
+            elif (info.external_attr >> 16) & stat.S_IXUSR:
+                mode = 0o755
+            _write(target, data, mode)
+            written.append((target, _record_hash(data), len(data)))
+            if info.filename == top + "/entry_points.txt":
+                entry_points = data.decode("utf-8")
+    if dist_info is None:
+        raise exceptions.VirtualenvNotMade(
+            "no .dist-info in wheel {0!r}".format(wheel_path))
+    return _finish_install(
+        ve_path, site_packages, dist_info, entry_points, written)
+
+
+def package_key(wheel_path):
+    """Name a wheel's entry in the package store.
+    """
+    return os.path.basename(wheel_path)[:-len(".whl")]
+
+
+def unpack_wheel(wheel_path, directory):
+    """Extract a wheel's files, as they are, into directory.
+    """
+    with zipfile.ZipFile(wheel_path) as wheel:
+        for info in wheel.infolist():
+            if info.filename.endswith("/"):
+                continue
+            parts = info.filename.split("/")
+            if "" in parts or os.pardir in parts or os.curdir in parts:
+                raise exceptions.VirtualenvNotMade(
+                    "unsafe path in wheel: {0!r}".format(info.filename))
+            mode = 0o644
+            if (info.external_attr >> 16) & stat.S_IXUSR:
+                mode = 0o755
+            _write(os.path.join(directory, *parts), wheel.read(info), mode)
+
+
+def make_manifest(directory, compiled_for):
+    """List the files of an unpacked wheel with their RECORD hashes.
+
+    compiled_for is a list of the python versions whose bytecode is
+    included, so virtualenvs of those versions needn't compile.
+    """
+    files = []
+    for parent, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(parent, name)
+            relative = os.path.relpath(path, directory).replace(os.sep, "/")
+            parts = relative.split("/")
+            if len(parts) == 2 and parts[0].endswith(".dist-info") and \
+                    parts[1] == "RECORD":
+                continue
+            with open(path, "rb") as inp:
+                data = inp.read()
+            executable = bool(os.stat(path).st_mode & stat.S_IXUSR)
+            files.append(
+                [relative, _record_hash(data), len(data), executable])
+    files.sort()
+    return {"files": files, "compiled": compiled_for}
+
+
+def _link(source, target):
+    parent = os.path.dirname(target)
+    if not os.path.isdir(parent):
+        try:
+            os.makedirs(parent)
+        except OSError:
+            if not os.path.isdir(parent):
+                raise
+    try:
+        os.link(source, target)
+    except OSError:
+        # e.g. on another filesystem, or too many links already.
+        os.symlink(source, target)
+
+
+def link_package(entry_path, key, manifest, ve_path, site_packages):
+    """Install a store entry into a virtualenv by linking to its files.
+
+    Scripts are still written out, since their shebangs name the
+    virtualenv's python.
+
+    :returns:
+        the paths of what was installed directly in site-packages,
+        other than the .dist-info directory.
+    """
+    name, version = parse_wheel_filename(key + ".whl")[:2]
+    python = get_ve_python(ve_path)
+    bin_path = get_ve_bin(ve_path)
+    dirs = _install_dirs(ve_path, site_packages)
+    data_dir = "{0}-{1}.data".format(name, version)
+    written = []
+    dist_info = None
+    entry_points = ""
+    for relative, digest, size, executable in manifest["files"]:
+        top = relative.split("/")[0]
+        source = os.path.join(entry_path, *relative.split("/"))
+        if top.endswith(".dist-info"):
+            dist_info = top
+            if relative == top + "/entry_points.txt":
+                with open(source, "rb") as inp:
+                    entry_points = inp.read().decode("utf-8")
+        target = _target_path(relative, dirs, data_dir)
+        if target is None:
+            continue
+        if target.startswith(bin_path + os.sep):
+            with open(source, "rb") as inp:
+                data = _fix_shebang(inp.read(), python)
+            _write(target, data, 0o755)
+            written.append((target, _record_hash(data), len(data)))
+            continue
+        _link(source, target)
+        written.append((target, digest, size))
+    if dist_info is None:
+        raise exceptions.VirtualenvNotMade(
+            "no .dist-info in store entry {0!r}".format(entry_path))
+    return _finish_install(
+        ve_path, site_packages, dist_info, entry_points, written)
+
+
+def _python_version(ve_path):
+    settings = read_pyvenv_cfg(ve_path) or {}
+    version = settings.get("version") or settings.get("version_info") or ""
+    match = re.match(r"(\d+)\.(\d+)", version)
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def install_linked(environ, ve_path, wheels, site_packages, store,
+                   jobs=None):
+    """Install wheels by linking to their entries in a PackageStore.
+
+    Wheels not in the store yet are unpacked and compiled into it first.
+
+    :returns:
+        paths in site-packages which still need compiling.
+    """
+    keys = [package_key(wheel) for wheel in wheels]
+    # Referenced before use, so they can't be removed meanwhile.
+    for key in keys:
+        store.add_ref(key, ve_path)
+    write_packages_record(ve_path, store, keys)
+    version = "{0}.{1}".format(*_python_version(ve_path))
+    missing = [
+        (key, wheel) for key, wheel in zip(keys, wheels)
+        if not store.has(key)]
+    executor = ThreadPoolExecutor(max_workers=default_jobs(jobs))
+    with executor:
+        if missing:
+            temps = [store.temp_dir(key) for key, _ in missing]
+            list(executor.map(
+                unpack_wheel, [wheel for _, wheel in missing], temps))
+            handle_compile(environ, ve_path, jobs, paths=temps)
+            manifests = executor.map(
+                lambda temp: make_manifest(temp, [version]), temps)
+            for (key, _), temp, manifest in zip(missing, temps, manifests):
+                store.write_manifest(temp, manifest)
+                store.add(key, temp)
+        manifests = [store.manifest(key) for key in keys]
+        installed = executor.map(
+            lambda args: link_package(
+                store.path(args[0]), args[0], args[1], ve_path,
+                site_packages),
+            zip(keys, manifests))
+        paths = []
+        for manifest, tops in zip(manifests, installed):
+            if version not in manifest.get("compiled", ()):
+                paths.extend(tops)
+    return sorted(set(paths))
+
+
+def _installed_names(site_packages):
+    names = set()
+    for filename in os.listdir(site_packages):
+        if filename.endswith(".dist-info"):
+            name = filename[:-len(".dist-info")].rsplit("-", 1)[0]
+            names.add(normalize_name(name))
+    return names
+
+
+def wheel_dependencies(wheel_path):
+    """Read the names of distributions a wheel's METADATA requires.
+
+    Requirements only for extras are left out, since requirements files
+    the fast path accepts never ask for extras. Other markers are not
+    evaluated, so a requirement only some platforms need is included.
+    """
+    with zipfile.ZipFile(wheel_path) as wheel:
+        metadata = [
+            name for name in wheel.namelist()
+            if name.count("/") == 1 and
+            name.split("/")[0].endswith(".dist-info") and
+            name.endswith("/METADATA")]
+        if not metadata:
+            return []
+        text = wheel.read(metadata[0]).decode("utf-8", "replace")
+    names = []
+    for line in text.splitlines():
+        if not line.strip():
+            # Headers end at the first blank line; the body follows.
+            break
+        key, _, value = line.partition(":")
+        if key.strip().lower() != "requires-dist":
+            continue
+        match = _REQUIRES_DIST_RE.match(value)
+        if not match:
+            continue
+        marker = match.group(2) or ""
+        if re.search(r"\bextra\s*==", marker) and " or " not in marker:
+            continue
+        names.append(normalize_name(match.group(1)))
+    return names
+
+
+def plan_fast_install(ve_path, wheelhouse, requirements_path):
+    """Decide whether the fast path can install these requirements.
+
+    :returns:
+        (wheels, site_packages), or None if pip should do it.
+    """
+    if os.name == "nt":
+        return None
+    requirements = parse_requirements(requirements_path)
+    version_info = _python_version(ve_path)
+    site_packages = get_site_packages(ve_path)
+    if not requirements or not version_info or not site_packages:
+        return None
+    wheels = find_wheels(wheelhouse, requirements, version_info)
+    if wheels is None:
+        return None
+    # Replacing what's already installed, like pip itself, needs
+    # uninstalling first, which is pip's job.
+    installed = _installed_names(site_packages[0])
+    if any(normalize_name(req.name) in installed for req in requirements):
+        return None
+    # Dependencies the requirements don't list would be skipped, where
+    # pip would find them in the wheelhouse or say they are missing.
+    listed = set(normalize_name(req.name) for req in requirements)
+    for wheel in wheels:
+        for name in wheel_dependencies(wheel):
+            if name not in listed and name not in installed:
+                return None
+    check_hashes(wheels, requirements)
+    return wheels, site_packages[0]
+
+
+def pip_command(python, wheelhouse, requirements_path):
+    """Make the command for pip to install requirements offline.
+    """
+    return [
+        python, "-m", "pip", "install", "--no-index",
+        "--disable-pip-version-check", "--find-links", wheelhouse,
+        "-r", requirements_path,
+    ]
+
+
+def handle_install(environ, ve_path, wheelhouse, requirements_path,
+                   jobs=None, store=None):
+    """Install requirements from wheelhouse into the virtualenv.
+
+    Never uses the network: either the wheels are unpacked directly and
+    compiled, or pip is told not to look anywhere but the wheelhouse.
+    Given a PackageStore, unpacked wheels are kept there and linked to.
+    """
+    if not os.path.isdir(wheelhouse):
+        raise exceptions.VirtualenvNotMade(
+            "wheelhouse is not a directory: {0!r}".format(wheelhouse))
+    started = time.time()
+    plan = plan_fast_install(ve_path, wheelhouse, requirements_path)
+    if plan is None:
+        env = get_environ(environ, {}, ve_path)
+        command = pip_command(
+            get_ve_python(ve_path), wheelhouse, requirements_path)
+        if run(command, env=env, cwd=None) != 0:
+            raise exceptions.VirtualenvNotMade(
+                "could not install requirements from {0!r}".format(
+                    requirements_path))
+        return 0
+    wheels, site_packages = plan
+    if store is not None:
+        paths = install_linked(
+            environ, ve_path, wheels, site_packages, store, jobs)
+        sys.stderr.write("linked {0} wheels in {1:.2f}s\n".format(
+            len(wheels), time.time() - started))
+    else:
+        with ThreadPoolExecutor(max_workers=default_jobs(jobs)) as executor:
+            installed = executor.map(
+                lambda wheel: install_wheel(wheel, ve_path, site_packages),
+                wheels)
+            paths = sorted(set(path for tops in installed for path in tops))
+        sys.stderr.write("installed {0} wheels in {1:.2f}s\n".format(
+            len(wheels), time.time() - started))
+    # pip would compile what it installed, so do the same.
+    if not paths:
+        return 0
+    return handle_compile(environ, ve_path, jobs, paths=paths)
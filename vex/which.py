@@ -0,0 +1,121 @@
+"""Find executables on PATH, remembering where they were found.
+"""
+import os
+import platform
+
+
+def _is_executable(path):
+    return os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+def _names_to_try(name):
+    """Return filenames that would run name, as a shell would see them.
+    """
+    if platform.system() != "Windows":
+        return [name]
+    extensions = os.environ.get("PATHEXT", ".COM;.EXE;.BAT;.CMD")
+    extensions = [ext for ext in extensions.split(os.pathsep) if ext]
+    if os.path.splitext(name)[1].upper() in (e.upper() for e in extensions):
+        return [name]
+    return [name + ext for ext in extensions]
+
+
+def _search_dirs(path):
+    if path is None:
+        path = os.environ.get("PATH", os.defpath)
+    return [directory for directory in path.split(os.pathsep) if directory]
+
+
+def _search(name, dirs):
+    """Return (path, index of its directory in dirs) or (None, None).
+    """
+    for number, directory in enumerate(dirs):
+        for filename in _names_to_try(name):
+            candidate = os.path.join(directory, filename)
+            if _is_executable(candidate):
+                return os.path.abspath(candidate), number
+    return None, None
+
+
+def find_executable(name, path=None):
+    """Return the absolute path of executable name on path, or None.
+
+    path is a string in the format of PATH, defaulting to os.environ's.
+    Names with a directory part are not searched for, just checked.
+    """
+    if os.path.dirname(name):
+        return name if _is_executable(name) else None
+    return _search(name, _search_dirs(path))[0]
+
+
+# Most directories to remember. Past this, only those looked up since the
+# cache was opened are kept.
+MAX_DIRS = 256
+
+
+class ExecutableCache(object):
+    """Which executables are in each directory on PATH, like a shell's hash.
+
+    Each directory's entry records its mtime and, for each name found
+    there, the file that runs it. Adding or removing an executable
+    changes the directory's mtime, so checking an entry costs one stat.
+    Misses are not remembered: making a file executable leaves the
+    directory's mtime alone. Entries are kept per directory, so every
+    virtualenv's PATH shares those for the system's directories.
+
+    find doesn't write the cache; call save once the command is started.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.used = set()
+
+    def _lookup(self, name, directory):
+        """Return the path that runs name in directory, or None.
+        """
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            return None
+        self.used.add(directory)
+        entry = self.cache.get(directory)
+        if not (isinstance(entry, list) and len(entry) == 2 and
+                entry[0] == mtime):
+            entry = None
+        if entry is not None and name in entry[1]:
+            return os.path.abspath(os.path.join(directory, entry[1][name]))
+        for candidate in _names_to_try(name):
+            if _is_executable(os.path.join(directory, candidate)):
+                names = dict(entry[1]) if entry is not None else {}
+                names[name] = candidate
+                self.cache[directory] = [mtime, names]
+                return os.path.abspath(os.path.join(directory, candidate))
+        return None
+
+    def find(self, name, path=None):
+        """Like find_executable, but consulting and updating the cache.
+        """
+        if os.path.dirname(name):
+            return find_executable(name, path)
+        for directory in _search_dirs(path):
+            found = self._lookup(name, directory)
+            if found:
+                return found
+        return None
+
+    def save(self):
+        """Write new entries back, forgetting directories that are gone.
+        """
+        if not self.cache.dirty:
+            return
+        for directory in list(self.cache.load()):
+            # Directories no longer there, like those of removed
+            # virtualenvs, or a key from an older format.
+            if not os.path.isabs(directory) or \
+                    not os.path.isdir(directory):
+                del self.cache[directory]
+        data = self.cache.load()
+        if len(data) > MAX_DIRS:
+            for directory in sorted(data):
+                if directory not in self.used:
+                    del self.cache[directory]
+        self.cache.save()